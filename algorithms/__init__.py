@@ -5,6 +5,7 @@ ValuHub 算法模块初始化
 from algorithms.valuation_model import ValuationModel, load_training_data, generate_sample_data, train_valuation_model, predict_price
 from algorithms.data_cleaner import DataCleaner, clean_property_data
 from algorithms.market_analyzer import MarketAnalyzer, generate_market_analysis_report
+from algorithms.transaction_ingest import ingest_transactions, load_transactions
 
 __all__ = [
     'ValuationModel',
@@ -15,5 +16,7 @@ __all__ = [
     'DataCleaner',
     'clean_property_data',
     'MarketAnalyzer',
-    'generate_market_analysis_report'
+    'generate_market_analysis_report',
+    'ingest_transactions',
+    'load_transactions'
 ]
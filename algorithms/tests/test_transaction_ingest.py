@@ -0,0 +1,96 @@
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from algorithms.transaction_ingest import (
+    MANIFEST_NAME,
+    ingest_transactions,
+    load_transactions,
+    parse_layout
+)
+
+HEADER = '小区名称,建筑面积(㎡),户型,所在区域,装修情况,成交单价(元/㎡)'
+
+
+def write_csv(path, rows):
+    path.write_text('\n'.join([HEADER] + rows) + '\n', encoding='utf-8-sig')
+
+
+class TestParseLayout:
+
+    def test_arabic_and_chinese_numerals(self):
+        parsed = parse_layout(pd.Series(['3室2厅1卫', '三室两厅', '2室']))
+
+        assert parsed['rooms'].tolist() == [3, 3, 2]
+        assert parsed['halls'].tolist()[:2] == [2, 2]
+        assert pd.isna(parsed['halls'][2])
+        assert parsed['bathrooms'][0] == 1
+        assert parsed['property_type'].tolist() == ['residential'] * 3
+
+    def test_studio_and_villa(self):
+        parsed = parse_layout(pd.Series(['开间（公寓）', '联排别墅', None]))
+
+        assert (parsed['rooms'][0], parsed['halls'][0]) == (1, 0)
+        assert parsed['property_type'].tolist() == ['apartment', 'villa', 'residential']
+        assert pd.isna(parsed['rooms'][2])
+
+
+class TestIngestTransactions:
+
+    def setup_sources(self, tmp_path):
+        data_dir = tmp_path / 'raw'
+        data_dir.mkdir()
+        write_csv(data_dir / '岳塘区.csv', [
+            '建鑫国际,89.2,3室2厅,岳塘-建设路口,简装,6800',
+            '建鑫国际,112.5,4室2厅,岳塘-建设路口,精装,7500',
+            '无效记录,0,2室1厅,岳塘,毛坯,6000'
+        ])
+        write_csv(data_dir / '雨湖区.csv', ['万达广场,95,三室两厅,雨湖-万达,精装,8200'])
+        # 表头不符的CSV不会被导入
+        (data_dir / 'notes.csv').write_text('a,b\n1,2\n', encoding='utf-8')
+        return data_dir, tmp_path / 'dataset'
+
+    def test_writes_hive_partitions(self, tmp_path):
+        data_dir, output_dir = self.setup_sources(tmp_path)
+
+        result = ingest_transactions(str(data_dir), str(output_dir), city='湘潭')
+
+        assert sorted(result['processed']) == ['岳塘区.csv', '雨湖区.csv']
+        assert result['rows'] == 3
+        partition = output_dir / 'district=岳塘区' / 'part-0.parquet'
+        assert partition.exists()
+        # 区县由目录名表达，文件中不重复存储
+        assert 'district' not in pq.read_schema(str(partition)).names
+
+        df = load_transactions(str(output_dir), districts=['岳塘区'])
+        assert len(df) == 2
+        assert set(df['district']) == {'岳塘区'}
+        assert df['price'].tolist() == [606560.0, 843750.0]
+        assert set(df['city']) == {'湘潭'}
+
+    def test_unchanged_files_are_skipped(self, tmp_path):
+        data_dir, output_dir = self.setup_sources(tmp_path)
+        ingest_transactions(str(data_dir), str(output_dir))
+        partition = output_dir / 'district=雨湖区' / 'part-0.parquet'
+        written_at = os.path.getmtime(partition)
+
+        write_csv(data_dir / '岳塘区.csv', ['建鑫国际,100,3室2厅,岳塘-建设路口,简装,7000'])
+        result = ingest_transactions(str(data_dir), str(output_dir))
+
+        assert result['processed'] == ['岳塘区.csv']
+        assert result['skipped'] == ['雨湖区.csv']
+        assert os.path.getmtime(partition) == written_at
+        assert len(load_transactions(str(output_dir), districts=['岳塘区'])) == 1
+        assert (output_dir / MANIFEST_NAME).exists()
+
+    def test_removed_source_drops_partition(self, tmp_path):
+        data_dir, output_dir = self.setup_sources(tmp_path)
+        ingest_transactions(str(data_dir), str(output_dir))
+
+        os.remove(data_dir / '雨湖区.csv')
+        result = ingest_transactions(str(data_dir), str(output_dir))
+
+        assert result['removed'] == ['雨湖区.csv']
+        assert not (output_dir / 'district=雨湖区').exists()
+        assert set(load_transactions(str(output_dir))['district']) == {'岳塘区'}
@@ -0,0 +1,306 @@
+"""
+ValuHub 成交数据导入
+将各区县成交CSV标准化为估价特征格式，按区县分区写入Parquet数据集
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# 原始表头到特征列的映射
+HEADER_MAP = {
+    '小区名称': 'community',
+    '建筑面积(㎡)': 'area',
+    '户型': 'layout',
+    '所在区域': 'sub_district',
+    '装修情况': 'decoration_status',
+    '成交单价(元/㎡)': 'price_per_sqm'
+}
+
+# 输出列及类型，与 ValuationModel / load_training_data 的特征列保持一致
+FEATURE_SCHEMA = {
+    'area': 'float64',
+    'floor_level': 'Int64',
+    'building_year': 'Int64',
+    'rooms': 'Int64',
+    'halls': 'Int64',
+    'bathrooms': 'Int64',
+    'property_type': 'string',
+    'orientation': 'string',
+    'decoration_status': 'string',
+    'city': 'string',
+    'district': 'string',
+    'sub_district': 'string',
+    'community': 'string',
+    'layout': 'string',
+    'price_per_sqm': 'float64',
+    'price': 'float64',
+    'source_file': 'string'
+}
+
+# 中文数字转阿拉伯数字（户型中只出现个位数）
+_CN_NUMERALS = str.maketrans({
+    '一': '1', '二': '2', '两': '2', '三': '3', '四': '4',
+    '五': '5', '六': '6', '七': '7', '八': '8', '九': '9'
+})
+
+MANIFEST_NAME = '_manifest.json'
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    分块计算文件内容哈希
+
+    Args:
+        path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        十六进制SHA-256
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def discover_transaction_files(data_dir: str) -> List[str]:
+    """
+    查找目录下的成交数据CSV
+
+    只读取表头判断，表头包含全部 HEADER_MAP 列的文件才视为成交数据
+
+    Args:
+        data_dir: 数据目录
+
+    Returns:
+        文件路径列表（按文件名排序）
+    """
+    files = []
+    for path in sorted(glob.glob(os.path.join(data_dir, '*.csv'))):
+        try:
+            with open(path, encoding='utf-8-sig') as f:
+                header = f.readline().strip().split(',')
+        except (OSError, UnicodeDecodeError):
+            continue
+        if all(column in header for column in HEADER_MAP):
+            files.append(path)
+    return files
+
+
+def parse_layout(layout: pd.Series) -> pd.DataFrame:
+    """
+    向量化解析户型
+
+    "3室2厅"、"三室两厅"、"开间（公寓）"、"联排别墅" 等写法解析为
+    rooms、halls、bathrooms 以及 property_type
+
+    Args:
+        layout: 户型列
+
+    Returns:
+        包含 rooms、halls、bathrooms、property_type 列的DataFrame
+    """
+    text = layout.fillna('').astype(str).str.translate(_CN_NUMERALS)
+
+    parsed = pd.DataFrame(index=layout.index)
+    parsed['rooms'] = pd.to_numeric(text.str.extract(r'(\d+)室', expand=False), errors='coerce')
+    parsed['halls'] = pd.to_numeric(text.str.extract(r'(\d+)厅', expand=False), errors='coerce')
+    parsed['bathrooms'] = pd.to_numeric(text.str.extract(r'(\d+)卫', expand=False), errors='coerce')
+
+    # 开间按一室零厅处理
+    studio = text.str.contains('开间')
+    parsed.loc[studio, 'rooms'] = parsed.loc[studio, 'rooms'].fillna(1)
+    parsed.loc[studio, 'halls'] = parsed.loc[studio, 'halls'].fillna(0)
+
+    parsed['property_type'] = np.select(
+        [text.str.contains('别墅'), text.str.contains('公寓')],
+        ['villa', 'apartment'],
+        default='residential'
+    )
+    return parsed
+
+
+def normalize_transactions(df: pd.DataFrame, district: str, city: str, source_file: str) -> pd.DataFrame:
+    """
+    将原始成交数据转换为特征格式
+
+    Args:
+        df: 原始DataFrame（中文表头）
+        district: 区县名
+        city: 城市名
+        source_file: 来源文件名
+
+    Returns:
+        按 FEATURE_SCHEMA 排列的DataFrame
+    """
+    df = df.rename(columns=HEADER_MAP)
+    out = pd.DataFrame(index=df.index)
+
+    out['area'] = pd.to_numeric(df['area'], errors='coerce')
+    out['price_per_sqm'] = pd.to_numeric(df['price_per_sqm'], errors='coerce')
+    out['price'] = (out['area'] * out['price_per_sqm']).round(2)
+    out = out.join(parse_layout(df['layout']))
+
+    for column in ('community', 'layout', 'sub_district', 'decoration_status'):
+        out[column] = df[column].astype('string').str.strip()
+    out['city'] = city
+    out['district'] = district
+    out['source_file'] = source_file
+
+    # 原始数据缺少的特征列留空，由训练时的缺失值处理填充
+    for column in FEATURE_SCHEMA:
+        if column not in out.columns:
+            out[column] = pd.NA
+
+    # 面积或单价无效的行没有估价意义
+    out = out[(out['area'] > 0) & (out['price_per_sqm'] > 0)]
+    return out[list(FEATURE_SCHEMA)].astype(FEATURE_SCHEMA).reset_index(drop=True)
+
+
+def _load_manifest(output_dir: str) -> Dict[str, Dict]:
+    """读取已导入文件清单"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_manifest(output_dir: str, manifest: Dict[str, Dict]):
+    """原子写入文件清单"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.part"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _partition_dir(output_dir: str, district: str) -> str:
+    """Hive风格的分区目录"""
+    return os.path.join(output_dir, f"district={district}")
+
+
+def _write_partition(df: pd.DataFrame, output_dir: str, district: str):
+    """
+    整体替换一个区县分区
+
+    先写入临时目录再替换，读取方不会看到写了一半的分区
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    target = _partition_dir(output_dir, district)
+    # 下划线开头的目录会被数据集发现忽略
+    staging = os.path.join(output_dir, f"_staging_{district}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    # 分区列由目录名表达，不重复写入文件
+    table = pa.Table.from_pandas(df.drop(columns=['district']), preserve_index=False)
+    pq.write_table(table, os.path.join(staging, 'part-0.parquet'), compression='zstd')
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+
+
+def ingest_transactions(
+    data_dir: str = '.',
+    output_dir: str = 'data/transactions',
+    city: str = '湘潭',
+    force: bool = False
+) -> Dict[str, Any]:
+    """
+    增量导入成交数据
+
+    以文件内容SHA-256判断是否变化，只重新处理新增或修改过的文件；
+    源文件被删除时同步删除对应分区。
+
+    Args:
+        data_dir: 成交CSV所在目录，文件名（不含扩展名）即区县名
+        output_dir: Parquet数据集目录
+        city: 城市名
+        force: 是否忽略清单全部重新导入
+
+    Returns:
+        导入结果统计
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {} if force else _load_manifest(output_dir)
+
+    files = discover_transaction_files(data_dir)
+    current = {os.path.basename(path): path for path in files}
+    result = {'processed': [], 'skipped': [], 'removed': [], 'rows': 0}
+
+    for name, path in current.items():
+        digest = file_sha256(path)
+        entry = manifest.get(name)
+        if entry and entry['sha256'] == digest:
+            result['skipped'].append(name)
+            continue
+
+        district = os.path.splitext(name)[0]
+        raw = pd.read_csv(path, encoding='utf-8-sig', dtype=str)
+        df = normalize_transactions(raw, district, city, name)
+        _write_partition(df, output_dir, district)
+
+        manifest[name] = {
+            'sha256': digest,
+            'district': district,
+            'rows': len(df),
+            'ingested_at': datetime.now().isoformat()
+        }
+        result['processed'].append(name)
+        result['rows'] += len(df)
+
+    for name in list(manifest):
+        if name not in current:
+            shutil.rmtree(_partition_dir(output_dir, manifest[name]['district']), ignore_errors=True)
+            del manifest[name]
+            result['removed'].append(name)
+
+    _save_manifest(output_dir, manifest)
+    return result
+
+
+def load_transactions(output_dir: str = 'data/transactions', districts: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    读取成交数据集
+
+    Args:
+        output_dir: Parquet数据集目录
+        districts: 只读取指定区县的分区
+
+    Returns:
+        成交数据DataFrame
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(output_dir, format='parquet', partitioning='hive')
+    expression = ds.field('district').isin(districts) if districts else None
+    return dataset.to_table(filter=expression).to_pandas()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ValuHub 成交数据导入')
+    parser.add_argument('--data-dir', default='.', help='成交CSV所在目录')
+    parser.add_argument('--output-dir', default='data/transactions', help='Parquet数据集目录')
+    parser.add_argument('--city', default='湘潭', help='城市名')
+    parser.add_argument('--force', action='store_true', help='忽略清单全部重新导入')
+    args = parser.parse_args()
+
+    summary = ingest_transactions(args.data_dir, args.output_dir, args.city, args.force)
+    print(f"处理: {len(summary['processed'])} 个文件, {summary['rows']} 条记录")
+    print(f"跳过(未变化): {len(summary['skipped'])} 个文件")
+    if summary['removed']:
+        print(f"删除: {', '.join(summary['removed'])}")
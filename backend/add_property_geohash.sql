@@ -0,0 +1,10 @@
+-- 房产geohash列，用于空间检索
+-- 新写入的数据由应用自动维护；存量数据执行以下命令回填：
+--   python -c "from app.database.database import SessionLocal; from app.services.geo import backfill_property_geohash; backfill_property_geohash(SessionLocal())"
+ALTER TABLE properties ADD COLUMN IF NOT EXISTS geohash VARCHAR(12);
+
+-- 需在事务外执行
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_geohash
+    ON properties (geohash);
+
+COMMENT ON COLUMN properties.geohash IS '由经纬度计算的geohash（9位，约5米精度）';
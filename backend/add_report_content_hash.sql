@@ -0,0 +1,9 @@
+-- 报告文件内容哈希，报告文件按 (模板, 估价数据) 的哈希存放，相同的报告复用同一个文件
+-- 存量报告的 file_url 指向 /media/reports，重新生成后改为下载接口
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+-- 需在事务外执行
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_reports_content_hash
+    ON reports (content_hash);
+
+COMMENT ON COLUMN reports.content_hash IS '报告文件的内容哈希（SHA-256），同时作为下载的ETag';
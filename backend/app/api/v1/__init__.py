@@ -2,4 +2,4 @@
 ValuHub API路由�
 """
 
-from app.api.v1 import auth, property, valuation, report, data
+from app.api.v1 import auth, property, valuation, report, data, files
@@ -6,7 +6,6 @@ ValuHub 认证路由
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from typing import Optional
@@ -15,11 +14,12 @@ from app.database.database import get_db
 from app.models.user import User
 from app.core.config import settings
 from app.schemas.auth import UserRegister, UserLogin, UserResponse, Token
+from app.services.auth_cache import attach_user, auth_cache
+from app.services.password_hasher import hash_password, verify_password
 
 router = APIRouter()
 
-# 密码加密
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -51,9 +51,10 @@ def verify_token(token: str) -> dict:
         )
 
 
-async def get_current_user(token: str = Depends(OAuth2PasswordBearer()), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """
     获取当前用户
+    已验证的令牌及用户快照会被缓存，命中时不再解码令牌和查询数据库
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -61,17 +62,23 @@ async def get_current_user(token: str = Depends(OAuth2PasswordBearer()), db: Ses
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = verify_token(token)
-        user_id: int = payload.get("sub")
-        if user_id is None:
+    snapshot = auth_cache.get(token)
+    if snapshot is not None:
+        user = attach_user(db, snapshot)
+    else:
+        try:
+            payload = verify_token(token)
+            user_id: int = payload.get("sub")
+            if user_id is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            raise credentials_exception
+        auth_cache.set(token, user, payload.get("exp"))
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise credentials_exception
     if user.status != "active":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -103,7 +110,7 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
         )
     
     # 创建新用户
-    hashed_password = pwd_context.hash(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -144,7 +151,8 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
         )
     
     # 验证密码
-    if not pwd_context.verify(user_data.password, user.password_hash):
+    valid, new_hash = await verify_password(user_data.password, user.password_hash)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误"
@@ -157,6 +165,10 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
             detail="用户账户已被禁用"
         )
     
+    # 成本参数调整后，旧哈希在登录成功时透明升级
+    if new_hash:
+        user.password_hash = new_hash
+    
     # 更新最后登录时间
     user.last_login_at = datetime.utcnow()
     db.commit()
@@ -172,12 +184,13 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
 
 
 @router.post("/logout", status_code=status.HTTP_200_OK)
-async def logout(current_user: User = Depends(get_current_user)):
+async def logout(token: str = Depends(oauth2_scheme), current_user: User = Depends(get_current_user)):
     """
     用户登出
     """
     # 在实际应用中，令牌会在客户端删除
     # 这里可以记录登出日志
+    auth_cache.invalidate_token(token)
     return {
         "message": "登出成功",
         "user_id": current_user.id
@@ -3,15 +3,30 @@ ValuHub 数据分析路由
 市场数据、区域统计、趋势分析
 """
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 from typing import Optional
+import os
 
-from app.database.database import get_db
+from app.database.database import get_async_db, get_db
+from app.core.config import settings
 from app.models.property import Property
 from app.models.valuation import Valuation
 from app.schemas.data import AreaStatisticsResponse, DataExportRequest, DataExportResponse
+from app.services.storage import storage
+from app.services.export import (
+    EXPORT_FORMATS,
+    EXPORT_MODELS,
+    build_export_filename,
+    check_export_format,
+    export_to_file,
+    parse_export_date,
+    stream_export
+)
 
 router = APIRouter()
 
@@ -21,65 +36,52 @@ async def get_area_statistics(
     city: str = Query(..., description="城市"),
     district: Optional[str] = Query(None, description="区域"),
     property_type: Optional[str] = Query(None, description="房产类型"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     区域统计
     """
-    query = db.query(Property)
-    
     # 应用过滤条件
-    if city:
-        query = query.filter(Property.city == city)
+    conditions = [Property.city == city]
     if district:
-        query = query.filter(Property.district == district)
+        conditions.append(Property.district == district)
     if property_type:
-        query = query.filter(Property.property_type == property_type)
+        conditions.append(Property.property_type == property_type)
     
-    # 计算统计数据
-    total_properties = query.count()
-    total_valuations = db.query(Valuation).join(Property).filter(
-        Property.city == city
-    ).count()
+    # 房产类型分布，总数由分布汇总得到
+    type_rows = await db.execute(
+        select(Property.property_type, func.count(Property.id))
+        .where(*conditions)
+        .group_by(Property.property_type)
+    )
+    property_type_distribution = {ptype: count for ptype, count in type_rows.all()}
+    total_properties = sum(property_type_distribution.values())
     
-    # 计算平均价格
-    avg_price_result = db.query(func.avg(Valuation.estimated_price)).join(Property).filter(
-        Property.city == city
-    ).first()
-    avg_price = float(avg_price_result[0]) if avg_price_result and avg_price_result[0] else 0
+    # 估价数量、均价和价格范围一次聚合得到
+    valuation_row = (await db.execute(
+        select(
+            func.count(Valuation.id),
+            func.avg(Valuation.estimated_price),
+            func.min(Valuation.estimated_price),
+            func.max(Valuation.estimated_price)
+        ).join(Property).where(Property.city == city)
+    )).one()
+    total_valuations = valuation_row[0]
+    avg_price = float(valuation_row[1]) if valuation_row[1] else 0
+    min_price = float(valuation_row[2]) if valuation_row[2] else 0
+    max_price = float(valuation_row[3]) if valuation_row[3] else 0
     
     # 计算每平米价格
-    avg_area_result = db.query(func.avg(Property.area)).filter(Property.city == city).first()
-    avg_area = float(avg_area_result[0]) if avg_area_result and avg_area_result[0] else 0
+    avg_area = await db.scalar(select(func.avg(Property.area)).where(Property.city == city))
+    avg_area = float(avg_area) if avg_area else 0
     avg_price_per_sqm = avg_price / avg_area if avg_area > 0 else 0
     
-    # 价格范围
-    price_result = db.query(Valuation.estimated_price).join(Property).filter(
-        Property.city == city
-    ).all()
-    prices = [v.estimated_price for v in price_result if v.estimated_price]
-    
-    if prices:
-        min_price = min(prices)
-        max_price = max(prices)
-    else:
-        min_price = 0
-        max_price = 0
-    
     price_range = {
-        "min": float(min_price),
-        "max": float(max_price),
+        "min": min_price,
+        "max": max_price,
         "range": f"{min_price:.0f} - {max_price:.0f}"
     }
     
-    # 房产类型分布
-    property_type_distribution = {}
-    for prop in query.all():
-        ptype = prop.property_type
-        if ptype not in property_type_distribution:
-            property_type_distribution[ptype] = 0
-        property_type_distribution[ptype] += 1
-    
     return AreaStatisticsResponse(
         city=city,
         district=district,
@@ -100,17 +102,73 @@ async def export_data(
 ):
     """
     数据导出
+    
+    通过服务端游标逐批读取数据，边读边编码（可选gzip压缩），内存占用与数据量无关。
+    stream=true 时直接以流式响应返回文件内容，否则写入导出目录并返回下载地址。
     """
-    # TODO: 实现真实的数据导出功能
-    # 这里先返回模拟数据
+    if export_params.data_type not in EXPORT_MODELS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的数据类型，支持: {list(EXPORT_MODELS.keys())}"
+        )
+    if export_params.format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的导出格式，支持: {list(EXPORT_FORMATS.keys())}"
+        )
+    
+    try:
+        parse_export_date(export_params.start_date)
+        parse_export_date(export_params.end_date)
+        check_export_format(export_params.format)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    compress = export_params.compress and export_params.format != "parquet"
     
-    file_url = f"/media/exports/export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_params.format}"
-    file_name = f"valuhub_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_params.format}"
-    file_size = 204800  # 模拟文件大小 200KB
+    if export_params.stream:
+        file_name = build_export_filename(export_params.data_type, export_params.format, compress)
+        media_type = "application/gzip" if compress else EXPORT_FORMATS[export_params.format][1]
+        return StreamingResponse(
+            stream_export(
+                db,
+                export_params.data_type,
+                export_params.format,
+                export_params.start_date,
+                export_params.end_date,
+                compress
+            ),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+        )
+    
+    # 写文件为阻塞IO，放到线程池中执行，避免阻塞事件循环
+    try:
+        file_name, stats = await run_in_threadpool(
+            export_to_file,
+            db,
+            export_params.data_type,
+            export_params.format,
+            export_params.start_date,
+            export_params.end_date,
+            compress
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    # 导出目录只是临时目录，写完后移入存储后端，返回带过期时间的下载地址
+    stored = await run_in_threadpool(
+        storage.save_file, f"exports/{file_name}", os.path.join(settings.EXPORT_STORAGE_DIR, file_name), True
+    )
+    file_url = storage.url(stored.key, filename=file_name)
+    file_size = stored.size
     
     return DataExportResponse(
         file_url=file_url,
         file_name=file_name,
         file_size=file_size,
-        download_url=file_url
+        download_url=file_url,
+        row_count=stats.row_count,
+        elapsed_ms=stats.to_dict()["elapsed_ms"],
+        rows_per_second=stats.rows_per_second
     )
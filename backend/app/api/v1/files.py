@@ -0,0 +1,53 @@
+"""
+ValuHub 文件下载路由
+本地存储后端的签名URL下载（OSS后端的下载地址直接指向OSS）
+"""
+
+import os
+import time
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.file_response import conditional_file_response
+from app.services.storage import LocalStorage, storage
+
+router = APIRouter()
+
+
+@router.get("/{key:path}")
+async def download_file(
+    key: str,
+    request: Request,
+    expires: int = Query(..., description="过期时间（Unix时间戳），0表示不过期"),
+    signature: str = Query(..., description="签名"),
+    name: Optional[str] = Query(None, description="下载文件名"),
+):
+    """
+    下载文件
+
+    链接由存储后端签发，过期或签名（含下载文件名）不符时返回403；支持Range和条件请求，ETag为文件的SHA-256
+    """
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="文件不存在")
+    if not storage.verify(key, expires, signature, name):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="下载链接无效或已过期")
+
+    stored = await run_in_threadpool(storage.stat, key)
+    if stored is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="文件不存在")
+
+    # 浏览器缓存不超过链接的剩余有效期，不过期的上传文件地址与 /media 相同
+    if expires:
+        cache_control = f"private, max-age={max(0, expires - int(time.time()))}"
+    else:
+        cache_control = settings.MEDIA_CACHE_CONTROL
+    return conditional_file_response(
+        request,
+        storage.path_for(key),
+        filename=name or os.path.basename(key),
+        etag=stored.checksum,
+        cache_control=cache_control
+    )
@@ -1,12 +1,17 @@
+from typing import List
+
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.services.oss import oss_service
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.storage import storage
 
 router = APIRouter()
 
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     """
-    上传文件到OSS
+    上传文件（存储后端为OSS或本地磁盘）
     
     Args:
         file: 要上传的文件
@@ -15,8 +20,8 @@ async def upload_file(file: UploadFile = File(...)):
         dict: 包含上传结果、文件URL等信息
     """
     try:
-        # 使用OSS服务上传文件
-        result = oss_service.upload_file(file.file, file.filename)
+        # 边读边上传，大文件分片并行上传；上传是阻塞调用，放到线程池中执行
+        result = await run_in_threadpool(storage.upload_file, file.file, file.filename)
         
         if result["success"]:
             return result
@@ -25,10 +30,30 @@ async def upload_file(file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.delete("/delete/{filename}")
+@router.post("/upload/batch")
+async def upload_files(files: List[UploadFile] = File(...)):
+    """
+    批量上传文件
+    
+    Args:
+        files: 要上传的文件列表
+        
+    Returns:
+        dict: 与上传顺序一致的每个文件的上传结果，部分失败时 success 为False
+    """
+    if len(files) > settings.OSS_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"单次最多上传{settings.OSS_BATCH_MAX_FILES}个文件")
+    
+    results = await run_in_threadpool(storage.upload_files, [(f.file, f.filename) for f in files])
+    return {
+        "success": all(result["success"] for result in results),
+        "results": results
+    }
+
+@router.delete("/delete/{filename:path}")
 async def delete_file(filename: str):
     """
-    从OSS删除文件
+    删除文件
     
     Args:
         filename: 要删除的文件名
@@ -37,7 +62,7 @@ async def delete_file(filename: str):
         dict: 包含删除结果
     """
     try:
-        success = oss_service.delete_file(filename)
+        success = storage.delete(filename)
         if success:
             return {"success": True, "message": "文件删除成功"}
         else:
@@ -3,32 +3,37 @@ from typing import List
 import json
 import os
 import time
+import uuid
 from datetime import datetime
 from app.core.config import settings
 from app.schemas.payment import OrderCreateRequest, OrderResponse, PaymentCallbackRequest
 from app.api.v1.auth import get_current_user
+from app.services.order_store import ORDER_FAILED, ORDER_PAID, OrderConflict, OrderStore
 
 # 创建路由实例
 router = APIRouter()
 
-# 确保数据目录存在
-os.makedirs(settings.DATA_DIR, exist_ok=True)
+# 订单存储：追加写入的事件日志，首次启动时导入旧的 orders.json
+order_store = OrderStore(
+    os.path.join(settings.DATA_DIR, "orders.jsonl"),
+    legacy_path=os.path.join(settings.DATA_DIR, "orders.json")
+)
 
-# 初始化订单数据文件
-orders_file = os.path.join(settings.DATA_DIR, "orders.json")
-if not os.path.exists(orders_file):
-    with open(orders_file, "w") as f:
-        json.dump([], f, ensure_ascii=False, indent=2)
-
-# 获取所有订单
-def get_orders():
-    with open(orders_file, "r") as f:
-        return json.load(f)
-
-# 保存订单
-def save_orders(orders):
-    with open(orders_file, "w") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=2)
+# 更新报告为已付费（只在订单首次变为已支付时执行）
+def mark_report_paid(report_id):
+    reports_file = os.path.join(settings.DATA_DIR, "reports.json")
+    if not os.path.exists(reports_file):
+        return
+    with open(reports_file, "r") as f:
+        reports = json.load(f)
+    
+    for report in reports:
+        if report["id"] == report_id:
+            report["is_paid"] = True
+            break
+    
+    with open(reports_file, "w") as f:
+        json.dump(reports, f, ensure_ascii=False, indent=2)
 
 # 创建报告支付订单（固定金额9.9元）
 @router.post("/create-report-order", response_model=OrderResponse)
@@ -40,27 +45,15 @@ def create_report_order(
         # 固定报告费用为9.9元
         report_amount = 9.9
         
-        # 生成订单ID
-        order_id = f"order_{int(time.time())}_{len(get_orders()) + 1}"
-        
-        # 创建订单数据
-        order = {
-            "order_id": order_id,
-            "user_phone": current_user["phone"],
-            "project_id": request_data.project_id,
-            "report_id": request_data.report_id,
-            "amount": report_amount,
-            "status": "pending",
-            "pay_type": request_data.pay_type,
-            "created_at": datetime.now().isoformat(),
-            "pay_time": None,
-            "transaction_id": None
-        }
-        
-        # 保存订单
-        orders = get_orders()
-        orders.append(order)
-        save_orders(orders)
+        # 创建订单（订单号由存储生成，并发创建不会重复）
+        order = order_store.create(
+            user_phone=current_user["phone"],
+            project_id=request_data.project_id,
+            report_id=request_data.report_id,
+            amount=report_amount,
+            pay_type=request_data.pay_type
+        )
+        order_id = order["order_id"]
         
         # 生成微信沙箱支付参数
         import random
@@ -102,27 +95,15 @@ def create_order(
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        # 生成订单ID
-        order_id = f"order_{int(time.time())}_{len(get_orders()) + 1}"
-        
-        # 创建订单数据
-        order = {
-            "order_id": order_id,
-            "user_phone": current_user["phone"],
-            "project_id": request_data.project_id,
-            "report_id": request_data.report_id,
-            "amount": request_data.amount,
-            "status": "pending",
-            "pay_type": request_data.pay_type,
-            "created_at": datetime.now().isoformat(),
-            "pay_time": None,
-            "transaction_id": None
-        }
-        
-        # 保存订单
-        orders = get_orders()
-        orders.append(order)
-        save_orders(orders)
+        # 创建订单（订单号由存储生成，并发创建不会重复）
+        order = order_store.create(
+            user_phone=current_user["phone"],
+            project_id=request_data.project_id,
+            report_id=request_data.report_id,
+            amount=request_data.amount,
+            pay_type=request_data.pay_type
+        )
+        order_id = order["order_id"]
         
         # 模拟生成微信支付参数（实际项目中应该调用微信支付API）
         wx_pay_params = {
@@ -157,23 +138,20 @@ def get_order(
     order_id: str,
     current_user: dict = Depends(get_current_user)
 ):
-    orders = get_orders()
-    
-    # 查找订单
-    for order in orders:
-        if order["order_id"] == order_id:
-            # 验证订单归属
-            if order["user_phone"] != current_user["phone"]:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="无权访问该订单"
-                )
-            return OrderResponse(**order)
+    order = order_store.get(order_id)
+    if order is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="订单不存在"
+        )
     
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail="订单不存在"
-    )
+    # 验证订单归属
+    if order["user_phone"] != current_user["phone"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权访问该订单"
+        )
+    return OrderResponse(**order)
 
 # 获取用户订单列表
 @router.get("/orders", response_model=List[OrderResponse])
@@ -182,19 +160,8 @@ def get_user_orders(
     offset: int = 0,
     current_user: dict = Depends(get_current_user)
 ):
-    orders = get_orders()
-    
-    # 筛选当前用户的订单
-    user_orders = [
-        order for order in orders 
-        if order["user_phone"] == current_user["phone"]
-    ]
-    
-    # 按创建时间倒序排序
-    user_orders.sort(key=lambda x: x["created_at"], reverse=True)
-    
-    # 分页
-    paginated_orders = user_orders[offset:offset + limit]
+    # 按手机号索引查询，按创建时间倒序分页
+    paginated_orders = order_store.list_by_user(current_user["phone"], limit=limit, offset=offset)
     
     return [OrderResponse(**order) for order in paginated_orders]
 
@@ -202,36 +169,26 @@ def get_user_orders(
 @router.post("/callback")
 def payment_callback(request_data: PaymentCallbackRequest):
     try:
-        orders = get_orders()
+        # 支付平台可能重复通知，相同的回调只处理一次
+        order, changed = order_store.transition(
+            request_data.order_id,
+            ORDER_PAID if request_data.status == "success" else ORDER_FAILED,
+            transaction_id=request_data.transaction_id,
+            pay_time=request_data.pay_time
+        )
         
-        # 查找订单
-        for order in orders:
-            if order["order_id"] == request_data.order_id:
-                # 更新订单状态
-                order["status"] = "paid" if request_data.status == "success" else "failed"
-                order["transaction_id"] = request_data.transaction_id
-                order["pay_time"] = request_data.pay_time
-                
-                # 如果支付成功，更新报告状态为已付费
-                if request_data.status == "success":
-                    reports_file = os.path.join(settings.DATA_DIR, "reports.json")
-                    if os.path.exists(reports_file):
-                        with open(reports_file, "r") as f:
-                            reports = json.load(f)
-                        
-                        for report in reports:
-                            if report["id"] == order["report_id"]:
-                                report["is_paid"] = True
-                                break
-                        
-                        with open(reports_file, "w") as f:
-                            json.dump(reports, f, ensure_ascii=False, indent=2)
-                
-                save_orders(orders)
-                return {"status": "success", "message": "订单已更新"}
+        # 如果支付成功，更新报告状态为已付费
+        if changed and order["status"] == ORDER_PAID:
+            mark_report_paid(order["report_id"])
         
-        return {"status": "error", "message": "订单不存在"}
+        if not changed:
+            return {"status": "success", "message": "订单已处理"}
+        return {"status": "success", "message": "订单已更新"}
         
+    except KeyError:
+        return {"status": "error", "message": "订单不存在"}
+    except OrderConflict as e:
+        return {"status": "error", "message": str(e)}
     except Exception as e:
         return {"status": "error", "message": f"处理回调失败: {str(e)}"}
 
@@ -241,46 +198,41 @@ def mock_pay(
     order_id: str,
     current_user: dict = Depends(get_current_user)
 ):
-    try:
-        orders = get_orders()
-        
-        # 查找订单
-        for order in orders:
-            if order["order_id"] == order_id:
-                # 验证订单归属
-                if order["user_phone"] != current_user["phone"]:
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="无权访问该订单"
-                    )
-                
-                # 更新订单状态为已支付
-                order["status"] = "paid"
-                order["pay_time"] = datetime.now().isoformat()
-                order["transaction_id"] = f"trans_{int(time.time())}"
-                
-                # 更新报告状态为已付费
-                reports_file = os.path.join(settings.DATA_DIR, "reports.json")
-                if os.path.exists(reports_file):
-                    with open(reports_file, "r") as f:
-                        reports = json.load(f)
-                    
-                    for report in reports:
-                        if report["id"] == order["report_id"]:
-                            report["is_paid"] = True
-                            break
-                    
-                    with open(reports_file, "w") as f:
-                        json.dump(reports, f, ensure_ascii=False, indent=2)
-                
-                save_orders(orders)
-                return {"status": "success", "message": "支付成功"}
-        
+    order = order_store.get(order_id)
+    if order is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="订单不存在"
         )
+    
+    # 验证订单归属
+    if order["user_phone"] != current_user["phone"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权访问该订单"
+        )
+    
+    try:
+        # 更新订单状态为已支付（已支付的订单沿用原交易号，重复调用不产生新的变更）
+        paid = order["status"] == ORDER_PAID
+        order, changed = order_store.transition(
+            order_id,
+            ORDER_PAID,
+            transaction_id=order["transaction_id"] if paid else f"trans_{uuid.uuid4().hex[:16]}",
+            pay_time=order["pay_time"] if paid else datetime.now().isoformat()
+        )
+        
+        # 更新报告状态为已付费
+        if changed:
+            mark_report_paid(order["report_id"])
         
+        return {"status": "success", "message": "支付成功"}
+    
+    except OrderConflict as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -3,19 +3,34 @@ ValuHub 房产路由
 房产CRUD、搜索、筛选
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, UploadFile, File
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
 
-from app.database.database import get_db
+from app.database.database import get_async_db, get_db
+from app.core.pagination import NEXT_CURSOR_HEADER, keyset_paginate_async
 from app.models.property import Property
 from app.schemas.property import (
     PropertyCreate,
     PropertyUpdate,
     PropertyResponse,
     PropertySearch,
+    PropertyGeoResponse,
     PropertyBatchImport
 )
+from app.services.geo import property_geo_index
+from app.services.property_import import (
+    ImportStats,
+    PropertyImportError,
+    bulk_insert_properties,
+    import_property_records,
+    iter_file_records,
+    property_row
+)
 
 router = APIRouter()
 
@@ -50,6 +65,7 @@ async def create_property(
     db.add(new_property)
     db.commit()
     db.refresh(new_property)
+    property_geo_index.sync_property(new_property)
     
     return PropertyResponse(
         id=new_property.id,
@@ -75,33 +91,40 @@ async def create_property(
 
 @router.get("", response_model=List[PropertyResponse])
 async def get_properties(
+    response: Response,
     skip: int = Query(0, ge=0, description="跳过数量"),
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
+    cursor: Optional[str] = Query(None, description="分页游标（取自上一页响应头X-Next-Cursor，传入时忽略skip）"),
     user_id: Optional[int] = Query(None, description="用户ID过滤"),
     city: Optional[str] = Query(None, description="城市过滤"),
     district: Optional[str] = Query(None, description="区域过滤"),
     property_type: Optional[str] = Query(None, description="房产类型过滤"),
     status: Optional[str] = Query(None, description="状态过滤"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取房产列表
     """
-    query = db.query(Property)
+    query = select(Property)
     
     # 应用过滤条件
     if user_id:
-        query = query.filter(Property.user_id == user_id)
+        query = query.where(Property.user_id == user_id)
     if city:
-        query = query.filter(Property.city == city)
+        query = query.where(Property.city == city)
     if district:
-        query = query.filter(Property.district == district)
+        query = query.where(Property.district == district)
     if property_type:
-        query = query.filter(Property.property_type == property_type)
+        query = query.where(Property.property_type == property_type)
     if status:
-        query = query.filter(Property.status == status)
+        query = query.where(Property.status == status)
     
-    properties = query.offset(skip).limit(limit).all()
+    try:
+        properties, next_cursor = await keyset_paginate_async(db, query, Property, limit, cursor=cursor, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     return [PropertyResponse(
         id=p.id,
@@ -125,12 +148,108 @@ async def get_properties(
     ) for p in properties]
 
 
+def _geo_results(db: Session, hits: List[tuple]) -> List[PropertyGeoResponse]:
+    """
+    按索引命中顺序加载房产并组装响应
+
+    Args:
+        db: 数据库会话
+        hits: (房产ID, 距离米或None) 列表
+    """
+    if not hits:
+        return []
+    properties = {
+        p.id: p for p in db.query(Property).filter(Property.id.in_([h[0] for h in hits])).all()
+    }
+    results = []
+    for property_id, distance in hits:
+        p = properties.get(property_id)
+        if p is None:
+            continue
+        results.append(PropertyGeoResponse(
+            id=p.id,
+            user_id=p.user_id,
+            address=p.address,
+            city=p.city,
+            district=p.district,
+            area=float(p.area),
+            floor_level=p.floor_level,
+            building_year=p.building_year,
+            property_type=p.property_type,
+            rooms=p.rooms,
+            bathrooms=p.bathrooms,
+            orientation=p.orientation,
+            decoration_status=p.decoration_status,
+            latitude=float(p.latitude) if p.latitude else None,
+            longitude=float(p.longitude) if p.longitude else None,
+            status=p.status,
+            created_at=p.created_at.isoformat(),
+            updated_at=p.updated_at.isoformat(),
+            distance_m=round(distance, 1) if distance is not None else None
+        ))
+    return results
+
+
+@router.get("/nearby", response_model=List[PropertyGeoResponse])
+async def search_properties_nearby(
+    latitude: float = Query(..., ge=-90, le=90, description="中心纬度"),
+    longitude: float = Query(..., ge=-180, le=180, description="中心经度"),
+    radius_m: float = Query(1000, gt=0, le=50000, description="半径（米）"),
+    limit: int = Query(50, ge=1, le=500, description="返回数量"),
+    db: Session = Depends(get_db)
+):
+    """
+    半径范围检索在售房产，按距离升序返回
+    """
+    property_geo_index.ensure_loaded(db)
+    hits = property_geo_index.within_radius(latitude, longitude, radius_m, limit=limit)
+    return _geo_results(db, hits)
+
+
+@router.get("/within-bbox", response_model=List[PropertyGeoResponse])
+async def search_properties_in_bbox(
+    min_lat: float = Query(..., ge=-90, le=90, description="最小纬度"),
+    min_lon: float = Query(..., ge=-180, le=180, description="最小经度"),
+    max_lat: float = Query(..., ge=-90, le=90, description="最大纬度"),
+    max_lon: float = Query(..., ge=-180, le=180, description="最大经度"),
+    limit: int = Query(100, ge=1, le=1000, description="返回数量"),
+    db: Session = Depends(get_db)
+):
+    """
+    矩形范围检索在售房产
+    """
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="矩形范围无效：最小值不能大于最大值"
+        )
+    property_geo_index.ensure_loaded(db)
+    ids = property_geo_index.within_bbox(min_lat, min_lon, max_lat, max_lon, limit=limit)
+    return _geo_results(db, [(property_id, None) for property_id in ids])
+
+
+@router.get("/nearest", response_model=List[PropertyGeoResponse])
+async def search_properties_nearest(
+    latitude: float = Query(..., ge=-90, le=90, description="中心纬度"),
+    longitude: float = Query(..., ge=-180, le=180, description="中心经度"),
+    k: int = Query(10, ge=1, le=100, description="返回最近的房产数量"),
+    max_radius_m: Optional[float] = Query(None, gt=0, description="最大搜索半径（米）"),
+    db: Session = Depends(get_db)
+):
+    """
+    k近邻检索在售房产，按距离升序返回
+    """
+    property_geo_index.ensure_loaded(db)
+    hits = property_geo_index.nearest(latitude, longitude, k, max_radius_m=max_radius_m)
+    return _geo_results(db, hits)
+
+
 @router.get("/{property_id}", response_model=PropertyResponse)
-async def get_property(property_id: int, db: Session = Depends(get_db)):
+async def get_property(property_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     获取房产详情
     """
-    property = db.query(Property).filter(Property.id == property_id).first()
+    property = await db.get(Property, property_id)
     if not property:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -192,6 +311,7 @@ async def update_property(
     property.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(property)
+    property_geo_index.sync_property(property)
     
     return PropertyResponse(
         id=property.id,
@@ -240,6 +360,7 @@ async def delete_property(
     
     db.delete(property)
     db.commit()
+    property_geo_index.remove(property_id)
     
     return None
 
@@ -301,36 +422,72 @@ async def search_properties(search_params: PropertySearch, db: Session = Depends
 async def batch_import_properties(
     batch_data: PropertyBatchImport,
     current_user_id: int = Query(..., description="当前用户ID"),
+    tenant_id: Optional[int] = Query(None, description="租户ID，默认与当前用户ID相同"),
     db: Session = Depends(get_db)
 ):
     """
     批量导入房产
+    
+    请求体整体校验通过后分块执行多行INSERT，通过RETURNING取回新ID。
     """
-    created_properties = []
-    for prop_data in batch_data.properties:
-        new_property = Property(
-            user_id=current_user_id,
-            address=prop_data.address,
-            city=prop_data.city,
-            district=prop_data.district,
-            area=prop_data.area,
-            floor_level=prop_data.floor_level,
-            building_year=prop_data.building_year,
-            property_type=prop_data.property_type,
-            rooms=prop_data.rooms,
-            bathrooms=prop_data.bathrooms,
-            orientation=prop_data.orientation,
-            decoration_status=prop_data.decoration_status,
-            status="active"
-        )
-        db.add(new_property)
-        db.flush()
-        created_properties.append(new_property)
+    stats = ImportStats()
+    now = datetime.utcnow()
+    tenant_id = tenant_id or current_user_id
+    rows = (property_row(prop_data, current_user_id, tenant_id, now) for prop_data in batch_data.properties)
     
-    db.commit()
+    try:
+        property_ids = await run_in_threadpool(bulk_insert_properties, db, rows, None, stats)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    stats.finish()
+    property_geo_index.invalidate()
+    
+    return {
+        "message": f"成功导入{stats.row_count}个房产",
+        **stats.to_dict(),
+        "properties": property_ids
+    }
+
+
+@router.post("/batch/upload", status_code=status.HTTP_201_CREATED)
+async def batch_import_properties_file(
+    file: UploadFile = File(..., description="CSV或XLSX文件，表头为房产字段名"),
+    current_user_id: int = Query(..., description="当前用户ID"),
+    tenant_id: Optional[int] = Query(None, description="租户ID，默认与当前用户ID相同"),
+    db: Session = Depends(get_db)
+):
+    """
+    通过文件批量导入房产
+    
+    逐行读取并校验文件内容，分块写入数据库，不在内存中构建完整列表。
+    任一行校验失败时整个导入回滚，并返回出错的行号。
+    """
+    try:
+        records = iter_file_records(file.file, file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    try:
+        property_ids, stats = await run_in_threadpool(
+            import_property_records, db, records, current_user_id, tenant_id or current_user_id
+        )
+    except PropertyImportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                "message": str(e),
+                "error_count": e.total_errors,
+                "errors": e.errors
+            }
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    property_geo_index.invalidate()
     
     return {
-        "message": f"成功导入{len(created_properties)}个房产",
-        "count": len(created_properties),
-        "properties": [p.id for p in created_properties]
+        "message": f"成功导入{stats.row_count}个房产",
+        **stats.to_dict(),
+        "properties": property_ids
     }
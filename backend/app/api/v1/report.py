@@ -1,23 +1,40 @@
 """
 ValuHub 报告路由
-报告生成、PDF导出、模板管理
+报告生成、PDF导出与下载、模板管理
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import logging
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from jinja2 import TemplateSyntaxError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
-from app.database.database import get_db
+from app.core.config import settings
+from app.core.file_response import conditional_file_response
+from app.database.database import get_async_db, get_db
+from app.core.pagination import NEXT_CURSOR_HEADER, keyset_paginate
 from app.models.report import Report, ReportTemplate
 from app.models.valuation import Valuation
 from app.models.user import User
 from app.schemas.report import (
+    ReportBatchRequest,
     ReportGenerateRequest,
     ReportResponse,
     ReportTemplateCreate,
     ReportTemplateResponse
 )
+from app.services.report import REPORT_COMPLETED, REPORT_FAILED, REPORT_PENDING, enqueue_report, report_status_events
+from app.services.report_batch import build_batch_jobs, get_batch_executor, load_valuations, render_documents, stream_zip
+from app.services.report_store import report_store
+from app.services.report_templates import report_environment
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -30,6 +47,9 @@ async def generate_report(
 ):
     """
     生成报告
+    
+    只创建报告并加入渲染队列，立即返回pending状态；
+    通过 GET /reports/{id} 轮询或 GET /reports/{id}/events 订阅状态变化
     """
     # 验证估价是否存在
     valuation = db.query(Valuation).filter(Valuation.id == report_data.valuation_id).first()
@@ -46,28 +66,29 @@ async def generate_report(
             detail="无权限生成此报告"
         )
     
-    # TODO: 调用PDF生成服务
-    # 这里先返回模拟数据
-    file_url = f"/media/reports/report_{valuation.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    file_name = f"估价报告_{valuation.id}.pdf"
-    file_size = 102400  # 模拟文件大小 100KB
-    
-    # 创建报告记录
+    # 创建报告记录，PDF由reports队列的worker异步渲染
     new_report = Report(
         valuation_id=report_data.valuation_id,
         user_id=report_data.user_id,
         template_id=report_data.template_id,
-        file_url=file_url,
-        file_name=file_name,
-        file_size=file_size,
-        status="completed",
-        completed_at=datetime.utcnow()
+        status=REPORT_PENDING
     )
     
     db.add(new_report)
     db.commit()
     db.refresh(new_report)
     
+    try:
+        enqueue_report(new_report.id)
+    except Exception as e:
+        logger.error("报告%s加入渲染队列失败: %s", new_report.id, e)
+        new_report.status = REPORT_FAILED
+        db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="报告生成服务暂不可用，请稍后重试"
+        )
+    
     return ReportResponse(
         id=new_report.id,
         valuation_id=new_report.valuation_id,
@@ -82,10 +103,50 @@ async def generate_report(
     )
 
 
+@router.post("/batch")
+async def generate_batch_reports(
+    batch_data: ReportBatchRequest,
+    current_user_id: int = Query(..., description="当前用户ID"),
+    db: Session = Depends(get_db)
+):
+    """
+    批量生成报告
+    
+    一次查询读取全部估价和房产，多进程并行渲染，结果以ZIP流式返回（每个估价一份PDF）
+    """
+    valuation_ids = list(dict.fromkeys(batch_data.valuation_ids))
+    if len(valuation_ids) > settings.REPORT_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多生成{settings.REPORT_BATCH_MAX_SIZE}份报告"
+        )
+    
+    try:
+        rows = load_valuations(db, valuation_ids, current_user_id)
+    except LookupError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"message": "估价记录不存在或无权限", "valuation_ids": e.args[0]}
+        )
+    
+    template = db.get(ReportTemplate, batch_data.template_id) if batch_data.template_id else None
+    jobs = build_batch_jobs(rows, template)
+    executor = get_batch_executor() if settings.REPORT_BATCH_WORKERS > 0 else None
+    
+    file_name = f"valuation_reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(
+        stream_zip(render_documents(jobs, executor)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
+
+
 @router.get("", response_model=List[ReportResponse])
 async def get_reports(
+    response: Response,
     skip: int = Query(0, ge=0, description="跳过数量"),
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
+    cursor: Optional[str] = Query(None, description="分页游标（取自上一页响应头X-Next-Cursor，传入时忽略skip）"),
     user_id: Optional[int] = Query(None, description="用户ID过滤"),
     status: Optional[str] = Query(None, description="状态过滤"),
     db: Session = Depends(get_db)
@@ -102,9 +163,12 @@ async def get_reports(
         query = query.filter(Report.status == status)
     
     # 按创建时间倒序
-    query = query.order_by(Report.created_at.desc())
-    
-    reports = query.offset(skip).limit(limit).all()
+    try:
+        reports, next_cursor = keyset_paginate(query, Report, limit, cursor=cursor, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     return [
         ReportResponse(
@@ -148,10 +212,32 @@ async def get_report(report_id: int, db: Session = Depends(get_db)):
     )
 
 
-@router.get("/download/{report_id}")
-async def download_report(report_id: int, db: Session = Depends(get_db)):
+@router.get("/{report_id}/events")
+async def report_events(report_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    订阅报告状态（Server-Sent Events），报告生成完成或失败后连接关闭
+    """
+    if await db.get(Report, report_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="报告不存在"
+        )
+    await db.rollback()
+    
+    return StreamingResponse(
+        report_status_events(report_id, db),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/{report_id}/download")
+@router.get("/download/{report_id}", include_in_schema=False)
+async def download_report(report_id: int, request: Request, db: Session = Depends(get_db)):
     """
     下载报告
+    
+    支持Range分段下载和条件请求（ETag为报告内容哈希，未变化时返回304）
     """
     report = db.query(Report).filter(Report.id == report_id).first()
     if not report:
@@ -159,14 +245,22 @@ async def download_report(report_id: int, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND,
             detail="报告不存在"
         )
+    if report.status != REPORT_COMPLETED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="报告尚未生成完成"
+        )
     
-    # TODO: 实现文件下载逻辑
-    # 这里返回下载链接
-    return {
-        "message": "报告下载链接",
-        "download_url": report.file_url,
-        "file_name": report.file_name
-    }
+    # 本地缓存未命中时从OSS下载，放到线程池中执行
+    extension = os.path.splitext(report.file_name or "")[1] or None
+    path = await run_in_threadpool(report_store.find, report.content_hash, extension) if report.content_hash else None
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="报告文件不存在"
+        )
+    
+    return conditional_file_response(request, path, filename=report.file_name, etag=report.content_hash)
 
 
 @router.get("/templates", response_model=List[ReportTemplateResponse])
@@ -201,6 +295,17 @@ async def create_report_template(
     """
     # TODO: 验证用户权限（仅管理员可创建）
     
+    # 模板源码在创建时用渲染所用的沙箱环境检查语法，避免渲染任务才失败
+    html = (template_data.template_content or {}).get("html")
+    if html:
+        try:
+            report_environment.parse(html)
+        except TemplateSyntaxError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"模板语法错误（第{e.lineno}行）: {e.message}"
+            )
+    
     new_template = ReportTemplate(
         name=template_data.name,
         description=template_data.description,
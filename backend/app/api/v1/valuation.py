@@ -3,12 +3,16 @@ ValuHub 估价路由
 AI估价、历史记录、批量处理
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
 
-from app.database.database import get_db
+from app.database.database import get_async_db, get_db
+from app.core.pagination import NEXT_CURSOR_HEADER, keyset_paginate_async
 from app.models.valuation import Valuation
 from app.models.property import Property
 from app.models.user import User
@@ -17,13 +21,31 @@ from app.schemas.valuation import (
     ValuationResponse,
     ValuationBatchCreate,
     MarketTrendRequest,
-    MarketTrendResponse
+    MarketTrendResponse,
+    ComparablesResponse
 )
 from app.api.v1.auth import get_current_user
+from app.services.comparables import market_comparison_engine, property_subject
 
 router = APIRouter()
 
 
+def _comparison_details(comparison: dict) -> dict:
+    """
+    生成市场比较法的估价详情
+    """
+    adjusted_prices = [case["adjusted_price_per_sqm"] for case in comparison["similar_cases"]]
+    return {
+        "method": "市场比较法",
+        "factors": ["面积", "户型", "房龄", "楼层", "区位", "装修"],
+        "market_comparison": {
+            "avg_price": round(sum(adjusted_prices) / len(adjusted_prices), 2),
+            "price_range": [min(adjusted_prices), max(adjusted_prices)]
+        },
+        "similar_cases": comparison["similar_cases"]
+    }
+
+
 @router.post("", response_model=ValuationResponse, status_code=status.HTTP_201_CREATED)
 async def create_valuation(
     valuation_data: ValuationCreate,
@@ -54,8 +76,19 @@ async def create_valuation(
     # TODO: 实际调用AI估价模型，这里先使用模拟数据
     # 根据不同模型类型调整估价结果
     base_price = property.area * 15000
+    comparison = None
     
-    if model_type == "linear":
+    if model_type == "market_comparison":
+        comparison = await run_in_threadpool(market_comparison_engine.valuate, db, property_subject(property))
+        if comparison is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="没有可用的可比案例"
+            )
+        estimated_price = comparison["estimated_price"]
+        confidence_level = comparison["confidence_level"]
+        model_version = comparison["model_version"]
+    elif model_type == "linear":
         estimated_price = base_price * 0.95
         confidence_level = 0.82
         model_version = "v1.0-linear"
@@ -89,11 +122,14 @@ async def create_valuation(
             "price_range": [12000, 16000]
         }
     }
+    if comparison:
+        result_details = _comparison_details(comparison)
     
     # 创建估价记录
     new_valuation = Valuation(
         property_id=valuation_data.property_id,
         user_id=current_user.id,
+        tenant_id=property.tenant_id,
         estimated_price=estimated_price,
         price_per_sqm=price_per_sqm,
         confidence_level=confidence_level,
@@ -122,27 +158,32 @@ async def create_valuation(
 
 @router.get("", response_model=List[ValuationResponse])
 async def get_valuations(
+    response: Response,
     skip: int = Query(0, ge=0, description="跳过数量"),
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
+    cursor: Optional[str] = Query(None, description="分页游标（取自上一页响应头X-Next-Cursor，传入时忽略skip）"),
     user_id: Optional[int] = Query(None, description="用户ID过滤"),
     property_id: Optional[int] = Query(None, description="房产ID过滤"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取估价列表
     """
-    query = db.query(Valuation)
+    query = select(Valuation)
     
     # 应用过滤条件
     if user_id:
-        query = query.filter(Valuation.user_id == user_id)
+        query = query.where(Valuation.user_id == user_id)
     if property_id:
-        query = query.filter(Valuation.property_id == property_id)
+        query = query.where(Valuation.property_id == property_id)
     
     # 按创建时间倒序
-    query = query.order_by(Valuation.created_at.desc())
-    
-    valuations = query.offset(skip).limit(limit).all()
+    try:
+        valuations, next_cursor = await keyset_paginate_async(db, query, Valuation, limit, cursor=cursor, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     return [
         ValuationResponse(
@@ -160,12 +201,38 @@ async def get_valuations(
     ]
 
 
+@router.get("/comparables/{property_id}", response_model=ComparablesResponse)
+async def get_comparables(
+    property_id: int,
+    k: int = Query(5, ge=1, le=50, description="可比案例数量"),
+    db: Session = Depends(get_db)
+):
+    """
+    检索房产的可比案例（市场比较法）
+    """
+    property = db.query(Property).filter(Property.id == property_id).first()
+    if not property:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="房产不存在"
+        )
+    
+    comparison = await run_in_threadpool(market_comparison_engine.valuate, db, property_subject(property), k)
+    if comparison is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="没有可用的可比案例"
+        )
+    
+    return ComparablesResponse(property_id=property_id, **comparison)
+
+
 @router.get("/{valuation_id}", response_model=ValuationResponse)
-async def get_valuation(valuation_id: int, db: Session = Depends(get_db)):
+async def get_valuation(valuation_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     获取估价详情
     """
-    valuation = db.query(Valuation).filter(Valuation.id == valuation_id).first()
+    valuation = await db.get(Valuation, valuation_id)
     if not valuation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -189,16 +256,22 @@ async def get_valuation(valuation_id: int, db: Session = Depends(get_db)):
 @router.get("/property/{property_id}", response_model=List[ValuationResponse])
 async def get_property_valuations(
     property_id: int,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=50, description="返回数量"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="分页游标（取自上一页响应头X-Next-Cursor，传入时忽略skip）"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取房产的估价历史
     """
-    valuations = db.query(Valuation).filter(
-        Valuation.property_id == property_id
-    ).order_by(Valuation.created_at.desc()).offset(skip).limit(limit).all()
+    query = select(Valuation).where(Valuation.property_id == property_id)
+    try:
+        valuations, next_cursor = await keyset_paginate_async(db, query, Valuation, limit, cursor=cursor, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     return [
         ValuationResponse(
@@ -230,21 +303,35 @@ async def batch_valuation(
     # 使用不同的估价模型
     model_type = batch_data.model_type or "ensemble"
     
-    for property_id in batch_data.property_ids:
-        # 验证房产是否存在
-        property = db.query(Property).filter(Property.id == property_id).first()
-        if not property:
-            continue
-        
-        # 验证房产是否属于当前用户
-        if property.user_id != current_user.id:
-            continue
+    # 一次查询取出当前用户的全部待估价房产
+    properties = db.query(Property).filter(
+        Property.id.in_(batch_data.property_ids),
+        Property.user_id == current_user.id
+    ).all()
+    order = {property_id: i for i, property_id in enumerate(batch_data.property_ids)}
+    properties.sort(key=lambda p: order[p.id])
+    
+    # 市场比较法按批次检索可比案例
+    comparisons = [None] * len(properties)
+    if model_type == "market_comparison":
+        comparisons = await run_in_threadpool(
+            market_comparison_engine.valuate_many, db, [property_subject(p) for p in properties]
+        )
+    
+    for property, comparison in zip(properties, comparisons):
+        property_id = property.id
         
         # TODO: 实际调用AI估价模型，这里先使用模拟数据
         # 根据不同模型类型调整估价结果
         base_price = property.area * 15000
         
-        if model_type == "linear":
+        if model_type == "market_comparison":
+            if comparison is None:
+                continue
+            estimated_price = comparison["estimated_price"]
+            confidence_level = comparison["confidence_level"]
+            model_version = comparison["model_version"]
+        elif model_type == "linear":
             estimated_price = base_price * 0.95
             confidence_level = 0.82
             model_version = "v1.0-linear"
@@ -272,10 +359,13 @@ async def batch_valuation(
             "method": f"{model_type} 估价模型",
             "factors": ["面积", "楼层", "房龄", "区域"]
         }
+        if comparison:
+            result_details = _comparison_details(comparison)
         
         new_valuation = Valuation(
             property_id=property_id,
             user_id=current_user.id,
+            tenant_id=property.tenant_id,
             estimated_price=estimated_price,
             price_per_sqm=price_per_sqm,
             confidence_level=confidence_level,
@@ -11,11 +11,16 @@ import logging
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_squared_error, r2_score
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
 
+from app.core.metrics import timed
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,11 +35,21 @@ TRAINING_DATA_DIR = os.path.join(os.path.dirname(__file__), '../../../training_d
 os.makedirs(MODEL_DIR, exist_ok=True)
 os.makedirs(TRAINING_DATA_DIR, exist_ok=True)
 
+def market_comparison_model(n_neighbors: int = 5, **params):
+    """
+    市场比较模型
+    特征标准化后用KD树检索最相似的成交案例，按距离反比加权
+    """
+    return make_pipeline(
+        StandardScaler(),
+        KNeighborsRegressor(n_neighbors=n_neighbors, weights="distance", algorithm="kd_tree", **params)
+    )
+
 # 支持的模型类型
 SUPPORTED_MODELS = {
     'linear_regression': LinearRegression,
     'random_forest': RandomForestRegressor,
-    'market_comparison': None,  # 基于相似房产成交数据的模型
+    'market_comparison': market_comparison_model,  # 基于相似房产成交数据的模型
     'cost': None,  # 基于重建成本的模型
     'income': None  # 用于商业地产的现金流折现模型
 }
@@ -121,7 +136,7 @@ async def train_model(
     
     # 处理不同模型类型的特殊逻辑
     if model_class is None:
-        # 对于非机器学习模型（市场比较、成本、收益模型），使用配置参数方式训练
+        # 对于非机器学习模型（成本、收益模型），使用配置参数方式训练
         logger.info(f"开始训练非机器学习模型: {model_type}")
         
         # 保存模型配置参数
@@ -143,13 +158,15 @@ async def train_model(
         model = model_class(**params)
         
         # 训练模型
-        model.fit(X_train, y_train)
+        with timed("inference"):
+            model.fit(X_train, y_train)
     
     # 预测
     if model_class is not None:
         # 对于机器学习模型，使用实际预测
-        y_pred_train = model.predict(X_train)
-        y_pred_test = model.predict(X_test)
+        with timed("inference"):
+            y_pred_train = model.predict(X_train)
+            y_pred_test = model.predict(X_test)
     # 对于非机器学习模型，已经在上面生成了模拟预测结果
     
     # 评估模型
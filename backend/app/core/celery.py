@@ -8,9 +8,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 # 创建Celery实例
 celery_app = Celery(
     'zhihuiyun',
-    broker=settings.CELERY_BROKER_URL,
-    backend=settings.CELERY_RESULT_BACKEND,
-    include=['app.services.data_collector']
+    broker=settings.CELERY_BROKER_URL or settings.REDIS_URL,
+    backend=settings.CELERY_RESULT_BACKEND or settings.REDIS_URL,
+    include=['app.services.data_collector', 'app.services.report']
 )
 
 # 配置Celery
@@ -20,13 +20,32 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='Asia/Shanghai',
     enable_utc=True,
+    # 采集子任务和统计刷新分别进入专用队列，可单独扩容worker：
+    # celery -A app.core.celery worker -Q collection / -Q market_stats / -Q reports
+    task_routes={
+        'app.services.data_collector.collect_district_data': {'queue': 'collection'},
+        'app.services.data_collector.finalize_collection': {'queue': 'collection'},
+        'app.services.data_collector.refresh_market_statistics': {'queue': 'market_stats'},
+        # PDF渲染占用CPU，由独立的worker进程池执行，不影响接口进程
+        'app.services.report.render_report_task': {'queue': 'reports'},
+    },
+    # 子任务执行完才确认，worker中途退出时任务重新投递
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
     beat_schedule={
-        # 每天凌晨2点执行数据采集任务
+        # 每天凌晨2点执行数据采集任务（增量，只采集变化的小区）
         'collect-real-estate-data-daily': {
             'task': 'app.services.data_collector.collect_real_estate_data',
             'schedule': 86400,  # 86400秒 = 1天
             'args': (),
         },
+        # 每周一次全量校对：对全部小区发条件请求，补上变更feed遗漏的更新
+        'collect-real-estate-data-weekly-full': {
+            'task': 'app.services.data_collector.collect_real_estate_data',
+            'schedule': 604800,  # 604800秒 = 7天
+            'kwargs': {'full': True},
+        },
     },
 )
 
@@ -3,8 +3,13 @@ ValuHub 后端配置管理
 使用环境变量和pydantic进行配置
 """
 
+from pathlib import Path
+
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Any, Dict, List
+
+# 仓库根目录（backend的上一级），区县成交CSV存放在这里
+REPO_ROOT = Path(__file__).resolve().parents[3]
 
 
 class Settings(BaseSettings):
@@ -29,7 +34,27 @@ class Settings(BaseSettings):
     def DATABASE_URL(self) -> str:
         """生成数据库连接URL"""
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
-    
+
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        """生成异步数据库连接URL（asyncpg驱动）"""
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
+    # 连接池配置（同步、异步引擎各自按此建池）
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # 等待空闲连接的秒数
+    DB_POOL_RECYCLE: int = 3600
+    DB_STATEMENT_CACHE_SIZE: int = 100  # asyncpg预编译语句缓存，经pgbouncer事务池连接时设为0
+    DB_ECHO: bool = False  # 输出全部SQL，仅排查问题时开启
+    DB_SLOW_QUERY_MS: float = 500  # 慢查询阈值（毫秒）
+    DB_SLOW_QUERY_LOG_SIZE: int = 50  # 保留的最近慢查询条数
+    DB_POOL_ADAPTIVE: bool = False  # 按借出等待时间自动调整溢出连接上限
+    DB_POOL_ADAPTIVE_WAIT_MS: float = 50  # 目标平均等待时间（毫秒）
+    DB_POOL_ADAPTIVE_MAX_OVERFLOW: int = 60  # 自适应模式下溢出连接上限的最大值
+    DB_POOL_ADAPTIVE_INTERVAL: int = 30  # 评估间隔（秒）
+    HEALTH_CHECK_TIMEOUT: float = 2.0  # 健康检查中单项依赖的超时（秒）
+
     # Redis配置
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
@@ -42,6 +67,41 @@ class Settings(BaseSettings):
         if self.REDIS_PASSWORD:
             return f"redis://:{self.REDIS_PASSWORD}@{self.REDIS_HOST}:{self.REDIS_PORT}/{self.REDIS_DB}"
         return f"redis://{self.REDIS_HOST}:{self.REDIS_PORT}/{self.REDIS_DB}"
+
+    REDIS_MAX_CONNECTIONS: int = 50  # 每个进程的连接池上限
+    REDIS_SOCKET_TIMEOUT: float = 2.0  # 连接和读写超时（秒）
+
+    # Celery配置（为空时使用Redis，chord汇总需要结果后端）
+    CELERY_BROKER_URL: str = ""
+    CELERY_RESULT_BACKEND: str = ""
+
+    # 缓存配置
+    CACHE_EXPIRE_TIME: int = 3600  # 默认过期时间（秒）
+    CACHE_CODEC: str = "json"  # 值编码：json（安装orjson时使用orjson）或 msgpack
+    CACHE_COMPRESS_THRESHOLD: int = 4096  # 编码后超过该字节数时zlib压缩，0表示不压缩
+    CACHE_COMPRESS_LEVEL: int = 6
+    CACHE_PIPELINE_BATCH_SIZE: int = 500  # 批量写入时每次管道执行的命令数
+
+    # 数据采集配置
+    DATA_SOURCE_BASE_URL: str = ""  # 小区数据接口地址，为空时使用离线模拟数据源
+    COLLECTOR_MAX_PER_HOST: int = 8  # 每个主机的最大并发请求数
+    COLLECTOR_RATE_PER_HOST: float = 20.0  # 每个主机每秒最多发出的请求数，0表示不限
+    COLLECTOR_MAX_RETRIES: int = 3  # 失败（超时、429、5xx）后的最大重试次数
+    COLLECTOR_BACKOFF_BASE: float = 0.5  # 退避基数（秒），第n次重试等待 base * 2^(n-1)
+    COLLECTOR_TIMEOUT: float = 10.0  # 单个请求超时（秒）
+    COLLECTOR_USER_AGENT: str = "ValuHubCollector/1.0"
+    COLLECTOR_SIMULATED_LATENCY: float = 1.0  # 模拟数据源每个请求的延迟（秒）
+    COLLECTOR_STATE_DIR: str = "data/collector"  # 增量采集检查点和原始快照目录（不要放在对外提供的media目录下）
+
+    # 两级缓存配置（进程内LRU + Redis）
+    TIERED_CACHE_LOCAL_SIZE: int = 1024  # 进程内条目数上限
+    TIERED_CACHE_LOCAL_TTL: float = 30  # 进程内副本不经Redis校验直接使用的时长（秒）
+    TIERED_CACHE_STALE_TTL: int = 3600  # 过期后仍可返回旧值并后台刷新的时长（秒）
+    TIERED_CACHE_BETA: float = 1.0  # 概率提前刷新系数，越大越早刷新，0表示关闭
+    TIERED_CACHE_LOAD_TIMEOUT: float = 120  # 等待其他调用方回源的最长时间（秒）
+    TIERED_CACHE_REFRESH_WORKERS: int = 4  # 后台刷新线程数
+    CACHE_BREAKER_FAILURES: int = 5  # Redis连续失败多少次后熔断
+    CACHE_BREAKER_RESET_SECONDS: float = 30  # 熔断后多久放行一次探测
     
     # JWT配置
     SECRET_KEY: str = "your-secret-key-change-in-production"
@@ -49,6 +109,15 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRE_MINUTES: int = 1440  # 24小时
     
+    # 认证缓存配置（令牌 -> 用户快照）
+    AUTH_CACHE_TTL: int = 30  # 缓存有效期（秒），也是其他进程感知用户状态变更的最长延迟
+    AUTH_CACHE_SIZE: int = 10000  # 进程内LRU容量
+    AUTH_CACHE_REDIS_ENABLED: bool = True  # 是否使用Redis作为二级缓存
+    
+    # 密码哈希配置
+    BCRYPT_ROUNDS: int = 12  # bcrypt成本参数，修改后旧哈希在用户下次登录时自动升级
+    PASSWORD_HASH_WORKERS: int = 4  # 密码哈希线程池大小，即最大并发哈希数
+    
     # CORS配置
     CORS_ORIGINS: List[str] = [
         "http://localhost:3000",
@@ -61,15 +130,84 @@ class Settings(BaseSettings):
     OSS_SECRET_KEY: str = ""
     OSS_BUCKET: str = "valuhub-media"
     OSS_ENDPOINT: str = "oss-cn-hangzhou.aliyuncs.com"
+    OSS_BASE_URL: str = ""  # 自定义访问域名（CDN），为空时使用 bucket.endpoint
+    OSS_MULTIPART_THRESHOLD: int = 10 * 1024 * 1024  # 超过该大小的文件使用分片上传
+    OSS_PART_SIZE: int = 5 * 1024 * 1024  # 分片大小（OSS要求除最后一片外不小于100KB）
+    OSS_UPLOAD_THREADS: int = 4  # 单个文件并行上传的分片数
+    OSS_CHECKPOINT_DIR: str = "data/oss_checkpoints"  # 断点续传检查点目录
+    OSS_BATCH_UPLOAD_CONCURRENCY: int = 4  # 批量上传时同时上传的文件数
+    OSS_BATCH_MAX_FILES: int = 20  # 单次批量上传的文件数上限
+    
+    # 文件存储配置（上传、导出、报告）
+    STORAGE_BACKEND: str = "auto"  # oss、local，auto表示配置了OSS账号时使用OSS，否则使用本地磁盘
+    STORAGE_LOCAL_DIR: str = "data/storage"  # 本地存储目录（不对外直接提供，通过签名URL下载）
+    STORAGE_URL_EXPIRES: int = 3600  # 下载地址有效期（秒）
+    STORAGE_SIGNING_KEY: str = ""  # 本地下载地址的签名密钥，为空时使用SECRET_KEY
+    MEDIA_CACHE_CONTROL: str = "public, max-age=86400"  # /media 静态文件的Cache-Control
+    
+    # 支付配置
+    DATA_DIR: str = "data"  # 订单事件日志等运行数据目录
+    WX_PAY_APPID: str = ""
     
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "logs/app.log"
+    REQUEST_LOG_SAMPLE_RATE: float = 0.1  # 请求日志采样比例，5xx和慢请求始终记录
+    REQUEST_SLOW_MS: float = 1000  # 慢请求阈值（毫秒）
     
     # API配置
     API_V1_PREFIX: str = "/api/v1"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
     
+    # 数据导出配置
+    EXPORT_STORAGE_DIR: str = "data/exports"  # 导出文件的临时目录，写完后转存到存储后端
+    EXPORT_BATCH_SIZE: int = 1000  # 服务端游标每批读取行数
+    
+    # 报告生成配置
+    REPORT_STORAGE_DIR: str = "data/reports"  # 报告文件（按内容哈希存放），通过下载接口提供，不放在公开的media目录下
+    REPORT_STORE_OFFLOAD: bool = True  # 存储后端为OSS时把报告文件转存到OSS，本地目录只作缓存
+    REPORT_STORE_CACHE_MAX_BYTES: int = 2 * 1024 ** 3  # 已转存时本地缓存的最大字节数，超出后按最近使用淘汰
+    REPORT_STORE_PREFIX: str = "reports"  # 存储后端中报告文件的目录
+    REPORT_RENDER_TIMEOUT: int = 300  # 单个报告渲染超时（秒）
+    REPORT_TEMPLATE_CACHE_SIZE: int = 200  # 进程内缓存的编译模板数（按模板ID和更新时间区分）
+    REPORT_TEMPLATE_BYTECODE_CACHE: bool = True  # 编译后的字节码缓存到磁盘，worker重启后无需重新解析
+    REPORT_TEMPLATE_BYTECODE_DIR: str = ""  # 字节码缓存目录，为空时使用系统临时目录
+    REPORT_BATCH_MAX_SIZE: int = 500  # 单次批量生成的报告数上限
+    REPORT_BATCH_WORKERS: int = 4  # 批量报告渲染进程数，0表示在请求线程中依次渲染
+    REPORT_EVENTS_POLL_INTERVAL: float = 5.0  # 状态推送在未收到通知时回查数据库的间隔（秒）
+    REPORT_EVENTS_TIMEOUT: float = 600.0  # 状态推送连接的最长保持时间（秒）
+    
+    # 批量导入配置
+    BULK_INSERT_CHUNK_SIZE: int = 1000  # 每条多行INSERT包含的行数
+    
+    # 地理索引配置
+    GEO_INDEX_CELL_SIZE: float = 0.01  # 网格边长（度），约1.1公里
+    GEO_INDEX_REFRESH_SECONDS: int = 300  # 从数据库全量重建的间隔，0表示不自动重建
+    
+    # 市场比较法配置
+    MARKET_DATA_DIR: str = str(REPO_ROOT)  # 区县成交CSV所在目录，默认仓库根目录（与工作目录无关），容器中通过环境变量指定
+    COMPARABLES_K: int = 5  # 默认可比案例数量
+    COMPARABLES_REFRESH_SECONDS: int = 600  # 可比案例索引重建间隔，0表示不自动重建
+    
+    # 限流配置：按路由组配置令牌桶速率（个/秒）、桶容量和每个调用方的最大并发
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_GROUPS: Dict[str, Dict[str, Any]] = {
+        "valuation": {
+            "prefixes": ["/api/v1/valuations", "/api/v2/valuate"],
+            "rate": 5, "burst": 30, "concurrency": 8
+        },
+        "export": {
+            "prefixes": ["/api/v1/data/export"],
+            "rate": 0.2, "burst": 5, "concurrency": 2
+        },
+        "model_training": {
+            "prefixes": ["/api/v2/model-training"],
+            "rate": 0.5, "burst": 10, "concurrency": 2
+        }
+    }
+    RATE_LIMIT_LEASE_SECONDS: int = 300  # 并发租约最长保留时间，防止进程崩溃后配额泄漏
+    RATE_LIMIT_REDIS_RETRY_SECONDS: int = 30  # Redis出错后改用进程内状态的时长
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
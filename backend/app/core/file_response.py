@@ -0,0 +1,171 @@
+"""
+ValuHub 文件响应
+在FileResponse基础上支持条件请求（ETag / Last-Modified -> 304）和单段Range请求（206）；
+静态文件目录附加Cache-Control
+"""
+
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+
+# Range响应每次读取的字节数
+CHUNK_SIZE = 64 * 1024
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match / If-Range 中是否包含该ETag（弱比较）"""
+    if header.strip() == "*":
+        return True
+    normalize = lambda value: value.strip().removeprefix("W/")
+    return normalize(etag) in (normalize(tag) for tag in header.split(","))
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class RangeNotSatisfiable(ValueError):
+    """请求的范围超出文件大小（416）"""
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段Range请求头
+
+    Returns:
+        (起始, 结束)，均含；多段或格式不合法时为None（按完整文件响应）
+
+    Raises:
+        RangeNotSatisfiable: 范围超出文件大小
+    """
+    unit, _, spec = header.partition("=")
+    start, separator, end = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or "," in spec or not separator:
+        return None
+    try:
+        if start:
+            first, last = int(start), int(end) if end else size - 1
+        else:
+            # bytes=-N 表示最后N个字节
+            suffix = int(end)
+            if suffix <= 0:
+                raise RangeNotSatisfiable(header)
+            first, last = max(size - suffix, 0), size - 1
+    except RangeNotSatisfiable:
+        raise
+    except ValueError:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable(header)
+    if first > last:
+        return None
+    return first, min(last, size - 1)
+
+
+def content_disposition(filename: str) -> str:
+    """下载文件名响应头，非ASCII文件名按RFC 5987编码"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _iter_range(path: str, first: int, last: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def conditional_file_response(
+    request: Request,
+    path: str,
+    media_type: str = None,
+    filename: str = None,
+    etag: str = None,
+    cache_control: str = "private, max-age=0, must-revalidate"
+) -> Response:
+    """
+    返回文件，支持条件请求和Range
+
+    Args:
+        request: 当前请求
+        path: 文件路径
+        media_type: MIME类型，默认按扩展名推断
+        filename: 下载文件名（Content-Disposition）
+        etag: 强ETag（不含引号），内容寻址的文件传入内容哈希；默认由修改时间和大小生成
+        cache_control: Cache-Control 响应头
+    """
+    stat = os.stat(path)
+    etag = f'"{etag}"' if etag else f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control
+    }
+
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or _etag_matches(if_range, etag)):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+        if byte_range is not None:
+            first, last = byte_range
+            headers.update({
+                "Content-Range": f"bytes {first}-{last}/{stat.st_size}",
+                "Content-Length": str(last - first + 1)
+            })
+            if filename:
+                headers["Content-Disposition"] = content_disposition(filename)
+            return StreamingResponse(
+                _iter_range(path, first, last),
+                status_code=206,
+                media_type=media_type or mimetypes.guess_type(path)[0] or "application/octet-stream",
+                headers=headers
+            )
+
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat)
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    静态文件目录，响应附加Cache-Control
+
+    StaticFiles本身已带ETag、Last-Modified并处理304，只是没有缓存策略，浏览器每次都会回源校验。
+    """
+
+    def __init__(self, *args, cache_control: str = "public, max-age=86400", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", self.cache_control)
+        return response
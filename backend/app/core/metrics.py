@@ -0,0 +1,220 @@
+"""
+ValuHub 请求指标
+请求内分阶段计时（数据库、推理、序列化）与按路由的延迟直方图，以Prometheus文本格式输出
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 直方图桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestTimings:
+    """
+    单个请求的分阶段耗时（秒）
+
+    对象本身可变，线程池中执行的同步代码拿到的是复制后的上下文，
+    但引用的仍是同一个对象，累加结果对中间件可见。
+    """
+
+    __slots__ = ("phases",)
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> Tuple[RequestTimings, object]:
+    """开始记录当前请求的分阶段耗时，返回 (计时对象, 用于复位的token)"""
+    timings = RequestTimings()
+    return timings, _current_timings.set(timings)
+
+
+def end_request_timings(token):
+    """结束记录当前请求的分阶段耗时"""
+    _current_timings.reset(token)
+
+
+def add_timing(phase: str, seconds: float):
+    """累加当前请求某阶段的耗时，不在请求上下文中时忽略"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """
+    统计代码块耗时并计入当前请求
+
+    Args:
+        phase: 阶段名，如 'inference'、'serialization'
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(phase, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("query_started_at")
+    if stack:
+        add_timing("db", time.perf_counter() - stack.pop())
+
+
+def instrument_engine(engine_class=Engine):
+    """
+    统计SQL执行耗时
+
+    默认挂在Engine类上，对所有引擎（包括测试用引擎）生效，重复调用不会重复注册
+    """
+    if not event.contains(engine_class, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine_class, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine_class, "after_cursor_execute", _after_cursor_execute)
+
+
+class TimedJSONResponse(JSONResponse):
+    """
+    统计JSON序列化耗时的响应类，作为应用的默认响应类
+    """
+
+    def render(self, content) -> bytes:
+        with timed("serialization"):
+            return super().render(content)
+
+
+class LatencyHistogram:
+    """
+    固定桶延迟直方图
+    """
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        """各桶的累计计数（最后一项为+Inf）"""
+        result = []
+        running = 0
+        for count in self.counts:
+            running += count
+            result.append(running)
+        return result
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+
+
+class MetricsRegistry:
+    """
+    进程内请求指标
+
+    只在事件循环线程中更新和读取，无需加锁。多进程部署时每个进程各自统计。
+    """
+
+    def __init__(self):
+        self.latency: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.phases: Dict[Tuple[str, str, str], float] = {}
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        """注册额外的指标来源，render时调用并追加其输出的指标行"""
+        self.collectors.append(collector)
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float, phases: Dict[str, float]):
+        """
+        记录一次请求
+
+        Args:
+            method: 请求方法
+            route: 路由模板（如 /api/v1/properties/{property_id}），避免标签基数随路径参数膨胀
+            status_code: 响应状态码
+            seconds: 总耗时
+            phases: 分阶段耗时
+        """
+        key = (method, route)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = LatencyHistogram()
+        histogram.observe(seconds)
+
+        request_key = (method, route, status_code)
+        self.requests[request_key] = self.requests.get(request_key, 0) + 1
+
+        for phase, value in phases.items():
+            phase_key = (method, route, phase)
+            self.phases[phase_key] = self.phases.get(phase_key, 0.0) + value
+
+    def reset(self):
+        """清空全部指标"""
+        self.latency.clear()
+        self.requests.clear()
+        self.phases.clear()
+
+    def render(self) -> str:
+        """输出Prometheus文本格式"""
+        lines = [
+            "# HELP valuhub_http_request_duration_seconds 请求总耗时",
+            "# TYPE valuhub_http_request_duration_seconds histogram"
+        ]
+        bounds = [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+        for (method, route), histogram in sorted(self.latency.items()):
+            for bound, count in zip(bounds, histogram.cumulative()):
+                labels = _labels(method=method, route=route, le=bound)
+                lines.append(f"valuhub_http_request_duration_seconds_bucket{{{labels}}} {count}")
+            labels = _labels(method=method, route=route)
+            lines.append(f"valuhub_http_request_duration_seconds_sum{{{labels}}} {histogram.total:.6f}")
+            lines.append(f"valuhub_http_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+        lines.append("# HELP valuhub_http_requests_total 请求数")
+        lines.append("# TYPE valuhub_http_requests_total counter")
+        for (method, route, status_code), count in sorted(self.requests.items()):
+            labels = _labels(method=method, route=route, status=status_code)
+            lines.append(f"valuhub_http_requests_total{{{labels}}} {count}")
+
+        lines.append("# HELP valuhub_http_request_phase_seconds_total 请求各阶段累计耗时（db/inference/serialization）")
+        lines.append("# TYPE valuhub_http_request_phase_seconds_total counter")
+        for (method, route, phase), seconds in sorted(self.phases.items()):
+            labels = _labels(method=method, route=route, phase=phase)
+            lines.append(f"valuhub_http_request_phase_seconds_total{{{labels}}} {seconds:.6f}")
+
+        for collector in self.collectors:
+            lines.extend(collector())
+
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标实例
+metrics = MetricsRegistry()
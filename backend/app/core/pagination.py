@@ -0,0 +1,146 @@
+"""
+ValuHub 分页工具
+基于 (created_at, id) 的游标分页（keyset pagination）
+"""
+
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import Select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query
+
+# 下一页游标通过响应头返回，列表响应体保持不变
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    生成不透明的分页游标
+
+    Args:
+        created_at: 当前页最后一条记录的创建时间
+        row_id: 当前页最后一条记录的ID
+
+    Returns:
+        URL安全的游标字符串
+    """
+    raw = f"{created_at.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    解析分页游标
+
+    Args:
+        cursor: encode_cursor 生成的游标
+
+    Returns:
+        (created_at, id)
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+def _keyset_query(query: Any, model: Any, limit: int, cursor: Optional[str], skip: int) -> Any:
+    """
+    应用排序、游标条件和limit，Query与select()语句通用
+
+    多取一条用于判断是否还有下一页。created_at 需为非空列（模型与
+    create_listing_indexes.sql 中均有约束），空值会被游标条件跳过；
+    不使用 COALESCE 兜底，以免排序无法利用 (created_at, id) 复合索引
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < last_id)
+        ))
+    elif skip:
+        query = query.offset(skip)
+
+    return query.limit(limit + 1)
+
+
+def _split_page(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """截取当前页并生成下一页游标"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return rows, next_cursor
+
+
+def keyset_paginate(
+    query: Query,
+    model: Any,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    按 (created_at desc, id desc) 分页
+
+    传入 cursor 时使用游标定位，查询代价与页深无关；
+    未传入时退化为 offset/limit，兼容原有的 skip 参数。
+
+    Args:
+        query: 已应用过滤条件的查询
+        model: 查询的模型类，需包含 created_at 和 id 列
+        limit: 每页数量
+        cursor: 上一页返回的游标
+        skip: 跳过数量（仅在未传入游标时生效）
+
+    Returns:
+        (当前页记录, 下一页游标；没有更多数据时为None)
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    rows = _keyset_query(query, model, limit, cursor, skip).all()
+    return _split_page(rows, limit)
+
+
+async def keyset_paginate_async(
+    db: AsyncSession,
+    statement: Select,
+    model: Any,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    keyset_paginate 的异步版本
+
+    Args:
+        db: 异步数据库会话
+        statement: 已应用过滤条件的 select(model) 语句
+        model: 查询的模型类，需包含 created_at 和 id 列
+        limit: 每页数量
+        cursor: 上一页返回的游标
+        skip: 跳过数量（仅在未传入游标时生效）
+
+    Returns:
+        (当前页记录, 下一页游标；没有更多数据时为None)
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    result = await db.execute(_keyset_query(statement, model, limit, cursor, skip))
+    return _split_page(list(result.scalars().all()), limit)
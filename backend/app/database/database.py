@@ -3,22 +3,31 @@ ValuHub 数据库连接和会话管理
 """
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from typing import AsyncGenerator, Generator, Optional
 
 from app.core.config import settings
+from app.database.pool_monitor import MonitoredAsyncQueuePool, MonitoredQueuePool, PoolMonitor
 
 # 创建数据库引擎
 engine = create_engine(
     settings.DATABASE_URL,
+    poolclass=MonitoredQueuePool,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
-    pool_recycle=3600,
-    echo=settings.DEBUG
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    echo=settings.DB_ECHO
 )
 
+# 连接池监控（健康检查和/metrics使用）
+db_pool_monitor = PoolMonitor("sync").attach(engine)
+async_db_pool_monitor = PoolMonitor("async")
+
 # 创建会话工厂
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -26,10 +35,63 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+# 异步会话工厂，首次使用时绑定引擎；提交后不过期对象，避免响应组装时触发隐式IO
+AsyncSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+_async_engine: Optional[AsyncEngine] = None
+
 # 创建基类
 Base = declarative_base()
 
 
+def create_async_db_engine(url: str = None, **kwargs) -> AsyncEngine:
+    """
+    创建异步数据库引擎
+
+    PostgreSQL使用asyncpg，按配置设置连接池和预编译语句缓存；
+    SQLite（本地开发、测试）使用aiosqlite。
+
+    Args:
+        url: 数据库URL，默认 settings.ASYNC_DATABASE_URL
+        **kwargs: 透传给 create_async_engine 的参数
+    """
+    url = make_url(url or settings.ASYNC_DATABASE_URL)
+
+    if url.get_backend_name() == "sqlite":
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+    else:
+        # SQLAlchemy层与asyncpg连接层各有一份语句缓存，两者保持一致
+        url = url.update_query_dict({"prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)})
+        kwargs.setdefault("connect_args", {"statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE})
+        kwargs.setdefault("poolclass", MonitoredAsyncQueuePool)
+        kwargs.setdefault("pool_size", settings.DB_POOL_SIZE)
+        kwargs.setdefault("max_overflow", settings.DB_MAX_OVERFLOW)
+        kwargs.setdefault("pool_timeout", settings.DB_POOL_TIMEOUT)
+        kwargs.setdefault("pool_recycle", settings.DB_POOL_RECYCLE)
+        kwargs.setdefault("pool_pre_ping", True)
+
+    kwargs.setdefault("echo", settings.DB_ECHO)
+    return create_async_engine(url, **kwargs)
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    获取全局异步引擎
+
+    延迟创建：只使用同步接口的进程（Celery worker、脚本）无需安装异步驱动
+    """
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_db_engine()
+        async_db_pool_monitor.attach(_async_engine.sync_engine)
+        AsyncSessionLocal.configure(bind=_async_engine)
+    return _async_engine
+
+
 def get_db() -> Generator[Session, None, None]:
     """
     获取数据库会话
@@ -42,6 +104,26 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取异步数据库会话
+    用于依赖注入，查询直接在事件循环中执行，不占用线程池
+    """
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engine():
+    """
+    关闭异步引擎的连接池（应用关闭时调用）
+    """
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
 def init_db():
     """
     初始化数据库
@@ -0,0 +1,271 @@
+"""
+ValuHub 连接池监控
+借出等待时间、在用/溢出连接数、连接存活时间和慢查询统计，可按等待时间自适应调整溢出上限
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+from app.core.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# QueuePool._do_get 在竞争时会递归调用自身，只统计最外层一次
+_in_checkout: ContextVar[bool] = ContextVar("pool_checkout", default=False)
+
+
+class MonitoredPoolMixin:
+    """
+    统计借出等待时间的连接池
+
+    等待时间包含排队等待空闲连接和新建溢出连接的耗时，超时同样计入。
+    """
+
+    _monitor: Optional["PoolMonitor"] = None
+
+    def _do_get(self):
+        if _in_checkout.get():
+            return super()._do_get()
+
+        token = _in_checkout.set(True)
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            _in_checkout.reset(token)
+            monitor = self._monitor
+            if monitor is not None:
+                monitor.record_wait(time.perf_counter() - started, timed_out)
+
+    def recreate(self):
+        # engine.dispose() 会重建连接池，事件监听由SQLAlchemy复制，监控对象需手动带上
+        pool = super().recreate()
+        pool._monitor = self._monitor
+        if self._monitor is not None:
+            self._monitor.pool = pool
+        return pool
+
+    def set_max_overflow(self, max_overflow: int):
+        """
+        调整溢出连接上限
+
+        调小后已借出的溢出连接在归还时关闭，不影响正在执行的请求
+        """
+        with self._overflow_lock:
+            self._max_overflow = max_overflow
+
+
+class MonitoredQueuePool(MonitoredPoolMixin, QueuePool):
+    """同步引擎使用的连接池"""
+
+
+class MonitoredAsyncQueuePool(MonitoredPoolMixin, AsyncAdaptedQueuePool):
+    """异步引擎使用的连接池"""
+
+
+class PoolMonitor:
+    """
+    单个引擎的连接池与查询统计
+
+    借出等待、连接建立和关闭由连接池事件与 MonitoredPoolMixin 记录，慢查询由引擎的游标事件记录。
+    自适应模式下每隔 DB_POOL_ADAPTIVE_INTERVAL 秒根据平均等待时间和超时次数
+    增减溢出上限，范围为 [DB_MAX_OVERFLOW, DB_POOL_ADAPTIVE_MAX_OVERFLOW]；
+    常驻连接数（pool_size）保持不变。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        slow_query_ms: float = None,
+        adaptive: bool = None,
+        target_wait_ms: float = None,
+        max_overflow_ceiling: int = None,
+        adapt_interval: float = None
+    ):
+        self.name = name
+        self.pool = None
+        self.slow_query_ms = settings.DB_SLOW_QUERY_MS if slow_query_ms is None else slow_query_ms
+        self.adaptive = settings.DB_POOL_ADAPTIVE if adaptive is None else adaptive
+        self.target_wait_ms = settings.DB_POOL_ADAPTIVE_WAIT_MS if target_wait_ms is None else target_wait_ms
+        self.max_overflow_ceiling = (
+            settings.DB_POOL_ADAPTIVE_MAX_OVERFLOW if max_overflow_ceiling is None else max_overflow_ceiling
+        )
+        self.adapt_interval = settings.DB_POOL_ADAPTIVE_INTERVAL if adapt_interval is None else adapt_interval
+
+        self.wait = LatencyHistogram()
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.slow_queries = deque(maxlen=settings.DB_SLOW_QUERY_LOG_SIZE)
+        self.slow_query_count = 0
+        self.base_max_overflow: Optional[int] = None
+
+        self._connected_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._window_started = time.monotonic()
+        self._window_wait = 0.0
+        self._window_count = 0
+        self._window_timeouts = 0
+
+    def attach(self, engine: Engine) -> "PoolMonitor":
+        """
+        挂载到引擎（异步引擎传入 async_engine.sync_engine）
+        """
+        self.pool = engine.pool
+        if isinstance(self.pool, MonitoredPoolMixin):
+            self.pool._monitor = self
+        if isinstance(self.pool, QueuePool):
+            self.base_max_overflow = self.pool._max_overflow
+
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "close", self._on_close)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        return self
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        """记录一次借出等待"""
+        with self._lock:
+            self.wait.observe(seconds)
+            self.max_wait = max(self.max_wait, seconds)
+            self._window_wait += seconds
+            self._window_count += 1
+            if timed_out:
+                self.timeouts += 1
+                self._window_timeouts += 1
+            if self.adaptive:
+                self._maybe_adapt()
+
+    def _maybe_adapt(self):
+        """调用方需持有锁"""
+        now = time.monotonic()
+        if now - self._window_started < self.adapt_interval or not isinstance(self.pool, MonitoredPoolMixin):
+            return
+
+        avg_wait_ms = self._window_wait / self._window_count * 1000 if self._window_count else 0.0
+        timeouts = self._window_timeouts
+        self._window_started = now
+        self._window_wait = 0.0
+        self._window_count = 0
+        self._window_timeouts = 0
+
+        current = self.pool._max_overflow
+        step = max(1, self.pool.size() // 2)
+        if timeouts or avg_wait_ms > self.target_wait_ms:
+            new = min(self.max_overflow_ceiling, current + step)
+        elif avg_wait_ms < self.target_wait_ms / 4:
+            new = max(self.base_max_overflow, current - step)
+        else:
+            return
+
+        if new != current:
+            self.pool.set_max_overflow(new)
+            logger.info(
+                "连接池[%s]溢出上限 %d -> %d（平均等待 %.1fms，超时 %d 次）",
+                self.name, current, new, avg_wait_ms, timeouts
+            )
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+            self._connected_at[id(connection_record)] = time.monotonic()
+
+    def _on_close(self, dbapi_connection, connection_record):
+        with self._lock:
+            self._connected_at.pop(id(connection_record), None)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started_at", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("slow_query_started_at")
+        if not stack:
+            return
+        elapsed_ms = (time.perf_counter() - stack.pop()) * 1000
+        if elapsed_ms < self.slow_query_ms:
+            return
+
+        # 只记录语句，不记录参数，避免敏感数据进入日志
+        statement = " ".join(statement.split())[:500]
+        with self._lock:
+            self.slow_query_count += 1
+            self.slow_queries.append({
+                "statement": statement,
+                "duration_ms": round(elapsed_ms, 2),
+                "executemany": executemany,
+                "at": time.time()
+            })
+        logger.warning("慢查询[%s] %.1fms: %s", self.name, elapsed_ms, statement)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前连接池状态，用于健康检查"""
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - connected_at for connected_at in self._connected_at.values()]
+            data = {
+                "checkouts": self.wait.count,
+                "avg_wait_ms": round(self.wait.total / self.wait.count * 1000, 3) if self.wait.count else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "open_connections": len(ages),
+                "oldest_connection_age_s": round(max(ages), 1) if ages else 0.0,
+                "slow_queries": self.slow_query_count,
+                "recent_slow_queries": list(self.slow_queries)[-5:]
+            }
+
+        pool = self.pool
+        if isinstance(pool, QueuePool):
+            data.update({
+                "pool_size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(0, pool.overflow()),
+                "max_overflow": pool._max_overflow,
+                "adaptive": self.adaptive
+            })
+        return data
+
+    def metrics_lines(self) -> List[str]:
+        """Prometheus指标"""
+        data = self.snapshot()
+        label = f'pool="{self.name}"'
+        lines = [
+            "# HELP valuhub_db_pool_checkouts_total 连接借出次数",
+            "# TYPE valuhub_db_pool_checkouts_total counter",
+            f"valuhub_db_pool_checkouts_total{{{label}}} {data['checkouts']}",
+            "# HELP valuhub_db_pool_wait_seconds_total 连接借出累计等待时间",
+            "# TYPE valuhub_db_pool_wait_seconds_total counter",
+            f"valuhub_db_pool_wait_seconds_total{{{label}}} {self.wait.total:.6f}",
+            "# HELP valuhub_db_pool_timeouts_total 连接借出超时次数",
+            "# TYPE valuhub_db_pool_timeouts_total counter",
+            f"valuhub_db_pool_timeouts_total{{{label}}} {data['timeouts']}",
+            "# HELP valuhub_db_slow_queries_total 慢查询次数",
+            "# TYPE valuhub_db_slow_queries_total counter",
+            f"valuhub_db_slow_queries_total{{{label}}} {data['slow_queries']}"
+        ]
+        for key in ("checked_out", "overflow", "max_overflow"):
+            if key in data:
+                lines.append(f"# TYPE valuhub_db_pool_{key} gauge")
+                lines.append(f"valuhub_db_pool_{key}{{{label}}} {data[key]}")
+        return lines
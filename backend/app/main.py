@@ -4,17 +4,37 @@ FastAPI + PostgreSQL + Redis
 """
 
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import uvicorn
 
 from app.core.config import settings
-from app.api.v1 import auth, property, valuation, report, data
+from app.core.file_response import CachedStaticFiles
+from app.api.v1 import auth, property, valuation, report, data, files
 from app.api.v2 import valuation as valuation_v2
 from app.api.v2 import model_training
-from app.database.database import engine
+from app.core.metrics import TimedJSONResponse, instrument_engine, metrics
+from app.database.database import async_db_pool_monitor, db_pool_monitor, dispose_async_engine, engine
 from app.middleware.logging_middleware import LoggingMiddleware
+from app.middleware.rate_limit import RateLimitMiddleware
+from app.services.auth_cache import auth_cache
+from app.services.cache import async_cache, cache
+from app.services.health import health_status
+from app.services.report_batch import shutdown_batch_executor
+from app.services.tiered_cache import tiered_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期：关闭时释放异步连接池和批量报告渲染进程
+    """
+    yield
+    await dispose_async_engine()
+    await async_cache.close()
+    shutdown_batch_executor()
+
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -22,9 +42,23 @@ app = FastAPI(
     description="房产价值生态引擎 - 后端API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=TimedJSONResponse,
+    lifespan=lifespan
 )
 
+# 统计SQL执行耗时
+instrument_engine()
+metrics.add_collector(auth_cache.metrics_lines)
+metrics.add_collector(db_pool_monitor.metrics_lines)
+metrics.add_collector(async_db_pool_monitor.metrics_lines)
+metrics.add_collector(cache.stats.metrics_lines)
+metrics.add_collector(async_cache.stats.metrics_lines)
+metrics.add_collector(tiered_cache.metrics_lines)
+
+# 添加限流中间件（位于CORS内层，429响应同样带有CORS头）
+app.add_middleware(RateLimitMiddleware)
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -43,13 +77,14 @@ app.include_router(property.router, prefix="/api/v1/properties", tags=["房产"]
 app.include_router(valuation.router, prefix="/api/v1/valuations", tags=["估价"])
 app.include_router(report.router, prefix="/api/v1/reports", tags=["报告"])
 app.include_router(data.router, prefix="/api/v1/data", tags=["数据"])
+app.include_router(files.router, prefix="/api/v1/files", tags=["文件"])
 
 # 注册v2路由
 app.include_router(valuation_v2.router, tags=["估价-v2"])
 app.include_router(model_training.router, prefix="/api/v2/model-training", tags=["模型训练"])
 
 # 静态文件服务
-app.mount("/media", StaticFiles(directory="media"), name="media")
+app.mount("/media", CachedStaticFiles(directory="media", cache_control=settings.MEDIA_CACHE_CONTROL), name="media")
 
 
 @app.get("/")
@@ -69,12 +104,19 @@ async def root():
 async def health_check():
     """
     健康检查端点
+    数据库不可用时返回503，便于负载均衡摘除实例
     """
-    return {
-        "status": "healthy",
-        "database": "connected",
-        "cache": "connected"
-    }
+    result = await health_status()
+    status_code = 503 if result["status"] == "unhealthy" else 200
+    return JSONResponse(result, status_code=status_code)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus指标端点
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
@@ -1,26 +1,65 @@
-import time
+import json
 import logging
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+import random
+import time
+
+from starlette.datastructures import MutableHeaders
+
+from app.core.config import settings
+from app.core.metrics import end_request_timings, metrics, start_request_timings
 
 logger = logging.getLogger(__name__)
 
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        logger.info(f"Request: {request.method} {request.url}")
-        
-        response = await call_next(request)
-        
-        process_time = (time.time() - start_time) * 1000
-        response.headers["X-Process-Time"] = str(process_time)
-        
-        logger.info(
-            f"Response: {request.method} {request.url} - "
-            f"Status: {response.status_code} - "
-            f"Time: {process_time:.2f}ms"
-        )
-        
-        return response
+class LoggingMiddleware:
+    """
+    请求日志与指标中间件（纯ASGI）
+
+    使用单调时钟统计总耗时及数据库、推理、序列化等分阶段耗时，写入按路由的延迟直方图。
+    结构化JSON日志按 REQUEST_LOG_SAMPLE_RATE 采样，5xx和慢请求始终记录。
+    """
+
+    def __init__(self, app, sample_rate: float = None, slow_ms: float = None):
+        self.app = app
+        self.sample_rate = settings.REQUEST_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.slow_ms = settings.REQUEST_SLOW_MS if slow_ms is None else slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        timings, token = start_request_timings()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                process_time = (time.perf_counter() - start_time) * 1000
+                MutableHeaders(scope=message).append("X-Process-Time", f"{process_time:.2f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            end_request_timings(token)
+
+            # 路由匹配后scope中带有路由对象，使用路由模板作为标签
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.observe(scope["method"], route, status_code, elapsed, timings.phases)
+
+            elapsed_ms = elapsed * 1000
+            if status_code >= 500 or elapsed_ms >= self.slow_ms or random.random() < self.sample_rate:
+                record = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status_code,
+                    "total_ms": round(elapsed_ms, 2)
+                }
+                for phase, seconds in timings.phases.items():
+                    record[f"{phase}_ms"] = round(seconds * 1000, 2)
+                logger.info(json.dumps(record, ensure_ascii=False))
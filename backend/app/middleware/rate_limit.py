@@ -0,0 +1,302 @@
+"""
+ValuHub 限流中间件
+按API Key/租户/用户的令牌桶限流与并发配额，状态保存在Redis，Redis不可用时回退到进程内
+"""
+
+import json
+import logging
+import math
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 令牌桶与并发配额在一次往返内原子完成
+# KEYS: 令牌桶key, 并发集合key
+# ARGV: 速率(个/秒), 桶容量, 最大并发, 请求ID, 并发租约时长(秒)
+# 返回: {是否放行, 重试等待秒数, 拒绝原因}
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_concurrent = tonumber(ARGV[3])
+local lease = tonumber(ARGV[5])
+
+if max_concurrent > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - lease)
+    if redis.call('ZCARD', KEYS[2]) >= max_concurrent then
+        return {0, '1', 'concurrency'}
+    end
+end
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+
+if allowed == 1 and max_concurrent > 0 then
+    redis.call('ZADD', KEYS[2], now, ARGV[4])
+    redis.call('PEXPIRE', KEYS[2], math.ceil(lease * 1000))
+end
+return {allowed, tostring(retry_after), 'rate'}
+"""
+
+
+class RateLimitRule:
+    """
+    路由组限流规则
+    """
+
+    def __init__(self, name: str, prefixes: List[str], rate: float, burst: int, concurrency: int = 0):
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"限流规则{name}的速率必须大于0、桶容量至少为1")
+        self.name = name
+        self.prefixes = tuple(prefixes)
+        self.rate = float(rate)
+        self.burst = int(burst)
+        self.concurrency = int(concurrency)
+
+    @classmethod
+    def from_settings(cls, groups: Dict[str, Dict[str, Any]]) -> List["RateLimitRule"]:
+        """从配置生成规则，前缀越长越优先匹配"""
+        rules = [cls(name, **config) for name, config in groups.items()]
+        return sorted(rules, key=lambda r: -max((len(p) for p in r.prefixes), default=0))
+
+    def matches(self, path: str) -> bool:
+        return path.startswith(self.prefixes)
+
+
+class LocalRateLimitBackend:
+    """
+    进程内限流状态，Redis不可用时使用
+    多进程部署时各进程独立计数
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, List[float]] = {}
+        self._active: Dict[str, int] = {}
+        self._calls = 0
+
+    def acquire(self, bucket_key: str, active_key: str, rule: RateLimitRule, request_id: str) -> Tuple[bool, float, str]:
+        if rule.concurrency and self._active.get(active_key, 0) >= rule.concurrency:
+            return False, 1.0, "concurrency"
+
+        now = time.monotonic()
+        tokens, ts = self._buckets.get(bucket_key, (rule.burst, now))
+        tokens = min(rule.burst, tokens + (now - ts) * rule.rate)
+        if tokens < 1:
+            self._buckets[bucket_key] = [tokens, now]
+            return False, (1 - tokens) / rule.rate, "rate"
+
+        self._buckets[bucket_key] = [tokens - 1, now]
+        if rule.concurrency:
+            self._active[active_key] = self._active.get(active_key, 0) + 1
+
+        self._calls += 1
+        if self._calls % 10000 == 0:
+            self._prune(now)
+        return True, 0.0, "rate"
+
+    def release(self, active_key: str, request_id: str):
+        count = self._active.get(active_key, 0) - 1
+        if count > 0:
+            self._active[active_key] = count
+        else:
+            self._active.pop(active_key, None)
+
+    def _prune(self, now: float):
+        """清理长时间未访问的令牌桶（已自然回满，删除与保留等价）"""
+        stale = [key for key, (_, ts) in self._buckets.items() if now - ts > 3600]
+        for key in stale:
+            del self._buckets[key]
+
+
+class RedisRateLimitBackend:
+    """
+    基于Redis的限流状态，多实例共享
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._script = redis_client.register_script(_ACQUIRE_SCRIPT)
+
+    def acquire(self, bucket_key: str, active_key: str, rule: RateLimitRule, request_id: str) -> Tuple[bool, float, str]:
+        allowed, retry_after, reason = self._script(
+            keys=[bucket_key, active_key],
+            args=[rule.rate, rule.burst, rule.concurrency, request_id, settings.RATE_LIMIT_LEASE_SECONDS]
+        )
+        if isinstance(reason, bytes):
+            reason = reason.decode()
+        return bool(int(allowed)), float(retry_after), reason
+
+    def release(self, active_key: str, request_id: str):
+        self.redis_client.zrem(active_key, request_id)
+
+
+class RateLimitMiddleware:
+    """
+    令牌桶限流与并发配额中间件（纯ASGI）
+
+    请求按路径前缀匹配路由组（估价、导出、模型训练等），在组内按调用方身份
+    （API Key > JWT中的租户/用户 > 客户端IP）分别计数。超限时返回429和Retry-After。
+    只有校验通过的身份单独计数：API Key 需由 api_key_verifier 确认，JWT需签名有效，
+    否则按客户端IP计数，避免每次请求换一个伪造的Key绕过限流。
+    Redis出错后在 RATE_LIMIT_REDIS_RETRY_SECONDS 内改用进程内状态，避免每个请求都等待连接超时。
+    """
+
+    def __init__(
+        self, app, rules: Optional[List[RateLimitRule]] = None, redis_client=None, enabled: Optional[bool] = None,
+        api_key_verifier: Optional[Callable[[str], Optional[str]]] = None
+    ):
+        """
+        Args:
+            api_key_verifier: 校验API Key，有效时返回Key的标识（如Key ID），无效时返回None；
+                在请求路径上同步调用，应使用缓存。未配置时API Key不单独计数
+        """
+        self.app = app
+        self.api_key_verifier = api_key_verifier
+        self.rules = rules if rules is not None else RateLimitRule.from_settings(settings.RATE_LIMIT_GROUPS)
+        self.enabled = settings.RATE_LIMIT_ENABLED if enabled is None else enabled
+        self.local = LocalRateLimitBackend()
+        self.redis: Optional[RedisRateLimitBackend] = None
+        self._redis_down_until = 0.0
+
+        if redis_client is None and self.enabled:
+            try:
+                from app.services.cache import cache
+                redis_client = cache.redis_client
+            except Exception as e:
+                logger.warning("限流中间件无法获取Redis连接，使用进程内状态: %s", e)
+        if redis_client is not None:
+            self.redis = RedisRateLimitBackend(redis_client)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        rule = self._match(scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        identity = self._identity(scope)
+        bucket_key = f"ratelimit:{rule.name}:{identity}:bucket"
+        active_key = f"ratelimit:{rule.name}:{identity}:active"
+        request_id = uuid.uuid4().hex
+
+        backend, (allowed, retry_after, reason) = await self._acquire(bucket_key, active_key, rule, request_id)
+        if not allowed:
+            await self._reject(send, rule, retry_after, reason)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if rule.concurrency:
+                await self._release(backend, active_key, request_id)
+
+    def _match(self, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if rule.matches(path):
+                return rule
+        return None
+
+    def _verified_key(self, api_key: str) -> Optional[str]:
+        """API Key校验通过时返回计数用的身份"""
+        if self.api_key_verifier is None or not api_key:
+            return None
+        try:
+            key_id = self.api_key_verifier(api_key)
+        except Exception as e:
+            logger.warning("API Key校验失败，按客户端IP限流: %s", e)
+            return None
+        return f"key:{key_id}" if key_id is not None else None
+
+    def _identity(self, scope) -> str:
+        """解析调用方身份，未通过校验的Key和令牌按客户端IP计数"""
+        headers = dict(scope.get("headers") or [])
+
+        api_key = headers.get(b"x-api-key")
+        if api_key:
+            identity = self._verified_key(api_key.decode("latin-1"))
+            if identity:
+                return identity
+
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[7:].strip()
+            try:
+                payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+                if payload.get("tenant_id") is not None:
+                    return f"tenant:{payload['tenant_id']}"
+                if payload.get("sub") is not None:
+                    return f"user:{payload['sub']}"
+            except JWTError:
+                # SDK以Bearer方式传递API Key
+                identity = self._verified_key(token)
+                if identity:
+                    return identity
+
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, error: Exception):
+        logger.warning("限流Redis不可用，%d秒内使用进程内状态: %s", settings.RATE_LIMIT_REDIS_RETRY_SECONDS, error)
+        self._redis_down_until = time.monotonic() + settings.RATE_LIMIT_REDIS_RETRY_SECONDS
+
+    async def _acquire(self, bucket_key: str, active_key: str, rule: RateLimitRule, request_id: str):
+        if self._redis_available():
+            try:
+                result = await run_in_threadpool(self.redis.acquire, bucket_key, active_key, rule, request_id)
+                return self.redis, result
+            except Exception as e:
+                self._mark_redis_down(e)
+        return self.local, self.local.acquire(bucket_key, active_key, rule, request_id)
+
+    async def _release(self, backend, active_key: str, request_id: str):
+        if backend is self.local:
+            self.local.release(active_key, request_id)
+            return
+        try:
+            await run_in_threadpool(backend.release, active_key, request_id)
+        except Exception as e:
+            # 释放失败时租约会在 RATE_LIMIT_LEASE_SECONDS 后自动过期
+            self._mark_redis_down(e)
+
+    @staticmethod
+    async def _reject(send, rule: RateLimitRule, retry_after: float, reason: str):
+        message = "并发请求过多，请稍后重试" if reason == "concurrency" else "请求过于频繁，请稍后重试"
+        body = json.dumps({"detail": message}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+                (b"x-ratelimit-group", rule.name.encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
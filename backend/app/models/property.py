@@ -2,12 +2,14 @@
 ValuHub 房产模型
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Numeric, ForeignKey, Index
 from sqlalchemy.sql.sqltype import TIMESTAMP
+from sqlalchemy import event
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
 from app.database.database import Base
+from app.services.geo import encode_geohash
 
 
 class Property(Base):
@@ -15,6 +17,12 @@ class Property(Base):
     房产表
     """
     __tablename__ = "properties"
+    __table_args__ = (
+        # 列表筛选复合索引
+        Index("ix_properties_city_district_type", "city", "district", "property_type"),
+        # 游标分页索引
+        Index("ix_properties_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
@@ -32,8 +40,9 @@ class Property(Base):
     decoration_status = Column(String(20))
     latitude = Column(Numeric(10, 8))
     longitude = Column(Numeric(11, 8))
+    geohash = Column(String(12), index=True)  # 由经纬度自动计算，用于空间检索
     status = Column(String(20), default="active", index=True)
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)  # 游标分页的排序键，不允许为空
     updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 关系
@@ -59,7 +68,18 @@ class Property(Base):
             "decoration_status": self.decoration_status,
             "latitude": float(self.latitude) if self.latitude else None,
             "longitude": float(self.longitude) if self.longitude else None,
+            "geohash": self.geohash,
             "status": self.status,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
+
+
+@event.listens_for(Property, "before_insert")
+@event.listens_for(Property, "before_update")
+def _update_geohash(mapper, connection, target):
+    """写入前根据经纬度维护geohash"""
+    if target.latitude is not None and target.longitude is not None:
+        target.geohash = encode_geohash(float(target.latitude), float(target.longitude))
+    else:
+        target.geohash = None
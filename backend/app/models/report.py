@@ -2,7 +2,7 @@
 ValuHub 报告模型
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Index
 from sqlalchemy.sql.sqltype import TIMESTAMP
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -15,6 +15,10 @@ class Report(Base):
     报告表
     """
     __tablename__ = "reports"
+    __table_args__ = (
+        # 游标分页索引
+        Index("ix_reports_user_id_created_at", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     valuation_id = Column(Integer, ForeignKey("valuations.id"), index=True)
@@ -23,8 +27,9 @@ class Report(Base):
     file_url = Column(String(255))
     file_name = Column(String(255))
     file_size = Column(Integer)
+    content_hash = Column(String(64), index=True)  # 报告文件的内容哈希（report_store中的键），同时作为下载的ETag
     status = Column(String(20), default="pending", index=True)  # 'pending', 'generating', 'completed', 'failed'
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)  # 游标分页的排序键，不允许为空
     completed_at = Column(TIMESTAMP)
     
     # 关系
@@ -41,6 +46,7 @@ class Report(Base):
             "file_url": self.file_url,
             "file_name": self.file_name,
             "file_size": self.file_size,
+            "content_hash": self.content_hash,
             "status": self.status,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "completed_at": self.completed_at.isoformat() if self.completed_at else None
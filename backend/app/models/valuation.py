@@ -2,7 +2,7 @@
 ValuHub 估价模型
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Numeric, ForeignKey, JSON, Text
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, ForeignKey, JSON, Text, Index
 from sqlalchemy.sql.sqltype import TIMESTAMP
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -15,6 +15,11 @@ class Valuation(Base):
     估价记录表
     """
     __tablename__ = "valuations"
+    __table_args__ = (
+        # 游标分页索引：按用户/房产筛选后按 (created_at, id) 倒序
+        Index("ix_valuations_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_valuations_property_id_created_at", "property_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     property_id = Column(Integer, ForeignKey("properties.id"), index=True)
@@ -26,7 +31,7 @@ class Valuation(Base):
     model_version = Column(String(50))  # 模型版本
     features = Column(JSON)  # 估价特征
     result_details = Column(JSON)  # 详细结果
-    created_at = Column(TIMESTAMP, default=datetime.utcnow, index=True)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False, index=True)  # 游标分页的排序键，不允许为空
     
     # 关系
     property = relationship("Property", back_populates="valuations")
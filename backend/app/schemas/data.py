@@ -28,7 +28,9 @@ class DataExportRequest(BaseModel):
     data_type: str = Field(..., description="数据类型：properties, valuations, reports")
     start_date: Optional[str] = Field(None, description="开始日期")
     end_date: Optional[str] = Field(None, description="结束日期")
-    format: str = Field(default="csv", description="导出格式：csv, excel, json")
+    format: str = Field(default="csv", description="导出格式：csv, parquet, ndjson")
+    compress: bool = Field(default=False, description="是否gzip压缩（parquet自带压缩）")
+    stream: bool = Field(default=False, description="是否直接流式返回文件内容")
 
 
 class DataExportResponse(BaseModel):
@@ -39,3 +41,6 @@ class DataExportResponse(BaseModel):
     file_name: str
     file_size: int
     download_url: str
+    row_count: int = 0
+    elapsed_ms: float = 0
+    rows_per_second: float = 0
@@ -103,6 +103,13 @@ class PropertySearch(BaseModel):
     page_size: int = Field(20, ge=1, le=100, description="每页数量")
 
 
+class PropertyGeoResponse(PropertyResponse):
+    """
+    空间检索房产响应模型
+    """
+    distance_m: Optional[float] = Field(None, description="与查询中心的距离（米），矩形查询时为空")
+
+
 class PropertyBatchImport(BaseModel):
     """
     批量导入房产请求模型
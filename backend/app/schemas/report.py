@@ -3,7 +3,7 @@ ValuHub 报告数据模型
 """
 
 from pydantic import BaseModel, Field, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from enum import Enum
 
@@ -33,6 +33,14 @@ class ReportGenerateRequest(BaseModel):
     template_id: Optional[int] = Field(None, description="报告模板ID")
 
 
+class ReportBatchRequest(BaseModel):
+    """
+    批量生成报告请求模型
+    """
+    valuation_ids: List[int] = Field(..., min_length=1, description="估价ID列表，按此顺序写入ZIP")
+    template_id: Optional[int] = Field(None, description="报告模板ID")
+
+
 class ReportResponse(BaseModel):
     """
     报告响应模型
@@ -41,9 +49,9 @@ class ReportResponse(BaseModel):
     valuation_id: int
     user_id: int
     template_id: Optional[int]
-    file_url: str
-    file_name: str
-    file_size: int
+    file_url: Optional[str]  # 生成完成前为空
+    file_name: Optional[str]
+    file_size: Optional[int]
     status: ReportStatus
     created_at: Optional[str]
     completed_at: Optional[str]
@@ -56,7 +64,10 @@ class ReportTemplateCreate(BaseModel):
     name: str = Field(..., max_length=100, description="模板名称")
     description: Optional[str] = Field(None, description="模板描述")
     template_type: ReportTemplateType = Field(default=ReportTemplateType.STANDARD, description="模板类型")
-    template_content: Optional[dict] = Field(None, description="模板内容")
+    template_content: Optional[dict] = Field(
+        None,
+        description="模板内容，html 为Jinja模板源码，可 {% extends \"valuation_report.html\" %} 后覆盖 content、disclaimer 等区块"
+    )
     is_default: bool = Field(False, description="是否为默认模板")
 
 
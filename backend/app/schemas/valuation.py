@@ -12,7 +12,7 @@ class ValuationCreate(BaseModel):
     创建估价请求模型
     """
     property_id: int = Field(..., description="房产ID")
-    model_type: Optional[str] = Field(None, description="估价模型类型", regex="^(linear|random_forest|ensemble)$")
+    model_type: Optional[str] = Field(None, description="估价模型类型", regex="^(linear|random_forest|ensemble|market_comparison)$")
 
 
 class ValuationResponse(BaseModel):
@@ -36,7 +36,7 @@ class ValuationBatchCreate(BaseModel):
     批量估价请求模型
     """
     property_ids: list[int] = Field(..., description="房产ID列表")
-    model_type: Optional[str] = Field(None, description="估价模型类型", regex="^(linear|random_forest|ensemble)$")
+    model_type: Optional[str] = Field(None, description="估价模型类型", regex="^(linear|random_forest|ensemble|market_comparison)$")
 
 
 class MarketTrendRequest(BaseModel):
@@ -59,3 +59,15 @@ class MarketTrendResponse(BaseModel):
     property_type: Optional[str]
     trend_data: list[dict]
     summary: dict
+
+
+class ComparablesResponse(BaseModel):
+    """
+    可比案例检索响应模型
+    """
+    property_id: int
+    estimated_price: float
+    price_per_sqm: float
+    confidence_level: float
+    model_version: str
+    similar_cases: list[dict]
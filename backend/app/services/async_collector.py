@@ -0,0 +1,321 @@
+"""
+ValuHub 并发数据采集
+基于httpx的异步采集：按主机限制并发和请求速率、失败退避重试、ETag/Last-Modified条件请求
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 离线模拟数据源使用的地址，DATA_SOURCE_BASE_URL 未配置时使用
+SIMULATED_BASE_URL = "http://simulated-market.local"
+
+# 可重试的响应状态
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# 服务端返回304、但本进程没有保存上次的数据（校验信息来自持久化的检查点）
+NOT_MODIFIED = object()
+
+CITY_AVERAGE_PRICES = {
+    "北京": 85000,
+    "上海": 92000,
+    "广州": 78000,
+    "深圳": 105000,
+    "长沙": 13038,
+    "杭州": 55000,
+    "成都": 18000,
+    "武汉": 16000
+}
+
+
+def city_average_price(city: str) -> float:
+    """城市平均房价（模拟数据）"""
+    return CITY_AVERAGE_PRICES.get(city, 7500)
+
+
+def city_communities(city: str) -> List[Tuple[str, str]]:
+    """
+    城市需要采集的 (区域, 小区) 列表（模拟数据，每个区域10个小区）
+    """
+    districts = ["朝阳区", "海淀区", "东城区", "西城区"] if city == "北京" else ["天河区", "越秀区", "海珠区", "荔湾区"]
+    return [(district, f"{district}小区{i + 1}") for district in districts for i in range(10)]
+
+
+def simulated_community_data(city: str, district: str, community: str, version: int = 0) -> Dict[str, Any]:
+    """生成模拟的小区数据，version 每增加1，均价上浮千分之一"""
+    return {
+        "community_name": community,
+        "city": city,
+        "district": district,
+        "average_price": city_average_price(city) * (1 + (len(community) % 10) / 100) * (1 + version / 1000),
+        "total_houses": 1000 + (len(community) % 500),
+        "completed_year": 2000 + (len(community) % 20),
+        "house_types": ["2室1厅", "3室1厅", "3室2厅", "4室2厅"],
+        "average_rent": 50 * (len(community) % 10 + 1),
+        "nearby_facilities": ["地铁", "超市", "医院", "学校"],
+        "transaction_count": 15 + (len(community) % 10),
+        "price_trend": "稳中有升",
+        "market_analysis": f"{city}{district}区域{community}小区近3个月成交活跃，市场需求旺盛。"
+    }
+
+
+def community_path(city: str, district: str, community: str) -> str:
+    """小区数据接口路径"""
+    return f"/cities/{quote(city)}/districts/{quote(district)}/communities/{quote(community)}"
+
+
+class SimulatedMarketTransport(httpx.AsyncBaseTransport):
+    """
+    离线模拟数据源
+
+    按路径生成模拟小区数据，带ETag，命中 If-None-Match 时返回304。
+    提供变更feed（/cities/{city}/changes?since=N），touch() 模拟小区数据更新。
+    未配置真实数据源时使用，也用于离线测试。
+    """
+
+    def __init__(self, latency: float = None):
+        self.latency = settings.COLLECTOR_SIMULATED_LATENCY if latency is None else latency
+        self.requests = 0
+        self.versions: Dict[Tuple[str, str, str], int] = {}
+        self.changes: List[Dict[str, Any]] = []
+
+    def touch(self, city: str, district: str, community: str):
+        """模拟一次小区数据更新"""
+        key = (city, district, community)
+        self.versions[key] = self.versions.get(key, 0) + 1
+        self.changes.append({
+            "id": len(self.changes) + 1,
+            "city": city,
+            "district": district,
+            "community": community,
+            "updated_at": time.time()
+        })
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        parts = request.url.path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "cities" and parts[2] == "changes":
+            since = int(request.url.params.get("since", 0))
+            changes = [c for c in self.changes if c["city"] == parts[1] and c["id"] > since]
+            return httpx.Response(200, json={"changes": changes, "cursor": len(self.changes)})
+        if len(parts) != 6 or parts[0] != "cities" or parts[2] != "districts" or parts[4] != "communities":
+            return httpx.Response(404, json={"detail": "not found"})
+
+        version = self.versions.get((parts[1], parts[3], parts[5]), 0)
+        data = simulated_community_data(parts[1], parts[3], parts[5], version)
+        body = json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if request.headers.get("if-none-match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, content=body, headers={"ETag": etag, "Content-Type": "application/json"})
+
+
+class HostThrottle:
+    """
+    单个主机的并发与速率限制
+
+    同时进行的请求不超过 max_concurrency，相邻请求的发出间隔不小于 1/rate 秒。
+    依赖事件循环，每次采集运行时新建。
+    """
+
+    def __init__(self, max_concurrency: int, rate: float):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.interval:
+            loop = asyncio.get_running_loop()
+            async with self._lock:
+                now = loop.time()
+                delay = self._next_slot - now
+                self._next_slot = max(now, self._next_slot) + self.interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+class AsyncMarketDataCollector:
+    """
+    并发采集小区数据
+
+    同一次运行内所有城市共用一个连接池，请求按主机限流。
+    条件请求的校验信息（ETag、Last-Modified）保存在 validators 中，跨运行复用，
+    数据未变化时服务端返回304，直接使用上次的数据。
+    """
+
+    def __init__(
+        self,
+        base_url: str = None,
+        transport: httpx.AsyncBaseTransport = None,
+        max_per_host: int = None,
+        rate_per_host: float = None,
+        max_retries: int = None,
+        backoff_base: float = None,
+        timeout: float = None
+    ):
+        self.base_url = base_url or settings.DATA_SOURCE_BASE_URL or SIMULATED_BASE_URL
+        if transport is None and self.base_url == SIMULATED_BASE_URL:
+            transport = SimulatedMarketTransport()
+        self.transport = transport
+        self.max_per_host = max_per_host or settings.COLLECTOR_MAX_PER_HOST
+        self.rate_per_host = settings.COLLECTOR_RATE_PER_HOST if rate_per_host is None else rate_per_host
+        self.max_retries = settings.COLLECTOR_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = settings.COLLECTOR_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.timeout = timeout or settings.COLLECTOR_TIMEOUT
+
+        # URL -> {"etag", "last_modified", "data"}
+        self.validators: Dict[str, Dict[str, Any]] = {}
+        self.stats: Dict[str, int] = {"requests": 0, "not_modified": 0, "retries": 0, "failures": 0}
+        self._throttles: Dict[str, HostThrottle] = {}
+
+    def client(self) -> httpx.AsyncClient:
+        """创建采集用的HTTP客户端"""
+        limits = httpx.Limits(max_connections=self.max_per_host * 4, max_keepalive_connections=self.max_per_host)
+        return httpx.AsyncClient(
+            transport=self.transport,
+            timeout=self.timeout,
+            limits=limits,
+            headers={"User-Agent": settings.COLLECTOR_USER_AGENT}
+        )
+
+    def reset_throttles(self):
+        """清空限流器，每次运行（新的事件循环）开始前调用"""
+        self._throttles = {}
+
+    def _throttle(self, host: str) -> HostThrottle:
+        throttle = self._throttles.get(host)
+        if throttle is None:
+            throttle = self._throttles[host] = HostThrottle(self.max_per_host, self.rate_per_host)
+        return throttle
+
+    async def fetch_json(self, client: httpx.AsyncClient, path: str, allow_not_modified: bool = False) -> Any:
+        """
+        获取JSON数据，带条件请求和退避重试
+
+        Args:
+            allow_not_modified: 304且本进程没有上次数据（校验信息来自检查点）时返回 NOT_MODIFIED，
+                只有能自行处理未变化记录的调用方（增量采集）才应开启；否则去掉条件头重新请求
+
+        Returns:
+            解析后的数据，或 NOT_MODIFIED（见 allow_not_modified）
+
+        Raises:
+            httpx.HTTPError: 重试耗尽后仍失败
+        """
+        url = self.base_url.rstrip("/") + path
+        cached = self.validators.get(url)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        throttle = self._throttle(httpx.URL(url).host)
+        attempt = 0
+        while True:
+            try:
+                async with throttle:
+                    self.stats["requests"] += 1
+                    response = await client.get(url, headers=headers)
+                if response.status_code == 304 and cached:
+                    self.stats["not_modified"] += 1
+                    if "data" in cached:
+                        return cached["data"]
+                    if allow_not_modified:
+                        return NOT_MODIFIED
+                    # 没有可复用的数据，不带条件头重新请求完整内容
+                    cached, headers = None, {}
+                    continue
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    data = response.json()
+                    self._remember(url, response, data)
+                    return data
+                error: Exception = httpx.HTTPStatusError(
+                    f"{response.status_code} {url}", request=response.request, response=response
+                )
+                retry_after = self._retry_after(response)
+            except httpx.TransportError as e:
+                error, retry_after = e, None
+
+            if attempt >= self.max_retries:
+                self.stats["failures"] += 1
+                raise error
+            attempt += 1
+            self.stats["retries"] += 1
+            delay = retry_after if retry_after is not None else self.backoff_base * 2 ** (attempt - 1)
+            # 加入随机抖动，避免多个请求同时重试
+            await asyncio.sleep(min(delay, 60) * (0.5 + random.random() / 2))
+
+    def _remember(self, url: str, response: httpx.Response, data: Any):
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if etag or last_modified:
+            self.validators[url] = {"etag": etag, "last_modified": last_modified, "data": data}
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+
+    async def collect_city(self, client: httpx.AsyncClient, city: str) -> List[Dict[str, Any]]:
+        """并发采集一个城市的所有小区，结果顺序与 city_communities 一致"""
+        tasks = [
+            self.fetch_json(client, community_path(city, district, community))
+            for district, community in city_communities(city)
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # 任一小区失败则整个城市视为失败，避免用不完整的列表覆盖缓存
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return list(results)
+
+    async def collect_cities(self, cities: Sequence[str]) -> Dict[str, Any]:
+        """
+        并行采集多个城市
+
+        Returns:
+            城市 -> 小区数据列表；采集失败的城市对应异常对象
+        """
+        self.reset_throttles()
+        async with self.client() as client:
+            results = await asyncio.gather(
+                *(self.collect_city(client, city) for city in cities),
+                return_exceptions=True
+            )
+        return dict(zip(cities, results))
+
+    def run(self, cities: Sequence[str]) -> Dict[str, Any]:
+        """同步入口（Celery任务、脚本中调用）"""
+        return asyncio.run(self.collect_cities(cities))
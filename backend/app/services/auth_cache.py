@@ -0,0 +1,236 @@
+"""
+ValuHub 认证缓存
+已验证令牌到用户快照的两级缓存（进程内LRU + Redis）
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.config import settings
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# 快照不包含密码哈希，避免写入Redis；访问时按需从数据库加载
+_SNAPSHOT_COLUMNS = [c for c in User.__table__.columns if c.name != "password_hash"]
+
+
+def token_digest(token: str) -> str:
+    """令牌摘要，作为缓存key，避免明文令牌出现在Redis中"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def user_snapshot(user: User) -> Dict[str, Any]:
+    """生成可JSON序列化的用户快照"""
+    snapshot = {}
+    for column in _SNAPSHOT_COLUMNS:
+        value = getattr(user, column.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        snapshot[column.key] = value
+    return snapshot
+
+
+def _restore_user(snapshot: Dict[str, Any]) -> User:
+    """由快照构造与会话无关的User对象"""
+    values = {}
+    for column in _SNAPSHOT_COLUMNS:
+        value = snapshot.get(column.key)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        values[column.key] = value
+    return User(**values)
+
+
+class AuthCache:
+    """
+    令牌 -> 用户快照缓存
+
+    一级为进程内LRU，二级为Redis，条目有效期不超过 AUTH_CACHE_TTL 和令牌剩余有效期。
+    用户资料或状态变更时删除该用户的全部条目；其他进程的一级缓存在TTL内过期。
+    """
+
+    def __init__(self, maxsize: int = None, ttl: int = None, redis_cache=None):
+        self.maxsize = maxsize or settings.AUTH_CACHE_SIZE
+        self.ttl = ttl or settings.AUTH_CACHE_TTL
+        self._redis_cache = redis_cache
+        self._local: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._user_tokens: Dict[int, set] = {}
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @property
+    def redis(self):
+        if self._redis_cache is None:
+            from app.services.cache import cache
+            self._redis_cache = cache
+        return self._redis_cache
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        查询令牌对应的用户快照
+
+        Args:
+            token: 访问令牌
+
+        Returns:
+            用户快照，未命中时为None
+        """
+        digest = token_digest(token)
+        now = time.time()
+
+        with self._lock:
+            entry = self._local.get(digest)
+            if entry is not None:
+                expires_at, _, snapshot = entry
+                if expires_at > now:
+                    self._local.move_to_end(digest)
+                    self.local_hits += 1
+                    return snapshot
+                self._pop_local(digest)
+
+        if settings.AUTH_CACHE_REDIS_ENABLED:
+            cached = self.redis.get(f"auth:token:{digest}")
+            if cached and cached.get("expires_at", 0) > now:
+                self._put_local(digest, cached["expires_at"], cached["user"])
+                self.redis_hits += 1
+                return cached["user"]
+
+        self.misses += 1
+        return None
+
+    def set(self, token: str, user: User, token_exp: Optional[float] = None):
+        """
+        缓存已验证的令牌
+
+        Args:
+            token: 访问令牌
+            user: 用户对象
+            token_exp: 令牌过期时间戳（JWT的exp）
+        """
+        digest = token_digest(token)
+        now = time.time()
+        expires_at = now + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, float(token_exp))
+        if expires_at <= now:
+            return
+
+        snapshot = user_snapshot(user)
+        self._put_local(digest, expires_at, snapshot)
+
+        if settings.AUTH_CACHE_REDIS_ENABLED:
+            ttl = max(1, int(expires_at - now))
+            self.redis.set(f"auth:token:{digest}", {"expires_at": expires_at, "user": snapshot}, expire=ttl)
+            try:
+                tokens_key = f"auth:user:{user.id}:tokens"
+                self.redis.redis_client.sadd(tokens_key, digest)
+                self.redis.redis_client.expire(tokens_key, self.ttl)
+            except Exception as e:
+                logger.warning("认证缓存写入Redis失败: %s", e)
+
+    def invalidate_token(self, token: str):
+        """删除单个令牌的缓存（登出时调用）"""
+        digest = token_digest(token)
+        with self._lock:
+            self._pop_local(digest)
+        if settings.AUTH_CACHE_REDIS_ENABLED:
+            self.redis.delete(f"auth:token:{digest}")
+
+    def invalidate_user(self, user_id: int):
+        """删除用户全部令牌的缓存（资料、状态变更时调用）"""
+        with self._lock:
+            for digest in list(self._user_tokens.get(user_id, ())):
+                self._pop_local(digest)
+
+        if settings.AUTH_CACHE_REDIS_ENABLED:
+            try:
+                client = self.redis.redis_client
+                tokens_key = f"auth:user:{user_id}:tokens"
+                digests = client.smembers(tokens_key)
+                keys = [f"auth:token:{digest.decode()}" for digest in digests] + [tokens_key]
+                client.delete(*keys)
+            except Exception as e:
+                logger.warning("认证缓存清理Redis失败: %s", e)
+
+    def clear(self):
+        """清空进程内缓存和计数"""
+        with self._lock:
+            self._local.clear()
+            self._user_tokens.clear()
+        self.local_hits = self.redis_hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计"""
+        total = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.local_hits + self.redis_hits) / total, 4) if total else 0.0,
+            "size": len(self._local)
+        }
+
+    def metrics_lines(self) -> List[str]:
+        """Prometheus指标"""
+        lines = [
+            "# HELP valuhub_auth_cache_requests_total 认证缓存查询次数",
+            "# TYPE valuhub_auth_cache_requests_total counter"
+        ]
+        for result, count in (("local_hit", self.local_hits), ("redis_hit", self.redis_hits), ("miss", self.misses)):
+            lines.append(f'valuhub_auth_cache_requests_total{{result="{result}"}} {count}')
+        return lines
+
+    def _put_local(self, digest: str, expires_at: float, snapshot: Dict[str, Any]):
+        user_id = snapshot["id"]
+        with self._lock:
+            self._local[digest] = (expires_at, user_id, snapshot)
+            self._local.move_to_end(digest)
+            self._user_tokens.setdefault(user_id, set()).add(digest)
+            while len(self._local) > self.maxsize:
+                oldest = next(iter(self._local))
+                self._pop_local(oldest)
+
+    def _pop_local(self, digest: str):
+        """调用方需持有锁"""
+        entry = self._local.pop(digest, None)
+        if entry is None:
+            return
+        tokens = self._user_tokens.get(entry[1])
+        if tokens is not None:
+            tokens.discard(digest)
+            if not tokens:
+                del self._user_tokens[entry[1]]
+
+
+def attach_user(db: Session, snapshot: Dict[str, Any]) -> User:
+    """
+    将快照作为持久化对象关联到当前会话
+
+    不执行SELECT；后续修改（如更新资料）仍会正常写回数据库，
+    快照中没有的列（密码哈希）在访问时按需加载。
+    """
+    user = _restore_user(snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+# 全局认证缓存
+auth_cache = AuthCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user_cache(mapper, connection, target):
+    """用户资料、状态变更或删除时清理缓存"""
+    auth_cache.invalidate_user(target.id)
@@ -1,68 +1,380 @@
-import redis
+"""
+ValuHub Redis缓存
+共享连接池、批量读写（MGET / 管道写入）、可选msgpack/orjson编码与压缩，以及按操作的延迟统计
+"""
+
 import json
+import logging
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence
+
+import redis
+import redis.asyncio as aioredis
+
 from app.core.config import settings
-from typing import Optional, Any
+from app.core.metrics import LatencyHistogram
 
-class RedisCache:
-    """Redis缓存服务类"""
-    
-    def __init__(self):
-        """初始化Redis连接"""
-        self.redis_client = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            password=settings.REDIS_PASSWORD,
-            db=settings.REDIS_DB,
-            decode_responses=True
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时使用标准库json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack为可选依赖，缺失时回退到JSON编码
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# 编码后的值以魔数开头，后跟一个标志字节；不以魔数开头的值按旧版JSON文本解析。
+# 0xc1 在msgpack中未使用，也不是合法的UTF-8首字节，不会与旧数据混淆
+_MAGIC = b"\xc1"
+_FLAG_MSGPACK = 0x01
+_FLAG_ZLIB = 0x02
+
+
+class CacheSerializer:
+    """
+    缓存值编解码
+
+    编码方式由 CACHE_CODEC 决定（json 或 msgpack），编码结果超过
+    CACHE_COMPRESS_THRESHOLD 字节时用zlib压缩。解码按标志字节进行，
+    切换编码方式后旧值仍可读取。
+    """
+
+    def __init__(self, codec: str = None, compress_threshold: int = None, compress_level: int = None):
+        codec = codec or settings.CACHE_CODEC
+        if codec == "msgpack" and msgpack is None:
+            logger.warning("未安装msgpack，缓存改用JSON编码")
+            codec = "json"
+        self.codec = codec
+        self.compress_threshold = (
+            settings.CACHE_COMPRESS_THRESHOLD if compress_threshold is None else compress_threshold
         )
-    
+        self.compress_level = settings.CACHE_COMPRESS_LEVEL if compress_level is None else compress_level
+
+    def dumps(self, value: Any) -> bytes:
+        """编码缓存值"""
+        flags = 0
+        if self.codec == "msgpack":
+            body = msgpack.packb(value, use_bin_type=True)
+            flags |= _FLAG_MSGPACK
+        elif orjson is not None:
+            body = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            body = json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+        if self.compress_threshold and len(body) >= self.compress_threshold:
+            body = zlib.compress(body, self.compress_level)
+            flags |= _FLAG_ZLIB
+
+        return _MAGIC + bytes((flags,)) + body
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        """解码缓存值"""
+        if not data.startswith(_MAGIC):
+            return json.loads(data)
+
+        flags = data[1]
+        body = data[2:]
+        if flags & _FLAG_ZLIB:
+            body = zlib.decompress(body)
+        if flags & _FLAG_MSGPACK:
+            return msgpack.unpackb(body, raw=False)
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+class CacheStats:
+    """
+    按操作的调用次数、错误数和延迟直方图
+
+    同步客户端在线程池中并发调用，更新时加锁
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, op: str, seconds: float, error: bool = False):
+        with self._lock:
+            histogram = self.latency.get(op)
+            if histogram is None:
+                histogram = self.latency[op] = LatencyHistogram()
+            histogram.observe(seconds)
+            if error:
+                self.errors[op] = self.errors.get(op, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各操作的次数、错误数、平均和累计耗时"""
+        with self._lock:
+            return {
+                op: {
+                    "count": histogram.count,
+                    "errors": self.errors.get(op, 0),
+                    "avg_ms": round(histogram.total / histogram.count * 1000, 3) if histogram.count else 0.0,
+                    "total_ms": round(histogram.total * 1000, 3)
+                }
+                for op, histogram in self.latency.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self.latency.clear()
+            self.errors.clear()
+
+    def metrics_lines(self) -> List[str]:
+        """Prometheus指标"""
+        lines = [
+            "# HELP valuhub_cache_operation_seconds Redis缓存操作耗时",
+            "# TYPE valuhub_cache_operation_seconds summary"
+        ]
+        errors = [
+            "# HELP valuhub_cache_operation_errors_total Redis缓存操作错误数",
+            "# TYPE valuhub_cache_operation_errors_total counter"
+        ]
+        with self._lock:
+            for op, histogram in sorted(self.latency.items()):
+                labels = f'client="{self.name}",op="{op}"'
+                lines.append(f"valuhub_cache_operation_seconds_sum{{{labels}}} {histogram.total:.6f}")
+                lines.append(f"valuhub_cache_operation_seconds_count{{{labels}}} {histogram.count}")
+                errors.append(f"valuhub_cache_operation_errors_total{{{labels}}} {self.errors.get(op, 0)}")
+        return lines + errors
+
+
+def _connection_kwargs() -> Dict[str, Any]:
+    return {
+        "host": settings.REDIS_HOST,
+        "port": settings.REDIS_PORT,
+        "password": settings.REDIS_PASSWORD or None,
+        "db": settings.REDIS_DB,
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "health_check_interval": 30
+    }
+
+
+class RedisCache:
+    """
+    Redis缓存服务类
+
+    所有操作共享同一个连接池；客户端不解码响应，值以字节形式读写，
+    由 CacheSerializer 负责编解码。Redis出错时读操作返回空、写操作返回False，不向调用方抛出。
+    """
+
+    def __init__(self, pool: redis.ConnectionPool = None, serializer: CacheSerializer = None):
+        """初始化Redis连接池"""
+        self.pool = pool or redis.ConnectionPool(**_connection_kwargs())
+        self.redis_client = redis.Redis(connection_pool=self.pool)
+        self.serializer = serializer or CacheSerializer()
+        self.stats = CacheStats("sync")
+
+    @contextmanager
+    def _timed(self, op: str) -> Iterator[None]:
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.stats.observe(op, time.perf_counter() - started, error)
+
     def get(self, key: str) -> Optional[Any]:
         """获取缓存数据"""
         try:
-            data = self.redis_client.get(key)
-            if data:
-                return json.loads(data)
-            return None
+            with self._timed("get"):
+                data = self.redis_client.get(key)
+            return self.serializer.loads(data) if data else None
         except Exception as e:
-            print(f"Redis get error: {e}")
+            logger.warning("Redis get error: %s", e)
             return None
-    
+
     def set(self, key: str, value: Any, expire: int = None) -> bool:
         """设置缓存数据"""
         try:
-            expire_time = expire or settings.CACHE_EXPIRE_TIME
-            return self.redis_client.setex(
-                key, 
-                expire_time, 
-                json.dumps(value, ensure_ascii=False)
-            )
+            data = self.serializer.dumps(value)
+            with self._timed("set"):
+                return bool(self.redis_client.setex(key, expire or settings.CACHE_EXPIRE_TIME, data))
         except Exception as e:
-            print(f"Redis set error: {e}")
+            logger.warning("Redis set error: %s", e)
             return False
-    
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        """
+        批量获取缓存数据，一次往返
+
+        Returns:
+            与keys顺序一致的值列表，不存在的key对应None
+        """
+        if not keys:
+            return []
+        try:
+            with self._timed("mget"):
+                values = self.redis_client.mget(keys)
+            return [self.serializer.loads(data) if data else None for data in values]
+        except Exception as e:
+            logger.warning("Redis mget error: %s", e)
+            return [None] * len(keys)
+
+    def mset(self, mapping: Mapping[str, Any], expire: int = None) -> bool:
+        """
+        批量设置缓存数据
+
+        MSET不支持过期时间，改用非事务管道发送 SET EX，
+        每 CACHE_PIPELINE_BATCH_SIZE 条执行一次，避免单次请求过大
+        """
+        if not mapping:
+            return True
+        expire = expire or settings.CACHE_EXPIRE_TIME
+        try:
+            items = [(key, self.serializer.dumps(value)) for key, value in mapping.items()]
+            batch_size = settings.CACHE_PIPELINE_BATCH_SIZE
+            with self._timed("mset"):
+                with self.redis_client.pipeline(transaction=False) as pipe:
+                    for start in range(0, len(items), batch_size):
+                        for key, data in items[start:start + batch_size]:
+                            pipe.set(key, data, ex=expire)
+                        pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning("Redis mset error: %s", e)
+            return False
+
     def delete(self, key: str) -> bool:
         """删除缓存数据"""
         try:
-            return bool(self.redis_client.delete(key))
+            with self._timed("delete"):
+                return bool(self.redis_client.delete(key))
         except Exception as e:
-            print(f"Redis delete error: {e}")
+            logger.warning("Redis delete error: %s", e)
             return False
-    
+
+    def delete_many(self, keys: Sequence[str]) -> int:
+        """批量删除缓存数据，返回删除的数量"""
+        if not keys:
+            return 0
+        try:
+            with self._timed("delete_many"):
+                return int(self.redis_client.delete(*keys))
+        except Exception as e:
+            logger.warning("Redis delete error: %s", e)
+            return 0
+
     def exists(self, key: str) -> bool:
         """检查缓存是否存在"""
         try:
-            return bool(self.redis_client.exists(key))
+            with self._timed("exists"):
+                return bool(self.redis_client.exists(key))
         except Exception as e:
-            print(f"Redis exists error: {e}")
+            logger.warning("Redis exists error: %s", e)
             return False
-    
+
     def flush_db(self) -> bool:
         """清空当前数据库"""
         try:
             return bool(self.redis_client.flushdb())
         except Exception as e:
-            print(f"Redis flushdb error: {e}")
+            logger.warning("Redis flushdb error: %s", e)
+            return False
+
+
+class AsyncRedisCache:
+    """
+    异步Redis缓存，供协程中直接调用，不占用线程池
+
+    与同步客户端使用相同的编码格式，可读写同一批key。
+    连接池绑定首次使用时的事件循环。
+    """
+
+    def __init__(self, pool: aioredis.ConnectionPool = None, serializer: CacheSerializer = None):
+        self.pool = pool or aioredis.ConnectionPool(**_connection_kwargs())
+        self.redis_client = aioredis.Redis(connection_pool=self.pool)
+        self.serializer = serializer or CacheSerializer()
+        self.stats = CacheStats("async")
+
+    async def _call(self, op: str, func, *args, **kwargs):
+        started = time.perf_counter()
+        error = False
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.stats.observe(op, time.perf_counter() - started, error)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """获取缓存数据"""
+        try:
+            data = await self._call("get", self.redis_client.get, key)
+            return self.serializer.loads(data) if data else None
+        except Exception as e:
+            logger.warning("Redis get error: %s", e)
+            return None
+
+    async def set(self, key: str, value: Any, expire: int = None) -> bool:
+        """设置缓存数据"""
+        try:
+            data = self.serializer.dumps(value)
+            return bool(await self._call("set", self.redis_client.setex, key, expire or settings.CACHE_EXPIRE_TIME, data))
+        except Exception as e:
+            logger.warning("Redis set error: %s", e)
             return False
 
+    async def mget(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        """批量获取缓存数据，返回与keys顺序一致的值列表"""
+        if not keys:
+            return []
+        try:
+            values = await self._call("mget", self.redis_client.mget, keys)
+            return [self.serializer.loads(data) if data else None for data in values]
+        except Exception as e:
+            logger.warning("Redis mget error: %s", e)
+            return [None] * len(keys)
+
+    async def mset(self, mapping: Mapping[str, Any], expire: int = None) -> bool:
+        """批量设置缓存数据（管道写入）"""
+        if not mapping:
+            return True
+        expire = expire or settings.CACHE_EXPIRE_TIME
+        try:
+            items = [(key, self.serializer.dumps(value)) for key, value in mapping.items()]
+            batch_size = settings.CACHE_PIPELINE_BATCH_SIZE
+
+            async def write():
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for start in range(0, len(items), batch_size):
+                        for key, data in items[start:start + batch_size]:
+                            pipe.set(key, data, ex=expire)
+                        await pipe.execute()
+
+            await self._call("mset", write)
+            return True
+        except Exception as e:
+            logger.warning("Redis mset error: %s", e)
+            return False
+
+    async def delete(self, key: str) -> bool:
+        """删除缓存数据"""
+        try:
+            return bool(await self._call("delete", self.redis_client.delete, key))
+        except Exception as e:
+            logger.warning("Redis delete error: %s", e)
+            return False
+
+    async def close(self):
+        """关闭连接池"""
+        await self.pool.disconnect()
+
+
 # 创建缓存实例
-cache = RedisCache()
\ No newline at end of file
+cache = RedisCache()
+async_cache = AsyncRedisCache()
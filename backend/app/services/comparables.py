@@ -0,0 +1,463 @@
+"""
+ValuHub 市场比较法估价服务
+基于历史成交案例的最近邻索引，检索可比案例并进行因素修正
+"""
+
+import csv
+import glob
+import logging
+import os
+import re
+import threading
+import time
+import warnings
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import timed
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy为可选依赖，缺失时使用numpy暴力检索
+    cKDTree = None
+
+logger = logging.getLogger(__name__)
+
+# 市场比较法估价结果的模型版本，同时用于从历史估价中排除自身产生的结果
+MODEL_VERSION = "v1.0-market-comparison"
+
+# 检索特征及权重：面积取对数，经纬度缺失时按中位数填充
+FEATURES = ("log_area", "rooms", "age", "floor_level", "latitude", "longitude")
+FEATURE_WEIGHTS = np.array([2.0, 1.0, 1.0, 0.5, 1.5, 1.5])
+
+# 装修修正系数（以简装为基准）
+DECORATION_FACTORS = {
+    "毛坯": 0.92, "rough": 0.92,
+    "简装": 1.0, "simple": 1.0,
+    "中装": 1.04,
+    "精装": 1.08, "fine": 1.08,
+    "豪装": 1.15, "luxury": 1.15
+}
+
+# 房龄修正：每相差一年修正1%，面积修正：每相差一平方米修正0.1%
+AGE_ADJUST_PER_YEAR = 0.01
+AREA_ADJUST_PER_SQM = 0.001
+# 单项修正幅度上限
+MAX_FACTOR_ADJUST = 0.2
+
+_CN_DIGITS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+
+def parse_rooms(layout: Optional[str]) -> Optional[int]:
+    """
+    从户型描述中解析房间数
+
+    支持 "3室2厅"、"三室两厅"、"开间" 等写法，无法解析时返回None
+    """
+    if not layout:
+        return None
+    match = re.search(r"(\d+|[一二两三四五六七八九])室", layout)
+    if match:
+        value = match.group(1)
+        return int(value) if value.isdigit() else _CN_DIGITS[value]
+    if "开间" in layout:
+        return 1
+    return None
+
+
+def _to_float(value: Any) -> Optional[float]:
+    """转换为浮点数，空值或非法值返回None"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_csv_transactions(data_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    读取区县成交数据CSV
+
+    文件名（不含扩展名）作为区县名，表头为
+    小区名称、建筑面积(㎡)、户型、所在区域、装修情况、成交单价(元/㎡)
+
+    Args:
+        data_dir: CSV所在目录
+
+    Returns:
+        成交案例列表
+    """
+    data_dir = data_dir or settings.MARKET_DATA_DIR
+    paths = sorted(glob.glob(os.path.join(data_dir, "*.csv")))
+    if not paths:
+        logger.warning("成交数据目录下没有CSV文件，市场比较法只使用历史估价: %s", os.path.abspath(data_dir))
+    records = []
+    for path in paths:
+        district = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            if "成交单价(元/㎡)" not in (reader.fieldnames or []):
+                continue
+            for row in reader:
+                area = _to_float(row.get("建筑面积(㎡)"))
+                price = _to_float(row.get("成交单价(元/㎡)"))
+                if not area or not price:
+                    continue
+                records.append({
+                    "source": "transaction",
+                    "property_id": None,
+                    "community": (row.get("小区名称") or "").strip(),
+                    "district": district,
+                    "area": area,
+                    "rooms": parse_rooms(row.get("户型")),
+                    "building_year": None,
+                    "floor_level": None,
+                    "latitude": None,
+                    "longitude": None,
+                    "decoration": (row.get("装修情况") or "").strip() or None,
+                    "price_per_sqm": price
+                })
+    return records
+
+
+def load_valuation_history(db: Session) -> List[Dict[str, Any]]:
+    """
+    读取历史估价记录作为可比案例
+
+    排除市场比较法自身产生的估价，避免结果自我强化
+
+    Args:
+        db: 数据库会话
+
+    Returns:
+        案例列表
+    """
+    from app.models.property import Property
+    from app.models.valuation import Valuation
+
+    query = db.query(
+        Valuation.property_id, Valuation.price_per_sqm, Property.address, Property.district,
+        Property.area, Property.rooms, Property.building_year, Property.floor_level,
+        Property.latitude, Property.longitude, Property.decoration_status
+    ).join(Property, Valuation.property_id == Property.id).filter(
+        Valuation.price_per_sqm.isnot(None),
+        # 旧数据或导入数据的模型版本可能为空，SQL中 != 会把NULL也排除掉
+        or_(Valuation.model_version.is_(None), Valuation.model_version != MODEL_VERSION)
+    ).execution_options(stream_results=True).yield_per(10000)
+
+    return [
+        {
+            "source": "valuation",
+            "property_id": row.property_id,
+            "community": row.address,
+            "district": row.district,
+            "area": float(row.area),
+            "rooms": row.rooms,
+            "building_year": row.building_year,
+            "floor_level": row.floor_level,
+            "latitude": _to_float(row.latitude),
+            "longitude": _to_float(row.longitude),
+            "decoration": row.decoration_status,
+            "price_per_sqm": float(row.price_per_sqm)
+        }
+        for row in query
+        if row.area and float(row.area) > 0 and float(row.price_per_sqm) > 0
+    ]
+
+
+def property_subject(property_obj) -> Dict[str, Any]:
+    """将房产对象转换为估价对象"""
+    return {
+        "property_id": property_obj.id,
+        "district": property_obj.district,
+        "area": float(property_obj.area),
+        "rooms": property_obj.rooms,
+        "building_year": property_obj.building_year,
+        "floor_level": property_obj.floor_level,
+        "latitude": _to_float(property_obj.latitude),
+        "longitude": _to_float(property_obj.longitude),
+        "decoration": property_obj.decoration_status
+    }
+
+
+class ComparableSalesIndex:
+    """
+    可比案例最近邻索引
+
+    特征按中位数填充缺失值、按标准差归一化并加权后构建KD树。
+    每个区县单独建树，区县内案例不足时回退到全量树。
+    """
+
+    def __init__(self, records: Sequence[Dict[str, Any]]):
+        self.records = list(records)
+        self.current_year = datetime.now().year
+        raw = np.array([self._raw_features(r) for r in self.records], dtype=float).reshape(-1, len(FEATURES))
+
+        # 缺失值填充与归一化参数
+        with warnings.catch_warnings():
+            # 整列缺失（如成交CSV没有楼层）时nanmedian会告警，结果按0处理
+            warnings.simplefilter("ignore", RuntimeWarning)
+            medians = np.nanmedian(raw, axis=0) if len(raw) else np.zeros(len(FEATURES))
+        self.medians = np.where(np.isnan(medians), 0.0, medians)
+        filled = np.where(np.isnan(raw), self.medians, raw)
+        stds = filled.std(axis=0) if len(filled) else np.ones(len(FEATURES))
+        self.scales = FEATURE_WEIGHTS / np.where(stds > 0, stds, 1.0)
+        # 所有案例都缺失的特征（如成交CSV的经纬度）不参与距离，否则估价对象的该特征值会给每个案例加上相同的常数距离
+        if len(raw):
+            self.scales = np.where(np.isnan(raw).all(axis=0), 0.0, self.scales)
+        self.points = filled * self.scales
+
+        self._global = self._build(np.arange(len(self.records)))
+        self._partitions: Dict[str, tuple] = {}
+        by_district: Dict[str, List[int]] = {}
+        for i, record in enumerate(self.records):
+            if record.get("district"):
+                by_district.setdefault(record["district"], []).append(i)
+        for district, indices in by_district.items():
+            self._partitions[district] = self._build(np.array(indices))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _raw_features(self, record: Dict[str, Any]) -> List[float]:
+        """提取原始特征，缺失为NaN"""
+        area = record.get("area")
+        year = record.get("building_year")
+        values = [
+            np.log(area) if area else None,
+            record.get("rooms"),
+            self.current_year - year if year else None,
+            record.get("floor_level"),
+            record.get("latitude"),
+            record.get("longitude")
+        ]
+        return [np.nan if v is None else float(v) for v in values]
+
+    def _build(self, indices: np.ndarray) -> tuple:
+        """为一组案例构建KD树"""
+        points = self.points[indices] if len(indices) else np.empty((0, len(FEATURES)))
+        tree = cKDTree(points) if cKDTree is not None and len(indices) else None
+        return indices, points, tree
+
+    def transform(self, subjects: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """将估价对象转换为检索空间中的坐标"""
+        raw = np.array([self._raw_features(s) for s in subjects], dtype=float).reshape(-1, len(FEATURES))
+        return np.where(np.isnan(raw), self.medians, raw) * self.scales
+
+    @staticmethod
+    def _query(partition: tuple, points: np.ndarray, k: int):
+        """在单个分区内批量检索，返回 (距离, 全局下标)"""
+        indices, data, tree = partition
+        k = min(k, len(indices))
+        if tree is not None:
+            distances, local = tree.query(points, k=k)
+            distances = distances.reshape(len(points), k)
+            local = local.reshape(len(points), k)
+        else:
+            diff = points[:, None, :] - data[None, :, :]
+            all_distances = np.sqrt((diff ** 2).sum(axis=2))
+            local = np.argsort(all_distances, axis=1)[:, :k]
+            distances = np.take_along_axis(all_distances, local, axis=1)
+        return distances, indices[local]
+
+    def query_many(
+        self,
+        subjects: Sequence[Dict[str, Any]],
+        k: int
+    ) -> List[List[tuple]]:
+        """
+        批量检索最相似案例
+
+        同一区县的估价对象合并为一次KD树查询；会多取一条以便排除估价对象自身。
+
+        Args:
+            subjects: 估价对象列表
+            k: 每个对象返回的案例数
+
+        Returns:
+            每个对象的 [(案例下标, 特征距离)] 列表，按距离升序
+        """
+        results: List[List[tuple]] = [[] for _ in subjects]
+        if not self.records or not subjects:
+            return results
+
+        points = self.transform(subjects)
+        groups: Dict[Optional[str], List[int]] = {}
+        for i, subject in enumerate(subjects):
+            partition = self._partitions.get(subject.get("district"))
+            key = subject.get("district") if partition is not None and len(partition[0]) >= k else None
+            groups.setdefault(key, []).append(i)
+
+        for key, members in groups.items():
+            partition = self._partitions[key] if key is not None else self._global
+            distances, neighbours = self._query(partition, points[members], k + 1)
+            for row, subject_index in enumerate(members):
+                own_id = subjects[subject_index].get("property_id")
+                hits = [
+                    (int(idx), float(dist))
+                    for idx, dist in zip(neighbours[row], distances[row])
+                    if own_id is None or self.records[idx].get("property_id") != own_id
+                ]
+                results[subject_index] = hits[:k]
+        return results
+
+    def adjust_price(self, subject: Dict[str, Any], case: Dict[str, Any]) -> float:
+        """
+        对可比案例单价进行因素修正（装修、房龄、面积）
+
+        Args:
+            subject: 估价对象
+            case: 可比案例
+
+        Returns:
+            修正后单价
+        """
+        factor = 1.0
+
+        subject_decoration = DECORATION_FACTORS.get(subject.get("decoration") or "")
+        case_decoration = DECORATION_FACTORS.get(case.get("decoration") or "")
+        if subject_decoration and case_decoration:
+            factor *= subject_decoration / case_decoration
+
+        if subject.get("building_year") and case.get("building_year"):
+            years = subject["building_year"] - case["building_year"]
+            factor *= 1 + _clamp(years * AGE_ADJUST_PER_YEAR)
+
+        if subject.get("area") and case.get("area"):
+            factor *= 1 - _clamp((subject["area"] - case["area"]) * AREA_ADJUST_PER_SQM)
+
+        return case["price_per_sqm"] * factor
+
+    def valuate_many(
+        self,
+        subjects: Sequence[Dict[str, Any]],
+        k: Optional[int] = None
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        批量市场比较法估价
+
+        按特征距离反比加权修正后单价得到估价单价，置信度由修正后单价的离散程度决定。
+
+        Args:
+            subjects: 估价对象列表（property_subject 的返回格式）
+            k: 可比案例数量
+
+        Returns:
+            每个对象的估价结果，无可比案例时为None
+        """
+        k = k or settings.COMPARABLES_K
+        with timed("inference"):
+            return self._valuate_many(subjects, k)
+
+    def _valuate_many(self, subjects: Sequence[Dict[str, Any]], k: int) -> List[Optional[Dict[str, Any]]]:
+        """valuate_many 的实现，耗时计入请求的推理阶段"""
+        results: List[Optional[Dict[str, Any]]] = []
+        for subject, hits in zip(subjects, self.query_many(subjects, k)):
+            if not hits:
+                results.append(None)
+                continue
+
+            cases = []
+            for idx, distance in hits:
+                case = self.records[idx]
+                adjusted = self.adjust_price(subject, case)
+                cases.append({
+                    "source": case["source"],
+                    "community": case["community"],
+                    "district": case["district"],
+                    "area": case["area"],
+                    "rooms": case["rooms"],
+                    "floor": case["floor_level"],
+                    "decoration": case["decoration"],
+                    "price_per_sqm": round(case["price_per_sqm"], 2),
+                    "adjusted_price_per_sqm": round(adjusted, 2),
+                    "total_price": round(adjusted * subject["area"], 2),
+                    "distance": round(distance, 4)
+                })
+
+            adjusted_prices = np.array([c["adjusted_price_per_sqm"] for c in cases])
+            weights = 1.0 / (np.array([c["distance"] for c in cases]) + 1e-3)
+            price_per_sqm = float(np.average(adjusted_prices, weights=weights))
+            spread = float(adjusted_prices.std() / price_per_sqm) if price_per_sqm else 1.0
+
+            results.append({
+                "estimated_price": round(price_per_sqm * subject["area"], 2),
+                "price_per_sqm": round(price_per_sqm, 2),
+                "confidence_level": round(min(0.95, max(0.5, 1 - spread)), 2),
+                "model_version": MODEL_VERSION,
+                "similar_cases": cases
+            })
+        return results
+
+
+def _clamp(value: float) -> float:
+    """限制单项修正幅度"""
+    return max(-MAX_FACTOR_ADJUST, min(MAX_FACTOR_ADJUST, value))
+
+
+class MarketComparisonEngine:
+    """
+    市场比较法估价引擎
+
+    合并区县成交CSV与历史估价构建索引，按 COMPARABLES_REFRESH_SECONDS 定期重建
+    """
+
+    def __init__(self):
+        self.index: Optional[ComparableSalesIndex] = None
+        self.loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self, db: Session) -> ComparableSalesIndex:
+        """
+        确保索引已加载且未过期
+
+        Args:
+            db: 数据库会话
+
+        Returns:
+            当前索引
+        """
+        refresh = settings.COMPARABLES_REFRESH_SECONDS
+        with self._lock:
+            if self.index is None or (refresh > 0 and time.monotonic() - self.loaded_at >= refresh):
+                self.reload(db)
+            return self.index
+
+    def reload(self, db: Session):
+        """
+        重新读取案例并重建索引
+
+        Args:
+            db: 数据库会话
+        """
+        started = time.perf_counter()
+        records = load_csv_transactions() + load_valuation_history(db)
+        self.index = ComparableSalesIndex(records)
+        self.loaded_at = time.monotonic()
+        logger.info(
+            "可比案例索引重建完成: cases=%d time=%.1fms",
+            len(records), (time.perf_counter() - started) * 1000
+        )
+
+    def valuate_many(
+        self,
+        db: Session,
+        subjects: Sequence[Dict[str, Any]],
+        k: Optional[int] = None
+    ) -> List[Optional[Dict[str, Any]]]:
+        """批量估价"""
+        return self.ensure_loaded(db).valuate_many(subjects, k)
+
+    def valuate(self, db: Session, subject: Dict[str, Any], k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """单个对象估价"""
+        return self.valuate_many(db, [subject], k)[0]
+
+
+# 全局市场比较法估价引擎
+market_comparison_engine = MarketComparisonEngine()
@@ -1,93 +1,121 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
 import time
 import json
+import uuid
+import httpx
 from app.core.config import settings
+from app.services.async_collector import (
+    AsyncMarketDataCollector,
+    city_average_price,
+    community_path
+)
 from app.services.cache import cache
-from celery import shared_task
+from app.services.incremental_collector import IncrementalCollector, community_key
+from app.services.tiered_cache import tiered_cache
+from celery import chord, group, shared_task
 
 class RealEstateDataCollector:
     """房地产数据采集服务"""
     
-    def __init__(self):
-        """初始化采集服务"""
-        self.session = requests.Session()
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        self.session.headers.update(self.headers)
+    def __init__(self, fetcher: AsyncMarketDataCollector = None):
+        """
+        初始化采集服务
+        
+        Args:
+            fetcher: 异步采集器，测试时可传入使用模拟传输层的实例
+        """
+        self.fetcher = fetcher or AsyncMarketDataCollector()
+        self.incremental = IncrementalCollector(self.fetcher)
     
     def fetch_city_average_price(self, city: str) -> float:
         """获取城市平均房价"""
         # 这里使用模拟数据，实际项目中可以替换为真实的数据源
-        city_prices = {
-            "北京": 85000,
-            "上海": 92000,
-            "广州": 78000,
-            "深圳": 105000,
-            "长沙": 13038,
-            "杭州": 55000,
-            "成都": 18000,
-            "武汉": 16000
-        }
-        return city_prices.get(city, 7500)
+        return city_average_price(city)
     
     def fetch_community_data(self, city: str, district: str, community: str) -> dict:
-        """获取小区数据"""
-        # 这里使用模拟数据，实际项目中可以替换为真实的爬虫逻辑
-        # 模拟从房产网站获取小区数据
-        time.sleep(1)  # 模拟网络延迟
-        
-        # 生成模拟数据
-        community_data = {
-            "community_name": community,
-            "city": city,
-            "district": district,
-            "average_price": self.fetch_city_average_price(city) * (1 + (len(community) % 10) / 100),
-            "total_houses": 1000 + (len(community) % 500),
-            "completed_year": 2000 + (len(community) % 20),
-            "house_types": ["2室1厅", "3室1厅", "3室2厅", "4室2厅"],
-            "average_rent": 50 * (len(community) % 10 + 1),
-            "nearby_facilities": ["地铁", "超市", "医院", "学校"],
-            "transaction_count": 15 + (len(community) % 10),
-            "price_trend": "稳中有升",
-            "market_analysis": f"{city}{district}区域{community}小区近3个月成交活跃，市场需求旺盛。"
-        }
+        """获取单个小区数据"""
+        async def fetch():
+            async with self.fetcher.client() as client:
+                return await self.fetcher.fetch_json(client, community_path(city, district, community))
         
-        return community_data
+        return asyncio.run(fetch())
     
     def collect_city_data(self, city: str) -> list:
-        """采集城市所有小区数据"""
-        # 这里使用模拟数据，实际项目中可以替换为真实的爬虫逻辑
-        districts = ["朝阳区", "海淀区", "东城区", "西城区"] if city == "北京" else ["天河区", "越秀区", "海珠区", "荔湾区"]
-        
-        all_community_data = []
-        for district in districts:
-            # 模拟每个区域有10个小区
-            for i in range(10):
-                community = f"{district}小区{i+1}"
-                community_data = self.fetch_community_data(city, district, community)
-                all_community_data.append(community_data)
-                time.sleep(0.5)  # 模拟网络延迟
+        """采集城市所有小区数据（小区之间并发请求）"""
+        result = self.collect_cities([city])[city]
+        if isinstance(result, BaseException):
+            raise result
+        return result
+    
+    def collect_cities(self, cities: list) -> dict:
+        """
+        并行采集多个城市
         
-        return all_community_data
+        Returns:
+            城市 -> 小区数据列表；采集失败的城市对应异常对象
+        """
+        return self.fetcher.run(cities)
     
     def save_data_to_cache(self, city: str, data: list) -> bool:
         """将采集的数据保存到缓存"""
         try:
-            # 保存城市整体数据
-            cache.set(f"city_data_{city}", data, expire=86400)
-            
-            # 保存每个小区的数据
+            # 城市整体数据和每个小区的数据通过管道批量写入两级缓存
+            entries = {f"city_data_{city}": data}
             for community_data in data:
                 community_key = f"community_data_{city}_{community_data['district']}_{community_data['community_name']}"
-                cache.set(community_key, community_data, expire=86400)
+                entries[community_key] = community_data
             
-            return True
+            return tiered_cache.set_many(entries, ttl=86400)
         except Exception as e:
             print(f"保存数据到缓存失败: {str(e)}")
             return False
     
+    def save_changes_to_cache(self, city: str, changed: list) -> bool:
+        """
+        只把变化的小区写入缓存，并合并到城市整体数据中
+        城市整体数据不在缓存时由快照重放得到
+        """
+        try:
+            city_key = f"city_data_{city}"
+            current = self.get_collected_city_data(city)
+            if not changed:
+                return True
+            
+            merged = {community_key(item): item for item in current}
+            entries = {}
+            for community_data in changed:
+                merged[community_key(community_data)] = community_data
+                entries[f"community_data_{city}_{community_data['district']}_{community_data['community_name']}"] = community_data
+            entries[city_key] = list(merged.values())
+            
+            return tiered_cache.set_many(entries, ttl=86400)
+        except Exception as e:
+            print(f"保存增量数据到缓存失败: {str(e)}")
+            return False
+    
+    def get_collected_city_data(self, city: str) -> list:
+        """已采集的城市整体数据，缓存未命中时由快照重放得到（不触发采集）"""
+        return tiered_cache.get_or_load(f"city_data_{city}", lambda: self.incremental.replay(city), ttl=86400) or []
+    
+    def refresh_market_statistics(self, city: str) -> dict:
+        """根据城市整体数据重新计算市场统计并写入缓存"""
+        stats = compute_market_statistics(self.get_collected_city_data(city))
+        tiered_cache.set(f"market_stats_{city}", stats, ttl=86400)
+        return stats
+    
+    def get_market_statistics(self, city: str) -> dict:
+        """获取城市市场统计（缓存未命中时由城市整体数据计算）"""
+        return tiered_cache.get_or_load(
+            f"market_stats_{city}", lambda: compute_market_statistics(self.get_city_data(city)), ttl=86400
+        )
+    
+    def get_city_data(self, city: str) -> list:
+        """
+        获取城市小区数据
+        优先读取两级缓存；过期后先返回旧数据并在后台重新采集，多个调用方同时未命中时只采集一次
+        """
+        return tiered_cache.get_or_load(f"city_data_{city}", lambda: self.collect_city_data(city), ttl=86400)
+    
     def run_collection(self, city: str) -> bool:
         """运行数据采集任务"""
         try:
@@ -104,31 +132,188 @@ class RealEstateDataCollector:
             print(f"数据采集失败: {str(e)}")
             return False
 
+def compute_market_statistics(data: list) -> dict:
+    """
+    计算城市市场统计
+    
+    Returns:
+        小区数、均价（最低/最高）、平均租金、成交量及各区域均价
+    """
+    if not data:
+        return {"community_count": 0, "average_price": 0, "min_price": 0, "max_price": 0,
+                "average_rent": 0, "transaction_count": 0, "districts": {}}
+    
+    prices = [item["average_price"] for item in data]
+    districts = {}
+    for item in data:
+        districts.setdefault(item["district"], []).append(item["average_price"])
+    
+    return {
+        "community_count": len(data),
+        "average_price": round(sum(prices) / len(prices), 2),
+        "min_price": round(min(prices), 2),
+        "max_price": round(max(prices), 2),
+        "average_rent": round(sum(item["average_rent"] for item in data) / len(data), 2),
+        "transaction_count": sum(item["transaction_count"] for item in data),
+        "districts": {
+            district: {"community_count": len(values), "average_price": round(sum(values) / len(values), 2)}
+            for district, values in districts.items()
+        }
+    }
+
 # 创建采集器实例
 collector = RealEstateDataCollector()
 
+# 需要采集数据的城市列表
+COLLECTION_CITIES = ["北京", "上海", "广州", "深圳", "长沙"]
+
 @shared_task(name='app.services.data_collector.collect_real_estate_data')
-def collect_real_estate_data():
-    """Celery任务：采集房地产数据"""
+def collect_real_estate_data(full: bool = False):
+    """
+    Celery任务：增量采集房地产数据
+    
+    读取各城市的变更feed后，把需要请求的小区按区域拆成子任务并行执行（collection队列），
+    全部完成后由 finalize_collection 汇总写入，再由 refresh_market_statistics 刷新受影响城市的市场统计。
+    单个城市或区域失败、变慢不影响其他城市。
+    
+    Args:
+        full: 忽略变更游标、对全部小区发条件请求，用于定期校对
+    
+    Returns:
+        本次采集的标识
+    """
     print("开始执行定时数据采集任务...")
+    run_id = uuid.uuid4().hex
+    started = time.time()
+    
+    plans = collector.incremental.plan(COLLECTION_CITIES, full=full)
     
-    # 需要采集数据的城市列表
-    cities = ["北京", "上海", "广州", "深圳", "长沙"]
+    planned = {}
+    failures = {}
+    header = []
+    for city, plan in plans.items():
+        if isinstance(plan, BaseException):
+            print(f"{city}变更列表读取失败: {plan}")
+            failures[city] = str(plan)
+            continue
+        planned[city] = plan["cursor"]
+        for district, communities in plan["districts"].items():
+            header.append(collect_district_data.s(city, district, communities))
     
-    results = []
-    for city in cities:
-        result = collector.run_collection(city)
-        results.append({
+    context = {
+        "run_id": run_id,
+        "started": started,
+        "plan_elapsed": round(time.time() - started, 3),
+        "cursors": planned,
+        "failures": failures
+    }
+    body = finalize_collection.s(context) | refresh_market_statistics.s()
+    if header:
+        chord(group(header))(body)
+    else:
+        # 没有需要请求的小区，直接汇总
+        body.delay([])
+    
+    print(f"已分发{len(header)}个区域采集子任务")
+    return run_id
+
+@shared_task(
+    bind=True,
+    name='app.services.data_collector.collect_district_data',
+    max_retries=3,
+    default_retry_delay=5
+)
+def collect_district_data(self, city: str, district: str, communities: list):
+    """
+    Celery子任务：采集一个区域中需要更新的小区
+    
+    只读取数据源、不写缓存和检查点，worker中断或请求失败后重复执行是安全的。
+    网络错误重试耗尽后、以及其他异常（如数据源返回无法解析的内容）都返回错误信息而不是抛出异常，
+    避免一个区域失败导致整个chord不执行汇总。
+    """
+    started = time.time()
+    try:
+        result = collector.incremental.fetch_district(city, district, communities)
+    except httpx.HTTPError as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=self.default_retry_delay * 2 ** self.request.retries)
+        result = {"error": str(e)}
+    except Exception as e:
+        # 数据格式问题重试也不会恢复，直接记为该区域失败
+        print(f"区域采集失败 {city}/{district}: {type(e).__name__}: {e}")
+        result = {"error": f"{type(e).__name__}: {e}"}
+    
+    result.update({
+        "city": city,
+        "district": district,
+        "requested": len(communities),
+        "retries": self.request.retries,
+        "elapsed": round(time.time() - started, 3)
+    })
+    return result
+
+@shared_task(name='app.services.data_collector.finalize_collection')
+def finalize_collection(district_results: list, context: dict):
+    """
+    Celery汇总任务：全部区域成功的城市写入快照、检查点和缓存，生成采集结果摘要
+    
+    快照文件名和检查点内容由本次采集唯一确定，重试不会产生重复数据。
+    """
+    by_city = {}
+    for result in district_results:
+        by_city.setdefault(result["city"], []).append(result)
+    
+    committed = {}
+    failures = dict(context["failures"])
+    for city in context["cursors"]:
+        results = by_city.get(city, [])
+        errors = [f"{r['district']}: {r['error']}" for r in results if "error" in r]
+        if errors:
+            failures[city] = "; ".join(errors)
+        else:
+            committed[city] = {"cursor": context["cursors"][city], "districts": results}
+    
+    changes = collector.incremental.commit(committed, context["started"], context["run_id"])
+    
+    summary = []
+    for city in COLLECTION_CITIES:
+        results = by_city.get(city, [])
+        success = city in changes and collector.save_changes_to_cache(city, changes[city])
+        summary.append({
             "city": city,
-            "success": result,
+            "success": success,
+            "changed": len(changes.get(city, [])),
+            "error": failures.get(city),
+            "elapsed": max((r["elapsed"] for r in results), default=0),
+            "tasks": [
+                {"district": r["district"], "requested": r["requested"], "elapsed": r["elapsed"], "retries": r["retries"]}
+                for r in results
+            ],
             "timestamp": time.time()
         })
     
+    print(f"采集耗时{time.time() - context['started']:.1f}秒（规划{context['plan_elapsed']}秒）")
+    
     # 保存采集结果
-    cache.set("data_collection_results", results, expire=86400)
+    cache.set("data_collection_results", summary, expire=86400)
     
     print("定时数据采集任务执行完成")
-    return results
+    return summary
+
+@shared_task(name='app.services.data_collector.refresh_market_statistics')
+def refresh_market_statistics(summary: list):
+    """Celery任务：重新计算有数据变化的城市的市场统计"""
+    refreshed = []
+    for item in summary:
+        if item["success"] and item["changed"]:
+            started = time.time()
+            collector.refresh_market_statistics(item["city"])
+            item["stats_elapsed"] = round(time.time() - started, 3)
+            refreshed.append(item["city"])
+    
+    if refreshed:
+        cache.set("data_collection_results", summary, expire=86400)
+    return refreshed
 
 # 测试采集功能
 if __name__ == "__main__":
@@ -0,0 +1,444 @@
+"""
+ValuHub 数据导出服务
+基于服务端游标流式导出房产、估价、报告数据
+"""
+
+import csv
+import importlib.util
+import io
+import json
+import logging
+import os
+import time
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.property import Property
+from app.models.valuation import Valuation
+from app.models.report import Report
+
+logger = logging.getLogger(__name__)
+
+# 支持导出的数据类型
+EXPORT_MODELS = {
+    "properties": Property,
+    "valuations": Valuation,
+    "reports": Report
+}
+
+# 支持的导出格式及对应的文件扩展名、MIME类型
+EXPORT_FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+    "parquet": ("parquet", "application/vnd.apache.parquet")
+}
+
+
+class ExportStats:
+    """
+    导出统计信息
+    """
+
+    def __init__(self):
+        self.row_count = 0
+        self.bytes_written = 0
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+
+    def finish(self):
+        """标记导出结束"""
+        self.finished_at = time.perf_counter()
+
+    @property
+    def elapsed_seconds(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return max(end - self.started_at, 1e-9)
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.row_count / self.elapsed_seconds, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            "row_count": self.row_count,
+            "bytes_written": self.bytes_written,
+            "elapsed_ms": round(self.elapsed_seconds * 1000, 2),
+            "rows_per_second": self.rows_per_second
+        }
+
+
+def parse_export_date(value: Optional[str]) -> Optional[datetime]:
+    """解析导出请求中的日期参数"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"无效的日期格式: {value}")
+
+
+def parquet_available() -> bool:
+    """是否安装了Parquet导出依赖的pyarrow"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def check_export_format(export_format: str):
+    """
+    检查导出格式在当前环境是否可用
+
+    流式导出在返回响应头之后才开始编码，依赖缺失需要在此之前发现
+
+    Raises:
+        ValueError: 格式依赖的库未安装
+    """
+    if export_format == "parquet" and not parquet_available():
+        raise ValueError("Parquet导出需要安装pyarrow")
+
+
+def get_export_columns(data_type: str) -> List[str]:
+    """
+    获取导出的列名
+
+    Args:
+        data_type: 数据类型
+
+    Returns:
+        列名列表
+    """
+    model = EXPORT_MODELS[data_type]
+    return [column.name for column in model.__table__.columns]
+
+
+def iter_export_rows(
+    db: Session,
+    data_type: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    batch_size: Optional[int] = None
+) -> Iterator[Tuple]:
+    """
+    以服务端游标逐批读取导出数据
+
+    只查询表列而不加载ORM对象，配合 yield_per 和 stream_results，
+    内存占用只与批大小相关，与结果集总量无关。
+
+    Args:
+        db: 数据库会话
+        data_type: 数据类型 ('properties', 'valuations', 'reports')
+        start_date: 开始日期（ISO格式）
+        end_date: 结束日期（ISO格式）
+        batch_size: 每批读取的行数
+
+    Yields:
+        按列顺序排列的行元组
+    """
+    if data_type not in EXPORT_MODELS:
+        raise ValueError(f"不支持的数据类型: {data_type}")
+
+    model = EXPORT_MODELS[data_type]
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+
+    query = db.query(*model.__table__.columns)
+
+    start = parse_export_date(start_date)
+    end = parse_export_date(end_date)
+    if start:
+        query = query.filter(model.created_at >= start)
+    if end:
+        query = query.filter(model.created_at <= end)
+
+    query = query.order_by(model.id).execution_options(stream_results=True).yield_per(batch_size)
+
+    for row in query:
+        yield tuple(row)
+
+
+def _to_plain(value: Any) -> Any:
+    """将数据库值转换为可序列化的基础类型"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _csv_cell(value: Any) -> Any:
+    """CSV单元格取值，JSON字段序列化为字符串"""
+    value = _to_plain(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _encode_csv(columns: List[str], rows: Iterable[Tuple], flush_rows: int) -> Iterator[bytes]:
+    """逐批编码CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # 写入BOM，方便Excel识别UTF-8
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+
+    pending = 0
+    for row in rows:
+        writer.writerow([_csv_cell(v) for v in row])
+        pending += 1
+        if pending >= flush_rows:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+def _encode_ndjson(columns: List[str], rows: Iterable[Tuple], flush_rows: int) -> Iterator[bytes]:
+    """逐批编码NDJSON（每行一个JSON对象）"""
+    lines: List[str] = []
+    for row in rows:
+        lines.append(json.dumps(
+            {column: _to_plain(value) for column, value in zip(columns, row)},
+            ensure_ascii=False
+        ))
+        if len(lines) >= flush_rows:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink:
+    """
+    供ParquetWriter写入的只追加缓冲区
+    每写完一个row group就取走已写入的字节，避免整文件驻留内存
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_type(column):
+    """根据SQLAlchemy列类型推导Arrow类型"""
+    import pyarrow as pa
+    from sqlalchemy import Boolean, DateTime, Integer, Numeric
+
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Numeric):
+        return pa.float64()
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    # JSON及字符串列统一以字符串存储
+    return pa.string()
+
+
+def _arrow_cell(value: Any) -> Any:
+    """Parquet单元格取值，保留时间类型，JSON字段序列化为字符串"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _encode_parquet(columns: List[str], rows: Iterable[Tuple], flush_rows: int, data_type: str) -> Iterator[bytes]:
+    """按row group逐批编码Parquet"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet导出需要安装pyarrow")
+
+    # 按表结构生成固定schema，避免首批数据全为空时推断出错误类型
+    model = EXPORT_MODELS[data_type]
+    schema = pa.schema([(column.name, _arrow_type(column)) for column in model.__table__.columns])
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def write_batch(batch: List[Tuple]):
+        arrays = [
+            pa.array([_arrow_cell(row[i]) for row in batch], type=field.type)
+            for i, field in enumerate(schema)
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    batch: List[Tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= flush_rows:
+            write_batch(batch)
+            batch = []
+            yield sink.drain()
+
+    if batch:
+        write_batch(batch)
+    writer.close()
+    yield sink.drain()
+
+
+# 文本格式编码器（Parquet需要表结构，单独处理）
+_TEXT_ENCODERS = {
+    "csv": _encode_csv,
+    "ndjson": _encode_ndjson
+}
+
+
+def _gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """边编码边进行gzip压缩"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_export(
+    db: Session,
+    data_type: str,
+    export_format: str = "csv",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    compress: bool = False,
+    stats: Optional[ExportStats] = None
+) -> Iterator[bytes]:
+    """
+    流式导出数据
+
+    Args:
+        db: 数据库会话
+        data_type: 数据类型
+        export_format: 导出格式 ('csv', 'ndjson', 'parquet')
+        start_date: 开始日期
+        end_date: 结束日期
+        compress: 是否gzip压缩（Parquet自带列压缩，忽略此参数）
+        stats: 导出统计信息，导出过程中实时更新
+
+    Yields:
+        编码后的字节块
+    """
+    if data_type not in EXPORT_MODELS:
+        raise ValueError(f"不支持的数据类型: {data_type}")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {export_format}")
+
+    stats = stats or ExportStats()
+    columns = get_export_columns(data_type)
+    batch_size = settings.EXPORT_BATCH_SIZE
+
+    def counted_rows():
+        for row in iter_export_rows(db, data_type, start_date, end_date, batch_size):
+            stats.row_count += 1
+            yield row
+
+    if export_format == "parquet":
+        chunks = _encode_parquet(columns, counted_rows(), batch_size, data_type)
+    else:
+        chunks = _TEXT_ENCODERS[export_format](columns, counted_rows(), batch_size)
+    if compress and export_format != "parquet":
+        chunks = _gzip_stream(chunks)
+
+    for chunk in chunks:
+        if chunk:
+            stats.bytes_written += len(chunk)
+            yield chunk
+
+    stats.finish()
+    logger.info(
+        "导出完成: %s.%s rows=%d bytes=%d rows/s=%.2f",
+        data_type, export_format, stats.row_count, stats.bytes_written, stats.rows_per_second
+    )
+
+
+def build_export_filename(data_type: str, export_format: str, compress: bool = False) -> str:
+    """
+    生成导出文件名
+
+    Args:
+        data_type: 数据类型
+        export_format: 导出格式
+        compress: 是否gzip压缩
+
+    Returns:
+        文件名
+    """
+    ext = EXPORT_FORMATS[export_format][0]
+    suffix = ".gz" if compress and export_format != "parquet" else ""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return f"valuhub_{data_type}_{timestamp}.{ext}{suffix}"
+
+
+def export_to_file(
+    db: Session,
+    data_type: str,
+    export_format: str = "csv",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    compress: bool = False
+) -> Tuple[str, ExportStats]:
+    """
+    流式导出数据到导出目录
+
+    先写入临时文件，完成后原子重命名，避免下载到未写完的文件。
+
+    Args:
+        db: 数据库会话
+        data_type: 数据类型
+        export_format: 导出格式
+        start_date: 开始日期
+        end_date: 结束日期
+        compress: 是否gzip压缩
+
+    Returns:
+        (文件名, 导出统计信息)
+    """
+    os.makedirs(settings.EXPORT_STORAGE_DIR, exist_ok=True)
+    file_name = build_export_filename(data_type, export_format, compress)
+    file_path = os.path.join(settings.EXPORT_STORAGE_DIR, file_name)
+    tmp_path = f"{file_path}.part"
+
+    stats = ExportStats()
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in stream_export(db, data_type, export_format, start_date, end_date, compress, stats):
+                f.write(chunk)
+        os.replace(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return file_name, stats
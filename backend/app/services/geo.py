@@ -0,0 +1,502 @@
+"""
+ValuHub 地理空间服务
+geohash编码、球面距离计算以及房产坐标的内存网格索引
+"""
+
+import heapq
+import logging
+import math
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，缺失时使用纯Python计算
+    np = None
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+
+# 每度纬度对应的米数
+METERS_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_M / 180
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = 9) -> str:
+    """
+    计算geohash编码
+
+    Args:
+        latitude: 纬度
+        longitude: 经度
+        precision: 编码长度，9位精度约为5米
+
+    Returns:
+        geohash字符串
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    计算两点间的球面距离
+
+    Returns:
+        距离（米）
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoGridIndex:
+    """
+    经纬度网格索引
+
+    按固定大小的经纬度网格对坐标分桶，每个网格用紧凑数组存储ID和坐标。
+    半径/矩形查询只扫描覆盖范围内的网格，k近邻查询按环形逐层向外扩展，
+    查询代价与落在附近网格中的点数相关，与索引总点数无关。
+    """
+
+    def __init__(self, cell_size_deg: float = 0.01):
+        """
+        初始化网格索引
+
+        Args:
+            cell_size_deg: 网格边长（度），0.01度约为1.1公里
+        """
+        self.cell_size = cell_size_deg
+        self._cells: Dict[Tuple[int, int], Tuple[array, array, array]] = {}
+        self._locations: Dict[int, Tuple[float, float]] = {}
+        self._lock = threading.RLock()
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def _cell_of(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size))
+
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._cells = {}
+            self._locations = {}
+            self.loaded_at = None
+
+    def upsert(self, item_id: int, latitude: float, longitude: float):
+        """
+        添加或更新一个点
+
+        Args:
+            item_id: 房产ID
+            latitude: 纬度
+            longitude: 经度
+        """
+        with self._lock:
+            self.remove(item_id)
+            cell = self._cell_of(latitude, longitude)
+            bucket = self._cells.get(cell)
+            if bucket is None:
+                bucket = (array("q"), array("d"), array("d"))
+                self._cells[cell] = bucket
+            bucket[0].append(item_id)
+            bucket[1].append(latitude)
+            bucket[2].append(longitude)
+            self._locations[item_id] = (latitude, longitude)
+
+    def remove(self, item_id: int) -> bool:
+        """
+        删除一个点
+
+        Returns:
+            是否存在并被删除
+        """
+        with self._lock:
+            location = self._locations.pop(item_id, None)
+            if location is None:
+                return False
+            cell = self._cell_of(*location)
+            ids, lats, lons = self._cells[cell]
+            pos = ids.index(item_id)
+            # 与末尾元素交换后删除，避免数组整体移动
+            last = len(ids) - 1
+            ids[pos], lats[pos], lons[pos] = ids[last], lats[last], lons[last]
+            del ids[last], lats[last], lons[last]
+            if not ids:
+                del self._cells[cell]
+            return True
+
+    def bulk_load(self, points: Iterable[Tuple[int, float, float]]):
+        """
+        批量重建索引
+
+        Args:
+            points: (id, 纬度, 经度) 迭代器
+        """
+        cells: Dict[Tuple[int, int], Tuple[array, array, array]] = {}
+        locations: Dict[int, Tuple[float, float]] = {}
+        for item_id, latitude, longitude in points:
+            cell = self._cell_of(latitude, longitude)
+            bucket = cells.get(cell)
+            if bucket is None:
+                bucket = (array("q"), array("d"), array("d"))
+                cells[cell] = bucket
+            bucket[0].append(item_id)
+            bucket[1].append(latitude)
+            bucket[2].append(longitude)
+            locations[item_id] = (latitude, longitude)
+
+        with self._lock:
+            self._cells = cells
+            self._locations = locations
+            self.loaded_at = time.monotonic()
+
+    def _lon_cells_for(self, latitude: float, radius_m: float) -> int:
+        """半径在该纬度上跨越的经度网格数"""
+        cos_lat = max(math.cos(math.radians(min(abs(latitude), 89.9))), 1e-6)
+        return math.ceil(radius_m / (METERS_PER_DEGREE_LAT * cos_lat) / self.cell_size)
+
+    @staticmethod
+    def _scan_bucket(
+        bucket: Tuple[array, array, array],
+        latitude: float,
+        longitude: float,
+        max_distance_m: float
+    ) -> Iterable[Tuple[int, float]]:
+        """
+        计算网格内各点到中心的距离，返回不超过 max_distance_m 的 (id, 距离米)
+
+        安装numpy时按网格整体向量化计算，否则逐点计算。
+        """
+        ids, lats, lons = bucket
+        if np is not None:
+            # 复制出独立数组，避免持有array缓冲区导致后续append失败
+            lat_arr = np.radians(np.array(lats))
+            lon_arr = np.radians(np.array(lons))
+            phi = math.radians(latitude)
+            a = (
+                np.sin((lat_arr - phi) / 2) ** 2
+                + math.cos(phi) * np.cos(lat_arr) * np.sin((lon_arr - math.radians(longitude)) / 2) ** 2
+            )
+            distances = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            hits = np.nonzero(distances <= max_distance_m)[0]
+            return [(ids[i], float(distances[i])) for i in hits.tolist()]
+
+        return [
+            (ids[k], distance)
+            for k in range(len(ids))
+            for distance in (haversine_m(latitude, longitude, lats[k], lons[k]),)
+            if distance <= max_distance_m
+        ]
+
+    def _buckets_in_range(self, low_i: int, high_i: int, low_j: int, high_j: int) -> Iterable[Tuple[array, array, array]]:
+        """
+        返回网格坐标范围内的非空网格
+
+        范围内网格数多于非空网格数时（大范围查询），改为遍历非空网格，
+        避免逐个探测大量空网格。
+        """
+        if (high_i - low_i + 1) * (high_j - low_j + 1) > len(self._cells):
+            for (i, j), bucket in self._cells.items():
+                if low_i <= i <= high_i and low_j <= j <= high_j:
+                    yield bucket
+            return
+        for i in range(low_i, high_i + 1):
+            for j in range(low_j, high_j + 1):
+                bucket = self._cells.get((i, j))
+                if bucket is not None:
+                    yield bucket
+
+    def within_radius(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_m: float,
+        limit: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        查询半径范围内的点
+
+        Args:
+            latitude: 中心纬度
+            longitude: 中心经度
+            radius_m: 半径（米）
+            limit: 最多返回数量
+
+        Returns:
+            按距离升序排列的 (id, 距离米) 列表
+        """
+        lat_span = math.ceil(radius_m / METERS_PER_DEGREE_LAT / self.cell_size)
+        lon_span = self._lon_cells_for(latitude, radius_m)
+        center_lat, center_lon = self._cell_of(latitude, longitude)
+
+        results = []
+        with self._lock:
+            for bucket in self._buckets_in_range(
+                center_lat - lat_span, center_lat + lat_span,
+                center_lon - lon_span, center_lon + lon_span
+            ):
+                results.extend(self._scan_bucket(bucket, latitude, longitude, radius_m))
+
+        if limit is not None:
+            return heapq.nsmallest(limit, results, key=lambda r: r[1])
+        results.sort(key=lambda r: r[1])
+        return results
+
+    def within_bbox(
+        self,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float,
+        limit: Optional[int] = None
+    ) -> List[int]:
+        """
+        查询矩形范围内的点
+
+        Args:
+            min_lat: 最小纬度
+            min_lon: 最小经度
+            max_lat: 最大纬度
+            max_lon: 最大经度
+            limit: 最多返回数量
+
+        Returns:
+            ID列表
+        """
+        low_i, low_j = self._cell_of(min_lat, min_lon)
+        high_i, high_j = self._cell_of(max_lat, max_lon)
+
+        results: List[int] = []
+        with self._lock:
+            for bucket in self._buckets_in_range(low_i, high_i, low_j, high_j):
+                ids, lats, lons = bucket
+                for k in range(len(ids)):
+                    if min_lat <= lats[k] <= max_lat and min_lon <= lons[k] <= max_lon:
+                        results.append(ids[k])
+                        if limit is not None and len(results) >= limit:
+                            return results
+        return results
+
+    @staticmethod
+    def _ring_cells(center_i: int, center_j: int, ring: int) -> Iterable[Tuple[int, int]]:
+        """生成与中心网格切比雪夫距离恰好为ring的网格坐标"""
+        if ring == 0:
+            yield center_i, center_j
+            return
+        for j in range(center_j - ring, center_j + ring + 1):
+            yield center_i - ring, j
+            yield center_i + ring, j
+        for i in range(center_i - ring + 1, center_i + ring):
+            yield i, center_j - ring
+            yield i, center_j + ring
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int,
+        max_radius_m: Optional[float] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        k近邻查询
+
+        从中心网格开始逐环向外扩展；当已找到k个点且第k个点的距离
+        小于下一环的最小可能距离时停止。
+
+        Args:
+            latitude: 中心纬度
+            longitude: 中心经度
+            k: 返回数量
+            max_radius_m: 最大搜索半径（米）
+
+        Returns:
+            按距离升序排列的 (id, 距离米) 列表
+        """
+        if k <= 0 or not self._locations:
+            return []
+
+        center_i, center_j = self._cell_of(latitude, longitude)
+        # 经度方向网格在高纬度更窄，用其宽度估算一环的最小覆盖距离
+        cos_lat = max(math.cos(math.radians(min(abs(latitude), 89.9))), 1e-6)
+        ring_width_m = self.cell_size * METERS_PER_DEGREE_LAT * cos_lat
+        max_ring = None
+        if max_radius_m is not None:
+            max_ring = self._lon_cells_for(latitude, max_radius_m) + 1
+
+        heap: List[Tuple[float, int]] = []  # 以负距离存储的最大堆
+
+        def scan(bucket):
+            # 堆满后只保留比当前第k近更近的点
+            threshold = -heap[0][0] if len(heap) >= k else (max_radius_m if max_radius_m is not None else math.inf)
+            for item_id, distance in self._scan_bucket(bucket, latitude, longitude, threshold):
+                if len(heap) < k:
+                    heapq.heappush(heap, (-distance, item_id))
+                elif distance < -heap[0][0]:
+                    heapq.heapreplace(heap, (-distance, item_id))
+
+        ring = 0
+        with self._lock:
+            while max_ring is None or ring <= max_ring:
+                # 环上网格数超过非空网格总数时，直接扫描剩余网格更快（数据稀疏的情况）
+                if 8 * ring > len(self._cells):
+                    for (i, j), bucket in self._cells.items():
+                        if max(abs(i - center_i), abs(j - center_j)) >= ring:
+                            scan(bucket)
+                    break
+
+                for i, j in self._ring_cells(center_i, center_j, ring):
+                    bucket = self._cells.get((i, j))
+                    if bucket is not None:
+                        scan(bucket)
+
+                # 下一环中的点距离中心至少为 ring * 网格宽度
+                if len(heap) >= k and -heap[0][0] <= ring * ring_width_m:
+                    break
+                ring += 1
+
+        return sorted(((item_id, -neg) for neg, item_id in heap), key=lambda r: r[1])
+
+
+class PropertyGeoIndex(GeoGridIndex):
+    """
+    在售房产坐标索引
+    首次查询时从数据库加载，并按配置的间隔定期重建，以同步其他进程写入的数据
+    """
+
+    def ensure_loaded(self, db: Session):
+        """
+        确保索引已加载且未过期
+
+        Args:
+            db: 数据库会话
+        """
+        refresh = settings.GEO_INDEX_REFRESH_SECONDS
+        if self.loaded_at is not None and (refresh <= 0 or time.monotonic() - self.loaded_at < refresh):
+            return
+        self.reload(db)
+
+    def reload(self, db: Session):
+        """
+        从数据库重建索引
+
+        Args:
+            db: 数据库会话
+        """
+        from app.models.property import Property
+
+        started = time.perf_counter()
+        query = db.query(Property.id, Property.latitude, Property.longitude).filter(
+            Property.status == "active",
+            Property.latitude.isnot(None),
+            Property.longitude.isnot(None)
+        ).execution_options(stream_results=True).yield_per(10000)
+
+        self.bulk_load((row.id, float(row.latitude), float(row.longitude)) for row in query)
+        logger.info(
+            "房产地理索引重建完成: points=%d cells=%d time=%.1fms",
+            len(self), len(self._cells), (time.perf_counter() - started) * 1000
+        )
+
+    def invalidate(self):
+        """标记索引过期，下次查询时从数据库重建（用于批量写入之后）"""
+        self.loaded_at = None
+
+    def sync_property(self, property_obj):
+        """
+        根据房产当前状态同步索引
+
+        Args:
+            property_obj: Property实例
+        """
+        if self.loaded_at is None:
+            # 尚未加载时无需维护，首次查询会从数据库全量加载
+            return
+        if (
+            property_obj.status == "active"
+            and property_obj.latitude is not None
+            and property_obj.longitude is not None
+        ):
+            self.upsert(property_obj.id, float(property_obj.latitude), float(property_obj.longitude))
+        else:
+            self.remove(property_obj.id)
+
+
+def backfill_property_geohash(db: Session, batch_size: int = 1000) -> int:
+    """
+    为存量房产回填geohash
+
+    Args:
+        db: 数据库会话
+        batch_size: 每批更新行数
+
+    Returns:
+        更新的行数
+    """
+    from app.models.property import Property
+
+    updated = 0
+    while True:
+        rows = db.query(Property.id, Property.latitude, Property.longitude).filter(
+            Property.geohash.is_(None),
+            Property.latitude.isnot(None),
+            Property.longitude.isnot(None)
+        ).limit(batch_size).all()
+        if not rows:
+            break
+        db.bulk_update_mappings(Property, [
+            {"id": row.id, "geohash": encode_geohash(float(row.latitude), float(row.longitude))}
+            for row in rows
+        ])
+        db.commit()
+        updated += len(rows)
+
+    logger.info("geohash回填完成: %d行", updated)
+    return updated
+
+
+# 创建房产地理索引实例
+property_geo_index = PropertyGeoIndex(cell_size_deg=settings.GEO_INDEX_CELL_SIZE)
@@ -0,0 +1,89 @@
+"""
+ValuHub 健康检查
+实际探测数据库和Redis，返回状态、延迟和连接池统计
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.database import database
+
+
+async def _probe(check: Callable[[], Any], timeout: float) -> Dict[str, Any]:
+    """
+    在线程池中执行一次探测并计时
+
+    超时后立即返回，探测线程自行结束，不阻塞健康检查
+    """
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(run_in_threadpool(check), timeout=timeout)
+        status = {"status": "up"}
+    except asyncio.TimeoutError:
+        status = {"status": "down", "error": f"超时（{timeout}秒）"}
+    except Exception as e:
+        status = {"status": "down", "error": f"{type(e).__name__}: {e}"}
+    status["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return status
+
+
+async def check_database(engine: Engine = None, timeout: float = None) -> Dict[str, Any]:
+    """
+    执行 SELECT 1 检查数据库，并附带连接池统计
+
+    Args:
+        engine: 数据库引擎，默认为全局同步引擎
+        timeout: 超时秒数，默认 HEALTH_CHECK_TIMEOUT
+    """
+    engine = engine or database.engine
+
+    def ping():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    result = await _probe(ping, timeout or settings.HEALTH_CHECK_TIMEOUT)
+    result["pools"] = {"sync": database.db_pool_monitor.snapshot()}
+    if database.async_db_pool_monitor.pool is not None:
+        result["pools"]["async"] = database.async_db_pool_monitor.snapshot()
+    return result
+
+
+async def check_redis(redis_client=None, timeout: float = None) -> Dict[str, Any]:
+    """
+    执行 PING 检查Redis
+
+    Args:
+        redis_client: Redis客户端，默认为全局缓存的连接
+        timeout: 超时秒数，默认 HEALTH_CHECK_TIMEOUT
+    """
+    if redis_client is None:
+        from app.services.cache import cache
+        redis_client = cache.redis_client
+    return await _probe(redis_client.ping, timeout or settings.HEALTH_CHECK_TIMEOUT)
+
+
+async def health_status() -> Dict[str, Any]:
+    """
+    汇总各依赖状态
+
+    数据库不可用时为 unhealthy（服务无法处理请求），
+    Redis不可用时为 degraded（缓存、限流回退到进程内，仍可服务）
+    """
+    db_status, cache_status = await asyncio.gather(check_database(), check_redis())
+    if db_status["status"] != "up":
+        overall = "unhealthy"
+    elif cache_status["status"] != "up":
+        overall = "degraded"
+    else:
+        overall = "healthy"
+    return {
+        "status": overall,
+        "database": db_status,
+        "cache": cache_status
+    }
@@ -0,0 +1,438 @@
+"""
+ValuHub 增量数据采集
+按数据源保存检查点（变更游标、每个小区的内容哈希、条件请求校验信息），只采集和写入变化的小区；
+原始快照按 数据源/城市/日期 分区追加写入，可重放得到任意时刻的全量数据
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import httpx
+
+from app.core.config import settings
+from app.services.async_collector import (
+    NOT_MODIFIED,
+    AsyncMarketDataCollector,
+    city_communities,
+    community_path
+)
+
+logger = logging.getLogger(__name__)
+
+
+def community_key(record: Dict[str, Any]) -> str:
+    """小区在检查点和快照中的标识"""
+    return f"{record['district']}/{record['community_name']}"
+
+
+def content_hash(record: Dict[str, Any]) -> str:
+    """小区数据的内容哈希（键排序后的JSON）"""
+    body = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def _safe_name(value: str) -> str:
+    """用作目录名的数据源/城市名，保留中文"""
+    return re.sub(r"[^\w.\-]", "_", value)
+
+
+class CheckpointStore:
+    """
+    采集检查点，每个数据源一个JSON文件
+
+    结构: {"cities": {城市: {"cursor", "hashes", "validators", "last_run"}}}
+    写入先写临时文件再原子替换，进程中途退出不会留下半个检查点。
+    """
+
+    def __init__(self, state_dir: str = None):
+        self.directory = os.path.join(state_dir or settings.COLLECTOR_STATE_DIR, "checkpoints")
+
+    def _path(self, source: str) -> str:
+        return os.path.join(self.directory, f"{_safe_name(source)}.json")
+
+    def load(self, source: str) -> Dict[str, Any]:
+        path = self._path(source)
+        if not os.path.exists(path):
+            return {"cities": {}}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, source: str, checkpoint: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(source)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class SnapshotStore:
+    """
+    原始快照，只追加
+
+    路径: snapshots/source=<数据源>/city=<城市>/date=<YYYY-MM-DD>/part-<时间>-<随机串>.jsonl.gz
+    每次采集的变化记录写成一个新文件，已有文件从不修改；按路径排序即按写入时间排序。
+    """
+
+    def __init__(self, state_dir: str = None):
+        self.directory = os.path.join(state_dir or settings.COLLECTOR_STATE_DIR, "snapshots")
+
+    def _city_dir(self, source: str, city: str) -> str:
+        return os.path.join(self.directory, f"source={_safe_name(source)}", f"city={_safe_name(city)}")
+
+    def append(
+        self, source: str, city: str, records: List[Dict[str, Any]], fetched_at: float = None, part: str = None
+    ) -> Optional[str]:
+        """
+        追加一批记录
+
+        Args:
+            part: 文件名中的批次标识，默认随机；传入同一批次标识重复写入时覆盖同一文件，重试不会产生重复快照
+
+        Returns:
+            写入的文件路径，没有记录时为None
+        """
+        if not records:
+            return None
+        fetched_at = fetched_at or time.time()
+        moment = datetime.fromtimestamp(fetched_at)
+        partition = os.path.join(self._city_dir(source, city), f"date={moment:%Y-%m-%d}")
+        os.makedirs(partition, exist_ok=True)
+
+        name = f"part-{moment:%Y%m%dT%H%M%S%f}-{_safe_name(part or uuid.uuid4().hex[:8])}.jsonl.gz"
+        path = os.path.join(partition, name)
+        tmp_path = os.path.join(partition, f".{name}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps({"fetched_at": fetched_at, "data": record}, ensure_ascii=False))
+                f.write("\n")
+        os.replace(tmp_path, path)
+        return path
+
+    def files(self, source: str, city: str) -> List[str]:
+        """按写入顺序列出城市的快照文件"""
+        city_dir = self._city_dir(source, city)
+        if not os.path.isdir(city_dir):
+            return []
+        paths = []
+        for partition in sorted(os.listdir(city_dir)):
+            partition_dir = os.path.join(city_dir, partition)
+            if partition.startswith("date=") and os.path.isdir(partition_dir):
+                paths.extend(
+                    os.path.join(partition_dir, name)
+                    for name in sorted(os.listdir(partition_dir))
+                    if name.endswith(".jsonl.gz")
+                )
+        return paths
+
+    def replay(self, source: str, city: str, until: float = None) -> List[Dict[str, Any]]:
+        """
+        重放快照，得到每个小区的最新记录
+
+        Args:
+            until: 只重放该时间戳之前采集的记录，默认全部
+        """
+        latest: Dict[str, Dict[str, Any]] = {}
+        for path in self.files(source, city):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    if until is not None and row["fetched_at"] > until:
+                        continue
+                    latest[community_key(row["data"])] = row["data"]
+        return list(latest.values())
+
+
+class CityChanges:
+    """单个城市一次增量采集的结果"""
+
+    def __init__(self, city: str, changed: List[Dict[str, Any]], checked: int, state: Dict[str, Any]):
+        self.city = city
+        self.changed = changed
+        self.checked = checked
+        self.state = state
+
+
+class IncrementalCollector:
+    """
+    增量采集
+
+    有检查点时先读取数据源的变更feed，只请求游标之后变化的小区；数据源不支持feed时
+    对全部小区发条件请求（未变化的返回304）。请求到的数据再与检查点中的内容哈希比较，
+    只有内容确实变化的小区才写入快照和缓存。采集耗时与变化量成正比，而不是小区总数。
+    """
+
+    def __init__(
+        self,
+        fetcher: AsyncMarketDataCollector = None,
+        checkpoints: CheckpointStore = None,
+        snapshots: SnapshotStore = None
+    ):
+        self.fetcher = fetcher or AsyncMarketDataCollector()
+        self.checkpoints = checkpoints or CheckpointStore()
+        self.snapshots = snapshots or SnapshotStore()
+
+    @property
+    def source(self) -> str:
+        """数据源标识（主机名）"""
+        return httpx.URL(self.fetcher.base_url).host
+
+    async def _changed_since(
+        self, client: httpx.AsyncClient, city: str, cursor: Any
+    ) -> Tuple[Optional[List[Tuple[str, str]]], Any]:
+        """
+        读取变更feed
+
+        Returns:
+            (变化的 (区域, 小区) 列表, 新游标)；数据源不支持feed时为 (None, None)
+        """
+        try:
+            feed = await self.fetcher.fetch_json(client, f"/cities/{quote(city)}/changes?since={quote(str(cursor))}")
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (404, 501):
+                return None, None
+            raise
+
+        seen = set()
+        candidates = []
+        for change in feed.get("changes", []):
+            key = (change["district"], change["community"])
+            if key not in seen:
+                seen.add(key)
+                candidates.append(key)
+        return candidates, feed.get("cursor", cursor)
+
+    async def plan_city(
+        self, client: httpx.AsyncClient, city: str, state: Dict[str, Any], full: bool = False
+    ) -> Tuple[List[Tuple[str, str]], Any]:
+        """
+        确定本次需要请求的小区
+
+        Returns:
+            ((区域, 小区) 列表, 新游标)
+        """
+        cursor = state.get("cursor")
+        if not full and cursor is not None and state.get("hashes"):
+            candidates, new_cursor = await self._changed_since(client, city, cursor)
+            if candidates is not None:
+                return candidates, new_cursor
+        # 首次采集、全量校对或数据源不支持feed：记录当前游标后遍历全部小区
+        _, new_cursor = await self._changed_since(client, city, cursor if cursor is not None else 0)
+        return city_communities(city), new_cursor
+
+    async def fetch_changed(
+        self, client: httpx.AsyncClient, city: str, candidates: Sequence[Tuple[str, str]], hashes: Dict[str, str]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """
+        请求候选小区并与已知内容哈希比较
+
+        Returns:
+            (内容变化的记录, 这些记录的新哈希)
+
+        Raises:
+            httpx.HTTPError: 任一小区请求失败
+        """
+        records = await asyncio.gather(
+            *(
+                self.fetcher.fetch_json(client, community_path(city, d, c), allow_not_modified=True)
+                for d, c in candidates
+            ),
+            return_exceptions=True
+        )
+        for record in records:
+            if isinstance(record, BaseException):
+                raise record
+
+        changed = []
+        new_hashes = {}
+        for record in records:
+            if record is NOT_MODIFIED:
+                continue
+            key = community_key(record)
+            digest = content_hash(record)
+            if hashes.get(key) != digest and new_hashes.get(key) != digest:
+                new_hashes[key] = digest
+                changed.append(record)
+        return changed, new_hashes
+
+    async def collect_city(
+        self, client: httpx.AsyncClient, city: str, state: Dict[str, Any], full: bool = False
+    ) -> CityChanges:
+        """
+        增量采集一个城市
+
+        Args:
+            client: HTTP客户端
+            city: 城市
+            state: 该城市的检查点
+            full: 忽略变更游标，对全部小区发条件请求（用于定期校对）
+        """
+        hashes = state.get("hashes", {})
+        candidates, new_cursor = await self.plan_city(client, city, state, full)
+        changed, changed_hashes = await self.fetch_changed(client, city, candidates, hashes)
+
+        new_state = {
+            "cursor": new_cursor,
+            "hashes": {**hashes, **changed_hashes},
+            "validators": self._validators_for(city),
+            "last_run": time.time()
+        }
+        return CityChanges(city, changed, len(candidates), new_state)
+
+    def _validators_for(self, city: str, district: str = None) -> Dict[str, Dict[str, Any]]:
+        """城市（或其中一个区域）相关的条件请求校验信息（不含数据本身）"""
+        prefix = self.fetcher.base_url.rstrip("/") + f"/cities/{quote(city)}/districts/"
+        if district is not None:
+            prefix += f"{quote(district)}/"
+        return {
+            url: {"etag": v.get("etag"), "last_modified": v.get("last_modified")}
+            for url, v in self.fetcher.validators.items()
+            if url.startswith(prefix)
+        }
+
+    def _restore_validators(self, city_states: Dict[str, Any], cities: Sequence[str]):
+        """恢复上次运行的校验信息，进程重启后仍可发条件请求"""
+        for city in cities:
+            for url, validator in city_states.get(city, {}).get("validators", {}).items():
+                self.fetcher.validators.setdefault(url, dict(validator))
+
+    async def collect_cities(self, cities: Sequence[str], full: bool = False) -> Dict[str, Any]:
+        """
+        并行增量采集多个城市，成功的城市写入快照并更新检查点
+
+        Returns:
+            城市 -> CityChanges；失败的城市对应异常对象，其检查点保持不变
+        """
+        source = self.source
+        checkpoint = self.checkpoints.load(source)
+        city_states = checkpoint.setdefault("cities", {})
+
+        self._restore_validators(city_states, cities)
+
+        self.fetcher.reset_throttles()
+        async with self.fetcher.client() as client:
+            results = await asyncio.gather(
+                *(self.collect_city(client, city, city_states.get(city, {}), full) for city in cities),
+                return_exceptions=True
+            )
+
+        fetched_at = time.time()
+        for city, result in zip(cities, results):
+            if isinstance(result, BaseException):
+                logger.warning("%s增量采集失败: %s", city, result)
+                continue
+            # 先写快照再推进检查点：中途失败时下次会重新采集这些变化
+            self.snapshots.append(source, city, result.changed, fetched_at)
+            city_states[city] = result.state
+
+        self.checkpoints.save(source, checkpoint)
+        return dict(zip(cities, results))
+
+    def run(self, cities: Sequence[str], full: bool = False) -> Dict[str, Any]:
+        """同步入口，单进程内完成全部城市"""
+        return asyncio.run(self.collect_cities(cities, full))
+
+    # 以下三个步骤供分布式任务使用：plan -> 按区域 fetch_district（可在不同worker上并行）-> commit
+
+    def plan(self, cities: Sequence[str], full: bool = False) -> Dict[str, Any]:
+        """
+        为每个城市确定本次需要请求的小区，按区域分组
+
+        Returns:
+            城市 -> {"cursor", "districts": {区域: [小区, ...]}}；读取变更feed失败的城市对应异常对象
+        """
+        city_states = self.checkpoints.load(self.source).get("cities", {})
+
+        async def plan_all():
+            self.fetcher.reset_throttles()
+            async with self.fetcher.client() as client:
+                return await asyncio.gather(
+                    *(self.plan_city(client, city, city_states.get(city, {}), full) for city in cities),
+                    return_exceptions=True
+                )
+
+        plans = {}
+        for city, result in zip(cities, asyncio.run(plan_all())):
+            if isinstance(result, BaseException):
+                plans[city] = result
+                continue
+            candidates, cursor = result
+            districts: Dict[str, List[str]] = {}
+            for district, community in candidates:
+                districts.setdefault(district, []).append(community)
+            plans[city] = {"cursor": cursor, "districts": districts}
+        return plans
+
+    def fetch_district(self, city: str, district: str, communities: Sequence[str]) -> Dict[str, Any]:
+        """
+        请求一个区域的候选小区，只读不写，失败后可安全重试
+
+        Returns:
+            {"changed": 变化的记录, "hashes": 新哈希, "validators": 区域的条件请求校验信息}
+        """
+        city_states = self.checkpoints.load(self.source).get("cities", {})
+        self._restore_validators(city_states, [city])
+        hashes = city_states.get(city, {}).get("hashes", {})
+
+        async def fetch():
+            self.fetcher.reset_throttles()
+            async with self.fetcher.client() as client:
+                return await self.fetch_changed(client, city, [(district, c) for c in communities], hashes)
+
+        changed, new_hashes = asyncio.run(fetch())
+        return {"changed": changed, "hashes": new_hashes, "validators": self._validators_for(city, district)}
+
+    def commit(
+        self, city_results: Dict[str, Dict[str, Any]], fetched_at: float, run_id: str
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        写入快照并推进检查点
+
+        Args:
+            city_results: 城市 -> {"cursor", "districts": [fetch_district 的结果, ...]}，只包含全部区域都成功的城市
+            fetched_at: 本次采集的开始时间
+            run_id: 本次采集的标识，重复提交同一次采集时覆盖同一快照文件
+
+        Returns:
+            城市 -> 变化的记录
+        """
+        source = self.source
+        checkpoint = self.checkpoints.load(source)
+        city_states = checkpoint.setdefault("cities", {})
+
+        changes = {}
+        for city, result in city_results.items():
+            state = city_states.get(city, {})
+            hashes = dict(state.get("hashes", {}))
+            validators = dict(state.get("validators", {}))
+            changed = []
+            for district in result["districts"]:
+                changed.extend(district["changed"])
+                hashes.update(district["hashes"])
+                validators.update(district["validators"])
+
+            self.snapshots.append(source, city, changed, fetched_at, part=run_id)
+            city_states[city] = {
+                "cursor": result["cursor"],
+                "hashes": hashes,
+                "validators": validators,
+                "last_run": fetched_at
+            }
+            changes[city] = changed
+
+        self.checkpoints.save(source, checkpoint)
+        return changes
+
+    def replay(self, city: str, until: float = None) -> List[Dict[str, Any]]:
+        """重放快照得到城市的全量数据"""
+        return self.snapshots.replay(self.source, city, until)
@@ -0,0 +1,225 @@
+"""
+ValuHub 订单存储
+订单以追加写入的事件日志保存（每行一个JSON事件），进程内按订单号和手机号建立索引；
+其他进程追加的事件在下次访问时从上次读到的位置增量读入，单次操作的开销与订单总量无关
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内锁，需单进程部署
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ORDER_PENDING = "pending"
+ORDER_PAID = "paid"
+ORDER_FAILED = "failed"
+
+# 允许的状态转换：支付失败后可重新支付，已支付为终态
+ORDER_TRANSITIONS = {
+    ORDER_PENDING: {ORDER_PAID, ORDER_FAILED},
+    ORDER_FAILED: {ORDER_PAID},
+    ORDER_PAID: set()
+}
+
+
+class OrderConflict(ValueError):
+    """状态变更与订单当前状态冲突（如已用另一笔交易支付）"""
+
+
+def new_order_id() -> str:
+    """生成订单号：时间前缀便于排查，随机部分保证多进程并发时不重复"""
+    return f"order_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:12]}"
+
+
+class OrderStore:
+    """
+    订单存储
+
+    事件类型：
+        created: {"type": "created", "order": {...}}
+        status:  {"type": "status", "order_id", "status", "transaction_id", "pay_time", "at"}
+
+    写入时持有文件锁（fcntl可用时），先读入其他进程追加的事件再校验状态转换，
+    重复的支付回调不会产生新事件。
+    """
+
+    def __init__(self, path: str, legacy_path: str = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._lock = threading.RLock()
+        self._offset = 0
+        self._orders: Dict[str, Dict[str, Any]] = {}
+        self._by_phone: Dict[str, List[str]] = {}
+        self._history: Dict[str, List[Dict[str, Any]]] = {}
+        self._ready = False
+
+    def _apply(self, event: Dict[str, Any]):
+        if event["type"] == "created":
+            order = dict(event["order"])
+            self._orders[order["order_id"]] = order
+            self._by_phone.setdefault(order["user_phone"], []).append(order["order_id"])
+            self._history[order["order_id"]] = [{"status": order["status"], "at": order["created_at"]}]
+        elif event["type"] == "status":
+            order = self._orders.get(event["order_id"])
+            if order is None:
+                return
+            order["status"] = event["status"]
+            order["transaction_id"] = event.get("transaction_id")
+            order["pay_time"] = event.get("pay_time")
+            self._history[order["order_id"]].append({
+                "status": event["status"], "transaction_id": event.get("transaction_id"), "at": event["at"]
+            })
+
+    def _refresh(self):
+        """读入上次之后追加的事件（只处理完整的行）"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+        self._offset += end
+
+    def _append(self, events: List[Dict[str, Any]]):
+        payload = b"".join(json.dumps(e, ensure_ascii=False).encode("utf-8") + b"\n" for e in events)
+        with open(self.path, "ab") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        for event in events:
+            self._apply(event)
+        self._offset += len(payload)
+
+    def _write_lock(self):
+        """跨进程写锁（锁文件），返回需在finally中关闭的文件对象"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        handle = open(f"{self.path}.lock", "a")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _import_legacy(self):
+        """首次启动时导入旧的 orders.json（整文件保存的订单列表）"""
+        if os.path.exists(self.path) or not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        with open(self.legacy_path, "r", encoding="utf-8") as f:
+            orders = json.load(f)
+        self._append([{"type": "created", "order": order} for order in orders])
+        logger.info("已导入%d个旧订单: %s", len(orders), self.legacy_path)
+
+    def _write(self, build):
+        """在写锁内读入最新事件后生成并追加新事件，build 返回 (事件列表, 结果)"""
+        with self._lock:
+            handle = self._write_lock()
+            try:
+                if not self._ready:
+                    self._import_legacy()
+                    self._ready = True
+                self._refresh()
+                events, result = build()
+                if events:
+                    self._append(events)
+                return result
+            finally:
+                handle.close()
+
+    def _sync(self):
+        """读入最新事件（首次访问时可能需要导入旧数据，走写入流程）"""
+        if self._ready:
+            self._refresh()
+        else:
+            self._write(lambda: ([], None))
+
+    def create(self, user_phone: str, project_id: str, report_id: str, amount: float, pay_type: str) -> Dict[str, Any]:
+        """创建待支付订单"""
+        order = {
+            "order_id": new_order_id(),
+            "user_phone": user_phone,
+            "project_id": project_id,
+            "report_id": report_id,
+            "amount": amount,
+            "status": ORDER_PENDING,
+            "pay_type": pay_type,
+            "created_at": datetime.now().isoformat(),
+            "pay_time": None,
+            "transaction_id": None
+        }
+        self._write(lambda: ([{"type": "created", "order": order}], None))
+        return dict(self._orders[order["order_id"]])
+
+    def get(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """按订单号查询"""
+        with self._lock:
+            self._sync()
+            order = self._orders.get(order_id)
+            return dict(order) if order else None
+
+    def list_by_user(self, user_phone: str, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+        """用户订单，按创建时间倒序"""
+        with self._lock:
+            self._sync()
+            order_ids = self._by_phone.get(user_phone, [])
+            end = len(order_ids) - offset
+            selected = order_ids[max(0, end - limit):max(0, end)]
+            return [dict(self._orders[order_id]) for order_id in reversed(selected)]
+
+    def history(self, order_id: str) -> List[Dict[str, Any]]:
+        """订单状态变更记录"""
+        with self._lock:
+            self._sync()
+            return [dict(item) for item in self._history.get(order_id, [])]
+
+    def transition(
+        self, order_id: str, status: str, transaction_id: str = None, pay_time: str = None
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        变更订单状态（幂等）
+
+        重复的回调（状态和交易号均相同）、以及已支付后迟到的失败通知不会改变订单。
+
+        Returns:
+            (订单, 是否发生变更)
+
+        Raises:
+            KeyError: 订单不存在
+            OrderConflict: 订单已由另一笔交易支付，或状态转换不合法
+        """
+        def build():
+            order = self._orders.get(order_id)
+            if order is None:
+                raise KeyError(order_id)
+            current = order["status"]
+            if current == status and order.get("transaction_id") == transaction_id:
+                return [], (dict(order), False)
+            if current == ORDER_PAID:
+                if status == ORDER_FAILED:
+                    return [], (dict(order), False)
+                raise OrderConflict(f"订单{order_id}已由交易{order.get('transaction_id')}支付")
+            if status not in ORDER_TRANSITIONS.get(current, set()) and status != current:
+                raise OrderConflict(f"订单{order_id}不能从{current}变更为{status}")
+            event = {
+                "type": "status",
+                "order_id": order_id,
+                "status": status,
+                "transaction_id": transaction_id,
+                "pay_time": pay_time,
+                "at": datetime.now().isoformat()
+            }
+            return [event], None
+
+        result = self._write(build)
+        if result is not None:
+            return result
+        return dict(self._orders[order_id]), True
@@ -1,23 +1,165 @@
-import oss2
-import uuid
+import hashlib
+import json
+import logging
 import os
+import shutil
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from types import SimpleNamespace
+
+import oss2
+from oss2.models import PartInfo
+
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+class LocalBucket:
+    """
+    以本地目录模拟OSS Bucket（测试使用，本地部署请使用 storage.LocalStorage）
+
+    只实现OssService用到的接口，返回值和异常与oss2保持一致。
+    对象保存在 <root>/objects，未完成的分片上传保存在 <root>/multipart/<upload_id>。
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, "objects", key))
+        if not path.startswith(os.path.join(self.root, "objects") + os.sep):
+            raise ValueError(f"非法的对象名: {key}")
+        return path
+
+    def _upload_dir(self, key, upload_id):
+        directory = os.path.join(self.root, "multipart", upload_id)
+        if not os.path.isdir(directory):
+            raise oss2.exceptions.NoSuchUpload(404, {}, b"", {"Key": key, "UploadId": upload_id})
+        return directory
+
+    def _write(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            if isinstance(data, (bytes, bytearray)):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f)
+        os.replace(temp_path, path)
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest().upper()
+
+    def put_object(self, key, data):
+        return SimpleNamespace(status=200, etag=self._write(key, data))
+
+    def put_object_from_file(self, key, filename):
+        with open(filename, "rb") as f:
+            return self.put_object(key, f)
+
+    def get_object_to_file(self, key, filename):
+        if not self.object_exists(key):
+            raise oss2.exceptions.NoSuchKey(404, {}, b"", {"Key": key})
+        shutil.copyfile(self._path(key), filename)
+        return SimpleNamespace(status=200)
+
+    def object_exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def delete_object(self, key):
+        if self.object_exists(key):
+            os.remove(self._path(key))
+        return SimpleNamespace(status=204)
+
+    def init_multipart_upload(self, key):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.root, "multipart", upload_id))
+        return SimpleNamespace(status=200, upload_id=upload_id)
+
+    def upload_part(self, key, upload_id, part_number, data):
+        directory = self._upload_dir(key, upload_id)
+        with open(os.path.join(directory, f"{part_number:05d}"), "wb") as f:
+            f.write(data)
+        return SimpleNamespace(status=200, etag=hashlib.md5(data).hexdigest().upper())
+
+    def list_parts(self, key, upload_id):
+        directory = self._upload_dir(key, upload_id)
+        parts = []
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), "rb") as f:
+                data = f.read()
+            parts.append(PartInfo(int(name), hashlib.md5(data).hexdigest().upper(), size=len(data)))
+        return SimpleNamespace(status=200, parts=parts)
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        directory = self._upload_dir(key, upload_id)
+        uploaded = {part.part_number: part.etag for part in self.list_parts(key, upload_id).parts}
+        for part in parts:
+            if uploaded.get(part.part_number) != part.etag:
+                raise oss2.exceptions.InvalidArgument(400, {}, b"", {"Message": f"分片{part.part_number}不存在或ETag不一致"})
+
+        def chunks():
+            for part in sorted(parts, key=lambda p: p.part_number):
+                with open(os.path.join(directory, f"{part.part_number:05d}"), "rb") as f:
+                    yield f.read()
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            for chunk in chunks():
+                f.write(chunk)
+        os.replace(temp_path, path)
+        shutil.rmtree(directory)
+        return SimpleNamespace(status=200)
+
+    def abort_multipart_upload(self, key, upload_id):
+        shutil.rmtree(self._upload_dir(key, upload_id))
+        return SimpleNamespace(status=204)
+
+
+def _read_exact(stream, size):
+    """读取size字节，流结束时返回的字节数可能更少"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
 class OssService:
-    def __init__(self):
+    def __init__(self, bucket=None, multipart_threshold=None, part_size=None, threads=None, checkpoint_dir=None):
+        # 分片上传参数：超过阈值的文件按part_size分片，由threads个线程并行上传
+        self.multipart_threshold = multipart_threshold or settings.OSS_MULTIPART_THRESHOLD
+        self.part_size = part_size or settings.OSS_PART_SIZE
+        self.threads = threads or settings.OSS_UPLOAD_THREADS
+        self.checkpoint_dir = checkpoint_dir or settings.OSS_CHECKPOINT_DIR
+
         # 初始化OSS客户端
         self.available = False
-        if settings.OSS_ACCESS_KEY_ID and settings.OSS_ACCESS_KEY_SECRET:
+        if bucket is not None:
+            self.bucket = bucket
+            self.available = True
+        elif settings.OSS_ACCESS_KEY and settings.OSS_SECRET_KEY:
             try:
                 self.auth = oss2.Auth(
-                    settings.OSS_ACCESS_KEY_ID.strip(),
-                    settings.OSS_ACCESS_KEY_SECRET.strip()
+                    settings.OSS_ACCESS_KEY.strip(),
+                    settings.OSS_SECRET_KEY.strip()
                 )
                 self.bucket = oss2.Bucket(
                     self.auth,
                     settings.OSS_ENDPOINT,
-                    settings.OSS_BUCKET_NAME
+                    settings.OSS_BUCKET
                 )
                 self.available = True
             except Exception as e:
@@ -26,7 +168,7 @@ class OssService:
         else:
             print("OSS配置不完整，服务不可用")
             self.available = False
-    
+
     def generate_unique_filename(self, original_filename):
         """生成唯一的文件名，防止文件覆盖"""
         # 获取文件扩展名
@@ -37,38 +179,222 @@ class OssService:
         time_prefix = datetime.now().strftime("%Y%m%d/%H%M%S")
         # 组合成唯一文件名
         return f"uploads/{time_prefix}_{unique_id}{ext}"
-    
+
+    def object_url(self, key):
+        """对象的访问URL"""
+        if settings.OSS_BASE_URL:
+            return f"{settings.OSS_BASE_URL.rstrip('/')}/{key}"
+        return f"https://{settings.OSS_BUCKET}.{settings.OSS_ENDPOINT}/{key}"
+
+    def _upload_parts(self, key, upload_id, parts, on_uploaded=None):
+        """
+        并行上传分片
+
+        Args:
+            parts: 产出 (分片号, 数据) 的迭代器，按需读取，内存中最多保留 threads 个分片
+            on_uploaded: 每个分片上传成功后的回调 (分片号, ETag, 大小)，在调用线程中执行
+
+        Returns:
+            已上传分片的PartInfo列表
+        """
+        uploaded = []
+        pending = deque()
+
+        def collect():
+            part_number, size, future = pending.popleft()
+            etag = future.result().etag
+            uploaded.append(PartInfo(part_number, etag, size=size))
+            if on_uploaded:
+                on_uploaded(part_number, etag, size)
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            try:
+                for part_number, data in parts:
+                    future = executor.submit(self.bucket.upload_part, key, upload_id, part_number, data)
+                    pending.append((part_number, len(data), future))
+                    if len(pending) >= self.threads:
+                        collect()
+                while pending:
+                    collect()
+            finally:
+                # 出错时不再上传排队中的分片
+                for _, _, future in pending:
+                    future.cancel()
+        return uploaded
+
+    def upload_stream(self, key, stream):
+        """
+        边读边上传文件流，不把整个文件读入内存
+
+        小于分片阈值时一次上传；否则使用分片上传，读到一个分片就提交一个分片。
+        流无法重读，失败时放弃本次分片上传。
+
+        Returns:
+            上传的字节数
+        """
+        head = _read_exact(stream, self.multipart_threshold)
+        if len(head) < self.multipart_threshold:
+            self.bucket.put_object(key, head)
+            return len(head)
+
+        def parts():
+            buffer, part_number = head, 1
+            while True:
+                if len(buffer) < self.part_size:
+                    buffer += _read_exact(stream, self.part_size - len(buffer))
+                if not buffer:
+                    return
+                yield part_number, buffer[:self.part_size]
+                buffer, part_number = buffer[self.part_size:], part_number + 1
+
+        upload_id = self.bucket.init_multipart_upload(key).upload_id
+        try:
+            uploaded = self._upload_parts(key, upload_id, parts())
+            self.bucket.complete_multipart_upload(key, upload_id, uploaded)
+        except Exception:
+            self.bucket.abort_multipart_upload(key, upload_id)
+            raise
+        return sum(part.size for part in uploaded)
+
+    def _checkpoint_path(self, key, local_path):
+        digest = hashlib.sha1(f"{key}\0{os.path.abspath(local_path)}".encode("utf-8")).hexdigest()
+        return os.path.join(self.checkpoint_dir, f"{digest}.json")
+
+    def _load_checkpoint(self, path, expected):
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if any(record.get(name) != value for name, value in expected.items()):
+            return None
+        return record
+
+    def _save_checkpoint(self, path, record):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(temp_path, path)
+
+    def multipart_upload_file(self, key, local_path):
+        """
+        断点续传上传本地文件
+
+        已上传的分片记录在检查点文件中，上传中断后再次调用只上传剩余分片；
+        文件大小、修改时间或分片大小变化时重新开始。
+        """
+        stat = os.stat(local_path)
+        expected = {"key": key, "size": stat.st_size, "mtime": stat.st_mtime, "part_size": self.part_size}
+        checkpoint_path = self._checkpoint_path(key, local_path)
+        record = self._load_checkpoint(checkpoint_path, expected)
+
+        for attempt in range(2):
+            if record is None:
+                record = dict(expected, upload_id=self.bucket.init_multipart_upload(key).upload_id, parts={})
+                self._save_checkpoint(checkpoint_path, record)
+            upload_id = record["upload_id"]
+
+            def remember(part_number, etag, size):
+                record["parts"][str(part_number)] = {"etag": etag, "size": size}
+                self._save_checkpoint(checkpoint_path, record)
+
+            def parts():
+                part_count = max(1, -(-stat.st_size // self.part_size))
+                with open(local_path, "rb") as f:
+                    for part_number in range(1, part_count + 1):
+                        if str(part_number) in record["parts"]:
+                            continue
+                        f.seek((part_number - 1) * self.part_size)
+                        yield part_number, f.read(self.part_size)
+
+            try:
+                self._upload_parts(key, upload_id, parts(), on_uploaded=remember)
+                self.bucket.complete_multipart_upload(key, upload_id, [
+                    PartInfo(int(number), part["etag"], size=part["size"])
+                    for number, part in sorted(record["parts"].items(), key=lambda item: int(item[0]))
+                ])
+            except oss2.exceptions.NoSuchUpload:
+                # 上传任务已被清理（如生命周期规则），丢弃检查点从头上传
+                if attempt:
+                    raise
+                record = None
+                continue
+            break
+
+        os.remove(checkpoint_path)
+        return stat.st_size
+
     def upload_file(self, file_obj, original_filename):
-        """上传文件到OSS"""
+        """上传文件到OSS（流式，大文件自动分片并行上传）"""
         # 生成唯一文件名
         filename = self.generate_unique_filename(original_filename)
-        
+
         try:
             # 重置文件指针到开头
             file_obj.seek(0)
             # 上传文件
-            result = self.bucket.put_object(filename, file_obj)
-            
-            if result.status == 200:
-                # 构造文件URL
-                file_url = f"{settings.OSS_BASE_URL}/{filename}" if settings.OSS_BASE_URL else f"https://{settings.OSS_BUCKET_NAME}.{settings.OSS_ENDPOINT}/{filename}"
-                return {
-                    "success": True,
-                    "url": file_url,
-                    "filename": filename,
-                    "original_filename": original_filename
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"上传失败，状态码: {result.status}"
-                }
+            size = self.upload_stream(filename, file_obj)
+            return {
+                "success": True,
+                "url": self.object_url(filename),
+                "filename": filename,
+                "original_filename": original_filename,
+                "size": size
+            }
         except Exception as e:
+            logger.warning("OSS上传失败 %s: %s", original_filename, e)
             return {
                 "success": False,
+                "original_filename": original_filename,
                 "error": str(e)
             }
-    
+
+    def upload_files(self, files):
+        """
+        批量上传
+
+        Args:
+            files: (文件对象, 原始文件名) 列表
+
+        Returns:
+            与输入顺序一致的上传结果列表
+        """
+        if not files:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(files), settings.OSS_BATCH_UPLOAD_CONCURRENCY)) as executor:
+            return list(executor.map(lambda item: self.upload_file(*item), files))
+
+    def put_file(self, key, local_path):
+        """按指定的对象名上传本地文件，超过分片阈值时断点续传"""
+        try:
+            if os.path.getsize(local_path) >= self.multipart_threshold:
+                self.multipart_upload_file(key, local_path)
+                return True
+            result = self.bucket.put_object_from_file(key, local_path)
+            return result.status == 200
+        except Exception as e:
+            logger.warning("OSS上传失败 %s: %s", key, e)
+            return False
+
+    def download_file(self, key, local_path):
+        """下载对象到本地文件，对象不存在时返回False"""
+        try:
+            self.bucket.get_object_to_file(key, local_path)
+            return True
+        except oss2.exceptions.NoSuchKey:
+            return False
+        except Exception as e:
+            logger.warning("OSS下载失败 %s: %s", key, e)
+            return False
+
+    def object_exists(self, key):
+        """对象是否存在"""
+        try:
+            return self.bucket.object_exists(key)
+        except Exception:
+            return False
+
     def delete_file(self, filename):
         """从OSS删除文件"""
         try:
@@ -78,4 +404,4 @@ class OssService:
             return False
 
 # 创建OSS服务实例
-oss_service = OssService()
\ No newline at end of file
+oss_service = OssService()
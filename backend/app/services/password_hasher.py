@@ -0,0 +1,65 @@
+"""
+ValuHub 密码哈希服务
+bcrypt计算放到有界线程池执行，避免阻塞事件循环
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 固定bcrypt成本参数：成本与配置不一致的旧哈希在登录校验时会被标记为需要重新哈希
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS
+)
+
+# bcrypt在计算时释放GIL，线程池即可并行利用多核；线程数即最大并发哈希数，
+# 超出的请求在队列中等待，不占用事件循环
+_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+
+
+async def hash_password(password: str) -> str:
+    """
+    在线程池中计算密码哈希
+
+    Args:
+        password: 明文密码
+
+    Returns:
+        bcrypt哈希
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, pwd_context.hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """
+    在线程池中校验密码
+
+    Args:
+        password: 明文密码
+        password_hash: 已保存的哈希
+
+    Returns:
+        (是否匹配, 新哈希)；成本参数变化时新哈希非空，调用方应写回数据库
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_executor, pwd_context.verify_and_update, password, password_hash)
+    except ValueError:
+        # 哈希格式无法识别时按校验失败处理
+        logger.warning("无法识别的密码哈希格式")
+        return False, None
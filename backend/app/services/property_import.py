@@ -0,0 +1,300 @@
+"""
+ValuHub 房产批量导入服务
+分块多行INSERT写入，支持JSON批量数据和CSV/XLSX文件流式导入
+"""
+
+import csv
+import io
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.property import Property
+from app.schemas.property import PropertyCreate
+from app.services.geo import encode_geohash
+
+logger = logging.getLogger(__name__)
+
+# 单条INSERT语句的绑定参数上限（SQLite默认32766，PostgreSQL为65535）
+MAX_BIND_PARAMS = 30000
+
+# 返回给客户端的校验错误条数上限
+MAX_REPORTED_ERRORS = 100
+
+# 文件导入支持的扩展名
+SUPPORTED_IMPORT_EXTENSIONS = (".csv", ".xlsx")
+
+
+class ImportStats:
+    """
+    导入统计信息
+    """
+
+    def __init__(self):
+        self.row_count = 0
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+
+    def finish(self):
+        """标记导入结束"""
+        self.finished_at = time.perf_counter()
+
+    @property
+    def elapsed_seconds(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return max(end - self.started_at, 1e-9)
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.row_count / self.elapsed_seconds, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            "count": self.row_count,
+            "elapsed_ms": round(self.elapsed_seconds * 1000, 2),
+            "rows_per_second": self.rows_per_second
+        }
+
+
+class PropertyImportError(Exception):
+    """
+    批量导入校验失败
+    """
+
+    def __init__(self, errors: List[Dict[str, Any]], total_errors: int):
+        self.errors = errors
+        self.total_errors = total_errors
+        super().__init__(f"{total_errors}行数据校验失败")
+
+
+def property_row(prop: PropertyCreate, user_id: int, tenant_id: int, now: datetime) -> Dict[str, Any]:
+    """
+    将校验后的房产数据转换为INSERT参数
+
+    Args:
+        prop: 校验后的房产数据
+        user_id: 当前用户ID
+        tenant_id: 租户ID
+        now: 本批次的创建时间
+
+    Returns:
+        列名到值的字典
+    """
+    return {
+        "user_id": user_id,
+        "tenant_id": tenant_id,
+        "address": prop.address,
+        "city": prop.city,
+        "district": prop.district,
+        "area": prop.area,
+        "floor_level": prop.floor_level,
+        "building_year": prop.building_year,
+        "property_type": prop.property_type.value if prop.property_type else None,
+        "rooms": prop.rooms,
+        "bathrooms": prop.bathrooms,
+        "orientation": prop.orientation,
+        "decoration_status": prop.decoration_status,
+        "latitude": prop.latitude,
+        "longitude": prop.longitude,
+        # 批量INSERT不触发ORM事件，需显式计算geohash
+        "geohash": encode_geohash(prop.latitude, prop.longitude)
+        if prop.latitude is not None and prop.longitude is not None else None,
+        "status": "active",
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+def _chunked(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """按固定大小分块"""
+    chunk: List[Dict[str, Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _effective_chunk_size(chunk_size: Optional[int], column_count: int) -> int:
+    """根据列数限制每块行数，避免超出数据库绑定参数上限"""
+    chunk_size = chunk_size or settings.BULK_INSERT_CHUNK_SIZE
+    return max(1, min(chunk_size, MAX_BIND_PARAMS // max(column_count, 1)))
+
+
+def bulk_insert_properties(
+    db: Session,
+    rows: Iterable[Dict[str, Any]],
+    chunk_size: Optional[int] = None,
+    stats: Optional[ImportStats] = None
+) -> List[int]:
+    """
+    分块批量插入房产
+
+    每块生成一条多行 INSERT ... VALUES，支持RETURNING的数据库（PostgreSQL、SQLite）
+    直接返回新ID，每块只有一次数据库往返。调用方负责提交事务。
+
+    Args:
+        db: 数据库会话
+        rows: property_row 生成的行数据
+        chunk_size: 每块行数
+        stats: 导入统计信息
+
+    Returns:
+        新建房产ID列表（按插入顺序）
+    """
+    stats = stats or ImportStats()
+    supports_returning = db.get_bind().dialect.insert_returning
+    size = _effective_chunk_size(chunk_size, len(Property.__table__.columns))
+
+    ids: List[int] = []
+    for chunk in _chunked(rows, size):
+        stmt = insert(Property).values(chunk)
+        if supports_returning:
+            ids.extend(db.execute(stmt.returning(Property.id)).scalars().all())
+        else:
+            db.execute(stmt)
+        stats.row_count += len(chunk)
+
+    return ids
+
+
+def _clean_cell(value: Any) -> Any:
+    """文件单元格取值，空字符串视为缺失"""
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def iter_csv_records(file_obj: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """
+    逐行读取CSV文件
+
+    Args:
+        file_obj: 二进制文件对象，表头为PropertyCreate字段名
+
+    Yields:
+        每行的字段字典
+    """
+    text = io.TextIOWrapper(file_obj, encoding="utf-8-sig", newline="")
+    try:
+        for record in csv.DictReader(text):
+            yield {key.strip(): _clean_cell(value) for key, value in record.items() if key}
+    finally:
+        # 避免TextIOWrapper关闭底层的上传文件
+        text.detach()
+
+
+def iter_xlsx_records(file_obj: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """
+    以只读模式逐行读取XLSX文件第一个工作表
+
+    Args:
+        file_obj: 二进制文件对象，首行为PropertyCreate字段名
+
+    Yields:
+        每行的字段字典
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("XLSX导入需要安装openpyxl")
+
+    workbook = load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            return
+        keys = [str(h).strip() if h is not None else None for h in header]
+        for values in rows:
+            if values is None or all(v is None for v in values):
+                continue
+            yield {key: _clean_cell(value) for key, value in zip(keys, values) if key}
+    finally:
+        workbook.close()
+
+
+def iter_file_records(file_obj: BinaryIO, filename: str) -> Iterator[Dict[str, Any]]:
+    """
+    根据文件扩展名选择读取方式
+
+    Raises:
+        ValueError: 不支持的文件类型
+    """
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".csv":
+        return iter_csv_records(file_obj)
+    if ext == ".xlsx":
+        return iter_xlsx_records(file_obj)
+    raise ValueError(f"不支持的文件类型，支持: {', '.join(SUPPORTED_IMPORT_EXTENSIONS)}")
+
+
+def import_property_records(
+    db: Session,
+    records: Iterable[Dict[str, Any]],
+    user_id: int,
+    tenant_id: int,
+    chunk_size: Optional[int] = None
+) -> Tuple[List[int], ImportStats]:
+    """
+    流式校验并导入房产记录
+
+    边读取边校验边分块写入，不在内存中构建完整列表。任何一行校验失败时
+    回滚整个导入，保证要么全部成功要么全部不生效。
+
+    Args:
+        db: 数据库会话
+        records: 原始记录迭代器
+        user_id: 当前用户ID
+        tenant_id: 租户ID
+        chunk_size: 每块行数
+
+    Returns:
+        (新建房产ID列表, 导入统计信息)
+
+    Raises:
+        PropertyImportError: 存在校验失败的行
+    """
+    stats = ImportStats()
+    now = datetime.utcnow()
+    errors: List[Dict[str, Any]] = []
+    error_count = 0
+
+    def valid_rows():
+        nonlocal error_count
+        # 首行为表头，数据从第2行开始
+        for line_no, record in enumerate(records, start=2):
+            try:
+                prop = PropertyCreate(**record)
+            except ValidationError as e:
+                error_count += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"row": line_no, "errors": e.errors(include_url=False)})
+                continue
+            if error_count == 0:
+                yield property_row(prop, user_id, tenant_id, now)
+
+    try:
+        ids = bulk_insert_properties(db, valid_rows(), chunk_size, stats)
+        if error_count:
+            raise PropertyImportError(errors, error_count)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        stats.finish()
+
+    logger.info("房产文件导入完成: rows=%d rows/s=%.2f", stats.row_count, stats.rows_per_second)
+    return ids, stats
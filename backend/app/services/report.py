@@ -1,368 +1,98 @@
+"""
+ValuHub 估价报告服务
+报告模板由 report_templates 编译并缓存；PDF在Celery的reports队列中渲染，接口只创建任务、不等待渲染；
+报告文件由 report_store 按内容哈希存放，相同的报告直接复用
+"""
+
+import asyncio
+import json
+import logging
 import os
-import time
 from datetime import datetime
-from jinja2 import Template
+from decimal import Decimal
+from typing import Any, Dict, Optional, Tuple
+
+from celery import shared_task
+
 from app.core.config import settings
+from app.services.report_store import content_key, report_store
+from app.services.report_templates import get_report_template, template_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# 报告状态：pending（已排队）-> generating（渲染中）-> completed / failed
+REPORT_PENDING = "pending"
+REPORT_GENERATING = "generating"
+REPORT_COMPLETED = "completed"
+REPORT_FAILED = "failed"
+REPORT_TERMINAL_STATUSES = (REPORT_COMPLETED, REPORT_FAILED)
+
+# 报告状态变化通知的Redis频道前缀
+REPORT_STATUS_CHANNEL = "report_status"
+
+
+def render_valuation_report_html(context: Dict[str, Any], template=None) -> str:
+    """
+    渲染估价报告HTML
+    
+    Args:
+        context: 模板变量
+        template: ReportTemplate记录，默认使用内置模板
+    """
+    return get_report_template(template).render(
+        generate_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        **context
+    )
+
+
+def write_report_files(base_path: str, html_content: str) -> str:
+    """
+    保存报告，优先生成PDF
+    
+    Args:
+        base_path: 不含扩展名的文件路径
+    
+    Returns:
+        PDF路径；PDF生成失败时保存HTML并返回HTML路径
+    """
+    try:
+        # 尝试生成PDF
+        pdf_report_path = f"{base_path}.pdf"
+        from weasyprint import HTML
+        HTML(string=html_content).write_pdf(pdf_report_path)
+        return pdf_report_path
+    except Exception as e:
+        # 如果PDF生成失败，保存HTML报告
+        logger.warning("PDF生成失败，将返回HTML报告: %s", e)
+        html_report_path = f"{base_path}.html"
+        with open(html_report_path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        return html_report_path
+
+
+def store_report(context: Dict[str, Any], template=None) -> Tuple[str, str, bool]:
+    """
+    按内容哈希获取报告文件，相同模板和估价数据的报告只生成一次PDF（PDF生成失败时每次重试）
+    
+    Args:
+        context: 模板变量（generate_time 不参与哈希）
+        template: ReportTemplate记录，默认使用内置模板
+    
+    Returns:
+        (内容哈希, 文件路径, 是否新生成)
+    """
+    compiled = get_report_template(template)
+    key = content_key(template_fingerprint(compiled.name), context)
+    path, created = report_store.get_or_create(
+        key, lambda base_path: write_report_files(base_path, render_valuation_report_html(context, template))
+    )
+    return key, path, created
+
 
 # 生成估价报告
 def generate_valuation_report(request_data):
-    # 定义HTML模板，包含logo和专业排版
-    html_template = Template('''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>智汇云房地产估价报告</title>
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-            
-            body {
-                font-family: 'Microsoft YaHei', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                line-height: 1.6;
-                color: #333;
-                padding: 20px;
-            }
-            
-            .header {
-                text-align: center;
-                margin-bottom: 30px;
-                border-bottom: 2px solid #667eea;
-                padding-bottom: 20px;
-            }
-            
-            .logo {
-                margin-bottom: 15px;
-            }
-            
-            .logo svg {
-                width: 100px;
-                height: 100px;
-            }
-            
-            h1 {
-                color: #667eea;
-                font-size: 24px;
-                margin-bottom: 10px;
-            }
-            
-            h2 {
-                color: #333;
-                font-size: 18px;
-                margin: 25px 0 15px 0;
-                border-left: 4px solid #667eea;
-                padding-left: 10px;
-            }
-            
-            .report-info {
-                display: flex;
-                justify-content: space-between;
-                margin-bottom: 20px;
-                font-size: 14px;
-            }
-            
-            .report-info-item {
-                margin-bottom: 5px;
-            }
-            
-            .section {
-                margin-bottom: 20px;
-            }
-            
-            .result-card {
-                background-color: #f8f9fa;
-                border-radius: 8px;
-                padding: 20px;
-                margin-bottom: 20px;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }
-            
-            .result-grid {
-                display: grid;
-                grid-template-columns: repeat(2, 1fr);
-                gap: 20px;
-            }
-            
-            .result-item {
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-            }
-            
-            .result-label {
-                font-weight: 500;
-                color: #666;
-            }
-            
-            .result-value {
-                font-weight: bold;
-                color: #667eea;
-                font-size: 16px;
-            }
-            
-            table {
-                width: 100%;
-                border-collapse: collapse;
-                margin: 20px 0;
-            }
-            
-            th, td {
-                border: 1px solid #ddd;
-                padding: 12px;
-                text-align: left;
-            }
-            
-            th {
-                background-color: #667eea;
-                color: white;
-                font-weight: bold;
-            }
-            
-            tr:nth-child(even) {
-                background-color: #f8f9fa;
-            }
-            
-            .recommendation {
-                background-color: #e7f3ff;
-                border-left: 4px solid #1890ff;
-                padding: 15px;
-                margin: 20px 0;
-            }
-            
-            .footer {
-                text-align: center;
-                margin-top: 40px;
-                padding-top: 20px;
-                border-top: 1px solid #ddd;
-                font-size: 12px;
-                color: #666;
-            }
-            
-            .factors-list {
-                list-style-type: none;
-                padding: 0;
-            }
-            
-            .factor-item {
-                background-color: #f0f4f8;
-                padding: 10px 15px;
-                margin-bottom: 8px;
-                border-radius: 4px;
-                border-left: 3px solid #4299e1;
-            }
-            
-            .property-info-grid {
-                display: grid;
-                grid-template-columns: repeat(2, 1fr);
-                gap: 15px;
-                margin-bottom: 20px;
-            }
-            
-            .property-info-item {
-                display: flex;
-                justify-content: space-between;
-                padding: 10px;
-                background-color: #f8f9fa;
-                border-radius: 4px;
-            }
-            
-            .market-analysis {
-                background-color: #f7fafc;
-                padding: 20px;
-                border-radius: 8px;
-                margin-bottom: 20px;
-                border: 1px solid #e2e8f0;
-            }
-            
-            .price-trend {
-                font-weight: bold;
-                color: #38a169;
-                margin-bottom: 10px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <div class="logo">
-                <svg width="100" height="100" viewBox="0 0 100 100" fill="none" xmlns="http://www.w3.org/2000/svg">
-                    <!-- 水波纹 -->
-                    <circle cx="50" cy="80" r="35" stroke="#667eea" stroke-width="2" fill="none" opacity="0.3"/>
-                    <circle cx="50" cy="80" r="28" stroke="#667eea" stroke-width="2" fill="none" opacity="0.5"/>
-                    <circle cx="50" cy="80" r="21" stroke="#667eea" stroke-width="2" fill="none" opacity="0.7"/>
-                    <circle cx="50" cy="80" r="14" stroke="#667eea" stroke-width="2" fill="none" opacity="0.9"/>
-                    <!-- 莲花花瓣 -->
-                    <path d="M50 10 Q65 35 85 50 Q65 65 50 80 Q35 65 15 50 Q35 35 50 10" fill="#ff8fab"/>
-                    <path d="M50 15 Q70 35 80 55 Q60 65 50 75 Q40 65 20 55 Q30 35 50 15" fill="#ffb3c1"/>
-                    <path d="M50 20 Q75 35 75 60 Q60 65 50 70 Q40 65 25 60 Q25 35 50 20" fill="#ffccd5"/>
-                    <!-- 箭头 -->
-                    <path d="M45 40 L55 40 L55 65 L65 65 L50 80 L35 65 L45 65 Z" fill="#e53e3e"/>
-                </svg>
-            </div>
-            <h1>ValuHub房地产估价报告</h1>
-            <p style="color: #666;">Professional Real Estate Valuation Report</p>
-        </div>
-        
-        <div class="report-info">
-            <div>
-                <div class="report-info-item"><strong>报告编号:</strong> {{ project_id }}</div>
-                <div class="report-info-item"><strong>生成时间:</strong> {{ generate_time }}</div>
-            </div>
-            <div>
-                <div class="report-info-item"><strong>估价对象:</strong> {{ community }}</div>
-                <div class="report-info-item"><strong>所在城市:</strong> {{ city }} {{ district }}</div>
-            </div>
-        </div>
-        
-        <div class="section">
-            <h2>房产基本信息</h2>
-            <div class="property-info-grid">
-                <div class="property-info-item">
-                    <span>小区名称</span>
-                    <span>{{ community }}</span>
-                </div>
-                <div class="property-info-item">
-                    <span>所在城市</span>
-                    <span>{{ city }} {{ district }}</span>
-                </div>
-                <div class="property-info-item">
-                    <span>建筑面积</span>
-                    <span>{{ area }} ㎡</span>
-                </div>
-                <div class="property-info-item">
-                    <span>户型</span>
-                    <span>{{ room_type }}</span>
-                </div>
-                <div class="property-info-item">
-                    <span>所在楼层</span>
-                    <span>{{ floor }}/{{ total_floors }}</span>
-                </div>
-                <div class="property-info-item">
-                    <span>房龄</span>
-                    <span>{{ age }} 年</span>
-                </div>
-                <div class="property-info-item">
-                    <span>朝向</span>
-                    <span>{{ orientation }}</span>
-                </div>
-                <div class="property-info-item">
-                    <span>装修程度</span>
-                    <span>{{ decoration }}</span>
-                </div>
-                <div class="property-info-item">
-                    <span>电梯</span>
-                    <span>{{ '有' if elevator else '无' }}</span>
-                </div>
-                <div class="property-info-item">
-                    <span>车位</span>
-                    <span>{{ '有' if parking_space else '无' }}</span>
-                </div>
-                {% if school_district %}
-                <div class="property-info-item">
-                    <span>学区</span>
-                    <span>{{ school_district }}</span>
-                </div>
-                {% endif %}
-            </div>
-        </div>
-        
-        <div class="section">
-            <h2>核心估价结果</h2>
-            <div class="result-card">
-                <div class="result-grid">
-                    <div class="result-item">
-                        <span class="result-label">建筑面积</span>
-                        <span class="result-value">{{ area }} ㎡</span>
-                    </div>
-                    <div class="result-item">
-                        <span class="result-label">单价</span>
-                        <span class="result-value">{{ price_per_sqm }} 元/㎡</span>
-                    </div>
-                    <div class="result-item">
-                        <span class="result-label">总价</span>
-                        <span class="result-value">{{ total_price }} 元</span>
-                    </div>
-                    <div class="result-item">
-                        <span class="result-label">市场信心度</span>
-                        <span class="result-value">{{ confidence * 100 }}%</span>
-                    </div>
-                </div>
-            </div>
-        </div>
-        
-        <div class="section">
-            <h2>影响因素分析</h2>
-            <ul class="factors-list">
-                {% for factor in factors %}
-                <li class="factor-item">{{ factor }}</li>
-                {% endfor %}
-            </ul>
-        </div>
-        
-        <div class="section">
-            <h2>市场分析</h2>
-            <div class="market-analysis">
-                <div class="price-trend">价格走势: {{ price_trend }}</div>
-                <p>{{ market_analysis }}</p>
-            </div>
-        </div>
-        
-        <div class="section">
-            <h2>类似案例分析</h2>
-            <table>
-                <thead>
-                    <tr>
-                        <th>小区名称</th>
-                        <th>建筑面积 (㎡)</th>
-                        <th>楼层</th>
-                        <th>单价 (元/㎡)</th>
-                        <th>总价 (元)</th>
-                        <th>距离</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {% for case in similar_cases %}
-                    <tr>
-                        <td>{{ case.community }}</td>
-                        <td>{{ case.area }}</td>
-                        <td>{{ case.floor }}/{{ total_floors }}</td>
-                        <td>{{ case.price_per_sqm }}</td>
-                        <td>{{ case.total_price }}</td>
-                        <td>{{ case.distance }}</td>
-                    </tr>
-                    {% endfor %}
-                </tbody>
-            </table>
-        </div>
-        
-        <div class="section">
-            <h2>分析建议</h2>
-            <div class="recommendation">
-                <p>{{ recommendation }}</p>
-            </div>
-        </div>
-        
-        <div class="section">
-            <h2>估价说明</h2>
-            <p>本报告基于市场比较法，结合城市基准价格、楼层系数、房龄衰减系数、朝向系数、装修系数等多维度因素计算得出。</p>
-            <p>报告仅供参考，不构成任何投资建议。如需更详细的估价服务，请联系我们的专业顾问。</p>
-        </div>
-        
-        <div class="footer">
-            <p>© 2025 ValuHub房地产估价系统. 保留所有权利.</p>
-            <p>联系方式：support@valuhub.com | 服务热线：400-888-8888</p>
-        </div>
-    </body>
-    </html>
-    ''')
-    
-    # 渲染HTML
-    html_content = html_template.render(
+    _, path, _ = store_report(dict(
         project_id=request_data.project_id,
-        generate_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         community=request_data.community,
         city=request_data.city,
         district=request_data.district,
@@ -384,26 +114,211 @@ def generate_valuation_report(request_data):
         price_trend=request_data.price_trend,
         market_analysis=request_data.market_analysis,
         recommendation=request_data.recommendation
-    )
+    ))
+    return path
+
+
+def _number(value: Optional[Decimal]) -> float:
+    return float(value) if value is not None else 0.0
+
+
+def build_valuation_report_context(valuation, property_obj, project_id: str) -> Dict[str, Any]:
+    """由估价和房产记录生成模板变量"""
+    details = valuation.result_details or {}
+    comparison = details.get("market_comparison") or {}
+    age = datetime.now().year - property_obj.building_year if property_obj.building_year else None
     
-    # 确保报告存储目录存在
-    os.makedirs(settings.REPORT_STORAGE_DIR, exist_ok=True)
+    return {
+        "project_id": project_id,
+        "community": property_obj.address,
+        "city": property_obj.city,
+        "district": property_obj.district or "",
+        "area": _number(property_obj.area),
+        "room_type": f"{property_obj.rooms}室" if property_obj.rooms else "-",
+        "floor": property_obj.floor_level or "-",
+        "total_floors": "-",
+        "age": age if age is not None else "-",
+        "orientation": property_obj.orientation or "-",
+        "decoration": property_obj.decoration_status or "-",
+        "elevator": False,
+        "parking_space": False,
+        "school_district": None,
+        "price_per_sqm": round(_number(valuation.price_per_sqm), 2),
+        "total_price": round(_number(valuation.estimated_price), 2),
+        "confidence": _number(valuation.confidence_level),
+        "similar_cases": details.get("similar_cases", []),
+        "factors": details.get("factors", []),
+        "price_trend": details.get("price_trend", "稳中有升"),
+        "market_analysis": f"本次估价采用{details.get('method', '综合估价模型')}" + (
+            f"，可比案例均价 {comparison['avg_price']} 元/㎡。" if comparison.get("avg_price") else "。"
+        ),
+        "recommendation": details.get("recommendation", "估价结果可作为交易、抵押参考，建议结合实地查勘综合判断。")
+    }
+
+
+def publish_report_status(report_id: int, status: str):
+    """通知订阅者报告状态变化，Redis不可用时忽略（客户端仍可轮询）"""
+    from app.services.cache import cache
     
-    # 生成报告ID
-    report_id = f"report_{int(time.time())}"
+    try:
+        cache.redis_client.publish(f"{REPORT_STATUS_CHANNEL}:{report_id}", status)
+    except Exception as e:
+        logger.warning("报告%s状态通知失败: %s", report_id, e)
+
+
+def _claim_report(db, report_id: int) -> bool:
+    """
+    把报告从 pending 置为 generating
+    
+    已在 generating 的报告也可以重新领取（worker中途退出后任务重新投递），已结束的报告不再处理。
+    """
+    from app.models.report import Report
+    
+    claimed = db.query(Report).filter(
+        Report.id == report_id,
+        Report.status.in_((REPORT_PENDING, REPORT_GENERATING))
+    ).update({Report.status: REPORT_GENERATING}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def render_report(report_id: int, db=None) -> Optional[str]:
+    """
+    渲染报告并更新状态
     
-    # 保存HTML报告
-    html_report_path = os.path.join(settings.REPORT_STORAGE_DIR, f"{report_id}.html")
-    with open(html_report_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    Args:
+        report_id: 报告ID
+        db: 数据库会话，默认新建
     
+    Returns:
+        报告最终状态；报告不存在或已结束时为None
+    """
+    from app.database.database import SessionLocal
+    from app.models.property import Property
+    from app.models.report import Report, ReportTemplate
+    from app.models.valuation import Valuation
+    
+    own_session = db is None
+    db = db or SessionLocal()
     try:
-        # 尝试生成PDF
-        pdf_report_path = os.path.join(settings.REPORT_STORAGE_DIR, f"{report_id}.pdf")
-        from weasyprint import HTML
-        HTML(string=html_content).write_pdf(pdf_report_path)
-        return pdf_report_path
+        if not _claim_report(db, report_id):
+            return None
+        publish_report_status(report_id, REPORT_GENERATING)
+        
+        report = db.get(Report, report_id)
+        try:
+            valuation = db.get(Valuation, report.valuation_id)
+            property_obj = db.get(Property, valuation.property_id)
+            template = db.get(ReportTemplate, report.template_id) if report.template_id else None
+            key, path, _ = store_report(
+                build_valuation_report_context(valuation, property_obj, f"VH-V{valuation.id:08d}"), template
+            )
+        except Exception:
+            logger.exception("报告%s生成失败", report_id)
+            db.rollback()
+            report.status = REPORT_FAILED
+            db.commit()
+            publish_report_status(report_id, REPORT_FAILED)
+            return REPORT_FAILED
+        
+        extension = os.path.splitext(path)[1]
+        report.content_hash = key
+        report.file_url = f"{settings.API_V1_PREFIX}/reports/{report.id}/download"
+        report.file_name = f"估价报告_{report.valuation_id}{extension}"
+        report.file_size = os.path.getsize(path)
+        report.status = REPORT_COMPLETED
+        report.completed_at = datetime.utcnow()
+        db.commit()
+        publish_report_status(report_id, REPORT_COMPLETED)
+        return REPORT_COMPLETED
+    finally:
+        if own_session:
+            db.close()
+
+
+@shared_task(
+    name='app.services.report.render_report_task',
+    soft_time_limit=settings.REPORT_RENDER_TIMEOUT
+)
+def render_report_task(report_id: int):
+    """Celery任务：渲染报告（reports队列，由专用worker进程执行）"""
+    return render_report(report_id)
+
+
+def enqueue_report(report_id: int):
+    """
+    把报告加入渲染队列
+    
+    Raises:
+        Exception: 消息代理不可用
+    """
+    render_report_task.delay(report_id)
+
+
+def _status_event(report_id: int, status: Optional[str], file_url: Optional[str]) -> str:
+    payload = json.dumps({"id": report_id, "status": status, "file_url": file_url}, ensure_ascii=False)
+    return f"event: status\ndata: {payload}\n\n"
+
+
+async def report_status_events(report_id: int, db, redis_client=None, poll_interval: float = None, timeout: float = None):
+    """
+    报告状态推送（Server-Sent Events）
+    
+    订阅worker发布的状态通知，收到通知或每隔 poll_interval 秒回查一次数据库；
+    Redis不可用时退化为定时回查。状态变化时输出一个事件，报告结束或超时后关闭。
+    
+    Args:
+        report_id: 报告ID
+        db: 异步数据库会话，每次回查后回滚以归还连接
+        redis_client: redis.asyncio 客户端，默认使用 async_cache 的连接池
+    """
+    from sqlalchemy import select
+    from app.models.report import Report
+    
+    poll_interval = poll_interval or settings.REPORT_EVENTS_POLL_INTERVAL
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (timeout or settings.REPORT_EVENTS_TIMEOUT)
+    channel = f"{REPORT_STATUS_CHANNEL}:{report_id}"
+    
+    pubsub = None
+    try:
+        if redis_client is None:
+            from app.services.cache import async_cache
+            redis_client = async_cache.redis_client
+        pubsub = redis_client.pubsub()
+        await pubsub.subscribe(channel)
     except Exception as e:
-        # 如果PDF生成失败，返回HTML报告路径
-        print(f"PDF生成失败，将返回HTML报告: {str(e)}")
-        return html_report_path
+        logger.warning("报告状态订阅失败，改为定时回查: %s", e)
+        pubsub = None
+    
+    last_status = None
+    try:
+        while True:
+            row = (await db.execute(
+                select(Report.status, Report.file_url).where(Report.id == report_id)
+            )).first()
+            await db.rollback()
+            status, file_url = row if row else (None, None)
+            
+            if status != last_status:
+                yield _status_event(report_id, status, file_url)
+                last_status = status
+            if status is None or status in REPORT_TERMINAL_STATUSES or loop.time() >= deadline:
+                break
+            
+            wait = min(poll_interval, max(deadline - loop.time(), 0))
+            if pubsub is not None:
+                try:
+                    await pubsub.get_message(ignore_subscribe_messages=True, timeout=wait)
+                    continue
+                except Exception as e:
+                    logger.warning("报告状态订阅中断，改为定时回查: %s", e)
+                    pubsub = None
+            await asyncio.sleep(wait)
+    finally:
+        if pubsub is not None:
+            try:
+                await pubsub.unsubscribe(channel)
+                await pubsub.aclose()
+            except Exception:
+                pass
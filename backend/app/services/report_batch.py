@@ -0,0 +1,195 @@
+"""
+ValuHub 批量报告
+批量读取估价和房产，多进程并行渲染，每个进程复用同一套WeasyPrint字体和样式；
+结果逐个写入ZIP并流式返回，内存中只保留正在传输窗口内的少量文档
+"""
+
+import io
+import logging
+import multiprocessing
+import zipfile
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.property import Property
+from app.models.valuation import Valuation
+from app.services.report import build_valuation_report_context
+from app.services.report_templates import get_report_template, report_environment
+
+logger = logging.getLogger(__name__)
+
+# (ZIP内文件名, 模板名, 模板变量)
+BatchJob = Tuple[str, str, Dict[str, Any]]
+
+# 每个渲染进程的WeasyPrint上下文：(FontConfiguration, CSS)，不可用时为False
+_pdf_context = None
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def load_valuations(db: Session, valuation_ids: Sequence[int], user_id: int) -> List[Tuple[Valuation, Property]]:
+    """
+    一次查询读取估价及其房产，按请求顺序返回
+
+    Raises:
+        LookupError: 部分估价不存在或不属于该用户，args[0] 为这些ID
+    """
+    rows = (
+        db.query(Valuation, Property)
+        .join(Property, Valuation.property_id == Property.id)
+        .filter(Valuation.id.in_(valuation_ids), Valuation.user_id == user_id)
+        .all()
+    )
+    found = {valuation.id: (valuation, property_obj) for valuation, property_obj in rows}
+    missing = [valuation_id for valuation_id in valuation_ids if valuation_id not in found]
+    if missing:
+        raise LookupError(missing)
+    return [found[valuation_id] for valuation_id in valuation_ids]
+
+
+def build_batch_jobs(rows: Sequence[Tuple[Valuation, Property]], template=None) -> List[BatchJob]:
+    """
+    生成渲染任务
+
+    Args:
+        rows: load_valuations 的结果
+        template: ReportTemplate记录，默认使用内置模板
+    """
+    template_name = get_report_template(template).name
+    generate_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return [
+        (
+            f"估价报告_{valuation.id}",
+            template_name,
+            dict(
+                build_valuation_report_context(valuation, property_obj, f"VH-V{valuation.id:08d}"),
+                generate_time=generate_time
+            )
+        )
+        for valuation, property_obj in rows
+    ]
+
+
+def _shared_pdf_context():
+    """本进程的WeasyPrint字体配置和报告样式，只解析一次"""
+    global _pdf_context
+    if _pdf_context is None:
+        try:
+            from weasyprint import CSS
+            from weasyprint.text.fonts import FontConfiguration
+
+            font_config = FontConfiguration()
+            stylesheet = CSS(string=report_environment.globals["fragments"]["styles"], font_config=font_config)
+            _pdf_context = (font_config, stylesheet)
+        except Exception as e:
+            logger.warning("WeasyPrint不可用，批量报告将输出HTML: %s", e)
+            _pdf_context = False
+    return _pdf_context
+
+
+def render_batch_document(job: BatchJob) -> Tuple[str, bytes]:
+    """
+    渲染一份报告（在渲染进程中执行）
+
+    Returns:
+        (ZIP内文件名, 文件内容)；WeasyPrint不可用时为HTML
+    """
+    name, template_name, context = job
+    template = report_environment.get_template(template_name)
+    pdf_context = _shared_pdf_context()
+
+    if pdf_context:
+        from weasyprint import HTML
+
+        font_config, stylesheet = pdf_context
+        # 内置样式由共享的stylesheet提供，不再在每份文档中重复解析
+        fragments = dict(report_environment.globals["fragments"], styles="")
+        html_content = template.render(fragments=fragments, **context)
+        pdf = HTML(string=html_content).write_pdf(stylesheets=[stylesheet], font_config=font_config)
+        return f"{name}.pdf", pdf
+
+    return f"{name}.html", template.render(**context).encode("utf-8")
+
+
+def get_batch_executor() -> ProcessPoolExecutor:
+    """批量渲染进程池（首次使用时创建，spawn启动避免继承接口进程的连接）"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.REPORT_BATCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_batch_executor():
+    """关闭渲染进程池（应用关闭时调用）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def render_documents(jobs: Iterable[BatchJob], executor: Executor = None, window: int = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    并行渲染，按提交顺序逐个产出
+
+    同时在途的文档不超过 window 份，下游写得慢时不会把全部结果堆积在内存中。
+    executor 为空时在当前线程中依次渲染。
+    """
+    if executor is None:
+        for job in jobs:
+            yield render_batch_document(job)
+        return
+
+    window = window or settings.REPORT_BATCH_WORKERS * 2
+    pending = deque()
+    try:
+        for job in jobs:
+            pending.append(executor.submit(render_batch_document, job))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # 客户端中途断开时取消尚未开始的渲染
+        for future in pending:
+            future.cancel()
+
+
+class _ZipStream(io.RawIOBase):
+    """只追加的写入目标，ZipFile写入的字节由生成器取走"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(documents: Iterable[Tuple[str, bytes]]) -> Iterator[bytes]:
+    """
+    把文档逐个写入ZIP并产出字节块
+
+    PDF本身已压缩，按存储方式写入；HTML使用deflate压缩。
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, mode="w") as archive:
+        for name, content in documents:
+            compression = zipfile.ZIP_STORED if name.endswith(".pdf") else zipfile.ZIP_DEFLATED
+            archive.writestr(name, content, compress_type=compression)
+            yield stream.drain()
+    yield stream.drain()
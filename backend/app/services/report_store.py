@@ -0,0 +1,235 @@
+"""
+ValuHub 报告文件存储
+报告文件按 (模板, 估价数据) 的内容哈希存放，相同的报告只渲染一次；
+存储后端为远程存储（OSS）时转存一份，本地目录作为按最近使用淘汰的缓存
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 报告文件扩展名，按优先级排列（PDF生成失败时为HTML）
+REPORT_EXTENSIONS = (".pdf", ".html")
+# 最终格式：只有PDF按内容哈希复用，HTML是PDF生成失败时的临时结果，下次请求时重新生成
+FINAL_EXTENSION = ".pdf"
+
+# 不参与内容哈希的模板变量（每次渲染都不同，不影响报告内容）
+VOLATILE_CONTEXT_KEYS = ("generate_time",)
+
+
+def content_key(template_fingerprint: str, context: Dict[str, Any]) -> str:
+    """
+    报告内容哈希
+
+    Args:
+        template_fingerprint: 模板标识（模板源码变化时随之变化）
+        context: 模板变量
+    """
+    stable = {key: value for key, value in context.items() if key not in VOLATILE_CONTEXT_KEYS}
+    payload = json.dumps(
+        {"template": template_fingerprint, "context": stable},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportArtifactStore:
+    """
+    内容寻址的报告文件存储
+
+    文件路径为 <root>/<key[:2]>/<key[2:4]>/<key>.<pdf|html>，先写临时文件再原子替换，
+    并发渲染同一份报告时读者不会看到写了一半的文件。
+    PDF生成失败时保存的HTML只供已生成的报告下载，相同内容的新报告会重新尝试生成PDF。
+    存储后端为远程存储时新文件同时转存，本地文件总大小超过上限后按最近访问时间删除已转存的文件，
+    之后访问时再从远程存储下载。
+    """
+
+    def __init__(self, root: str = None, remote=None, cache_max_bytes: int = None, prefix: str = None):
+        self._root = root
+        # None 表示使用全局存储后端（为远程存储且REPORT_STORE_OFFLOAD开启时），False 表示只存本地
+        self._remote = remote
+        self.cache_max_bytes = settings.REPORT_STORE_CACHE_MAX_BYTES if cache_max_bytes is None else cache_max_bytes
+        self.prefix = (prefix or settings.REPORT_STORE_PREFIX).strip("/")
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    @property
+    def root(self) -> str:
+        return self._root or settings.REPORT_STORAGE_DIR
+
+    @property
+    def remote(self):
+        """转存使用的存储后端，只存本地时为None"""
+        if self._remote is None:
+            from app.services.storage import storage
+            self._remote = storage if storage.remote and settings.REPORT_STORE_OFFLOAD else False
+        return self._remote or None
+
+    def path_for(self, key: str, extension: str) -> str:
+        """报告文件的本地路径"""
+        return os.path.join(self.root, key[:2], key[2:4], f"{key}{extension}")
+
+    def object_key(self, key: str, extension: str) -> str:
+        """报告文件在存储后端中的键"""
+        return f"{self.prefix}/{key[:2]}/{key}{extension}"
+
+    def _lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _temp_path(self, key: str) -> str:
+        directory = os.path.dirname(self.path_for(key, ""))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f".tmp-{key}-{uuid.uuid4().hex}")
+
+    @staticmethod
+    def _touch(path: str):
+        # 只更新访问时间，修改时间作为Last-Modified保持不变
+        stat = os.stat(path)
+        os.utime(path, (time.time(), stat.st_mtime))
+
+    def _local(self, key: str, extensions=REPORT_EXTENSIONS) -> Optional[str]:
+        for extension in extensions:
+            path = self.path_for(key, extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def find(self, key: str, extension: str = None) -> Optional[str]:
+        """
+        查找报告文件，本地没有时从远程存储下载
+
+        Args:
+            key: 内容哈希
+            extension: 已知的扩展名（如 ".pdf"），为空时依次尝试
+        """
+        extensions = (extension,) if extension else REPORT_EXTENSIONS
+        path = self._local(key, extensions)
+        if path:
+            self._touch(path)
+            return path
+
+        remote = self.remote
+        if remote is None:
+            return None
+        with self._lock(key):
+            path = self._local(key, extensions)
+            if path:
+                return path
+            for candidate in extensions:
+                temp_path = self._temp_path(key)
+                if remote.download_to(self.object_key(key, candidate), temp_path):
+                    path = self.path_for(key, candidate)
+                    os.replace(temp_path, path)
+                    break
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        if path:
+            self.evict(keep=path)
+        return path
+
+    def get_or_create(self, key: str, build: Callable[[str], str]) -> Tuple[str, bool]:
+        """
+        获取报告文件，不存在时生成
+
+        Args:
+            key: 内容哈希
+            build: 生成函数，参数为不含扩展名的临时路径，返回实际写入的文件路径
+
+        Returns:
+            (文件路径, 是否新生成)
+        """
+        path = self.find(key, FINAL_EXTENSION)
+        if path:
+            return path, False
+
+        with self._lock(key):
+            path = self._local(key, (FINAL_EXTENSION,))
+            if path:
+                return path, False
+            temp_path = self._temp_path(key)
+            try:
+                written = build(temp_path)
+            except Exception:
+                for extension in REPORT_EXTENSIONS:
+                    if os.path.exists(temp_path + extension):
+                        os.remove(temp_path + extension)
+                raise
+            path = self.path_for(key, os.path.splitext(written)[1])
+            os.replace(written, path)
+            if not path.endswith(FINAL_EXTENSION):
+                logger.warning("报告%s未能生成PDF，暂存HTML，下次请求时重新生成", key)
+
+        remote = self.remote
+        if remote is not None:
+            extension = os.path.splitext(path)[1]
+            try:
+                remote.save_file(self.object_key(key, extension), path)
+            except Exception as e:
+                logger.warning("报告文件%s转存失败，仅保存在本地: %s", key, e)
+            self.evict(keep=path)
+        return path, True
+
+    def _local_files(self) -> List[Tuple[float, int, str]]:
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_atime, stat.st_size, path))
+        return files
+
+    def evict(self, keep: str = None) -> int:
+        """
+        本地文件超过缓存上限时，按最近访问时间删除已转存的文件
+
+        Args:
+            keep: 不删除的文件（刚生成或刚下载、即将返回给调用方）
+
+        Returns:
+            删除的文件数
+        """
+        remote = self.remote
+        if remote is None or self.cache_max_bytes <= 0:
+            return 0
+        files = self._local_files()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.cache_max_bytes:
+                break
+            if path == keep:
+                continue
+            name = os.path.basename(path)
+            key, extension = os.path.splitext(name)
+            # 转存失败的文件只有本地一份，不能删除
+            if not remote.exists(self.object_key(key, extension)):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+
+# 全局报告存储
+report_store = ReportArtifactStore()
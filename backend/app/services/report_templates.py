@@ -0,0 +1,519 @@
+"""
+ValuHub 报告模板
+内置模板和数据库中的ReportTemplate由同一个Jinja环境加载：编译结果按 (模板ID, 更新时间) 缓存，
+字节码缓存在磁盘上供其他worker进程复用；样式、logo、估价说明等静态片段每个进程只渲染一次。
+数据库模板由用户上传，环境为沙箱环境：禁止访问 __globals__、__class__ 等内部属性，HTML模板自动转义
+"""
+
+import hashlib
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from jinja2 import BaseLoader, Environment, FileSystemBytecodeCache, Template, TemplateNotFound
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+from markupsafe import Markup
+
+from app.core.config import settings
+
+# 内置估价报告模板，数据库模板可通过 {% extends "valuation_report.html" %} 覆盖 styles/content/disclaimer 区块
+BUILTIN_TEMPLATE = "valuation_report.html"
+
+# 静态片段：变量名 -> 模板名
+FRAGMENTS = {
+    "styles": "fragments/styles.css",
+    "logo": "fragments/logo.svg",
+    "disclaimer": "fragments/disclaimer.html"
+}
+
+# 数据库模板名：db/<模板ID>@<更新时间(微秒)>，模板更新后名称随之变化，旧的编译结果自然淘汰
+DB_TEMPLATE_NAME = re.compile(r"db/(\d+)@(\d+)")
+
+STYLES_FRAGMENT = '''* {
+    margin: 0;
+    padding: 0;
+    box-sizing: border-box;
+}
+
+body {
+    font-family: 'Microsoft YaHei', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    line-height: 1.6;
+    color: #333;
+    padding: 20px;
+}
+
+.header {
+    text-align: center;
+    margin-bottom: 30px;
+    border-bottom: 2px solid #667eea;
+    padding-bottom: 20px;
+}
+
+.logo {
+    margin-bottom: 15px;
+}
+
+.logo svg {
+    width: 100px;
+    height: 100px;
+}
+
+h1 {
+    color: #667eea;
+    font-size: 24px;
+    margin-bottom: 10px;
+}
+
+h2 {
+    color: #333;
+    font-size: 18px;
+    margin: 25px 0 15px 0;
+    border-left: 4px solid #667eea;
+    padding-left: 10px;
+}
+
+.report-info {
+    display: flex;
+    justify-content: space-between;
+    margin-bottom: 20px;
+    font-size: 14px;
+}
+
+.report-info-item {
+    margin-bottom: 5px;
+}
+
+.section {
+    margin-bottom: 20px;
+}
+
+.result-card {
+    background-color: #f8f9fa;
+    border-radius: 8px;
+    padding: 20px;
+    margin-bottom: 20px;
+    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+}
+
+.result-grid {
+    display: grid;
+    grid-template-columns: repeat(2, 1fr);
+    gap: 20px;
+}
+
+.result-item {
+    display: flex;
+    justify-content: space-between;
+    align-items: center;
+}
+
+.result-label {
+    font-weight: 500;
+    color: #666;
+}
+
+.result-value {
+    font-weight: bold;
+    color: #667eea;
+    font-size: 16px;
+}
+
+table {
+    width: 100%;
+    border-collapse: collapse;
+    margin: 20px 0;
+}
+
+th, td {
+    border: 1px solid #ddd;
+    padding: 12px;
+    text-align: left;
+}
+
+th {
+    background-color: #667eea;
+    color: white;
+    font-weight: bold;
+}
+
+tr:nth-child(even) {
+    background-color: #f8f9fa;
+}
+
+.recommendation {
+    background-color: #e7f3ff;
+    border-left: 4px solid #1890ff;
+    padding: 15px;
+    margin: 20px 0;
+}
+
+.footer {
+    text-align: center;
+    margin-top: 40px;
+    padding-top: 20px;
+    border-top: 1px solid #ddd;
+    font-size: 12px;
+    color: #666;
+}
+
+.factors-list {
+    list-style-type: none;
+    padding: 0;
+}
+
+.factor-item {
+    background-color: #f0f4f8;
+    padding: 10px 15px;
+    margin-bottom: 8px;
+    border-radius: 4px;
+    border-left: 3px solid #4299e1;
+}
+
+.property-info-grid {
+    display: grid;
+    grid-template-columns: repeat(2, 1fr);
+    gap: 15px;
+    margin-bottom: 20px;
+}
+
+.property-info-item {
+    display: flex;
+    justify-content: space-between;
+    padding: 10px;
+    background-color: #f8f9fa;
+    border-radius: 4px;
+}
+
+.market-analysis {
+    background-color: #f7fafc;
+    padding: 20px;
+    border-radius: 8px;
+    margin-bottom: 20px;
+    border: 1px solid #e2e8f0;
+}
+
+.price-trend {
+    font-weight: bold;
+    color: #38a169;
+    margin-bottom: 10px;
+}
+'''
+
+LOGO_FRAGMENT = '''<svg width="100" height="100" viewBox="0 0 100 100" fill="none" xmlns="http://www.w3.org/2000/svg">
+    <!-- 水波纹 -->
+    <circle cx="50" cy="80" r="35" stroke="#667eea" stroke-width="2" fill="none" opacity="0.3"/>
+    <circle cx="50" cy="80" r="28" stroke="#667eea" stroke-width="2" fill="none" opacity="0.5"/>
+    <circle cx="50" cy="80" r="21" stroke="#667eea" stroke-width="2" fill="none" opacity="0.7"/>
+    <circle cx="50" cy="80" r="14" stroke="#667eea" stroke-width="2" fill="none" opacity="0.9"/>
+    <!-- 莲花花瓣 -->
+    <path d="M50 10 Q65 35 85 50 Q65 65 50 80 Q35 65 15 50 Q35 35 50 10" fill="#ff8fab"/>
+    <path d="M50 15 Q70 35 80 55 Q60 65 50 75 Q40 65 20 55 Q30 35 50 15" fill="#ffb3c1"/>
+    <path d="M50 20 Q75 35 75 60 Q60 65 50 70 Q40 65 25 60 Q25 35 50 20" fill="#ffccd5"/>
+    <!-- 箭头 -->
+    <path d="M45 40 L55 40 L55 65 L65 65 L50 80 L35 65 L45 65 Z" fill="#e53e3e"/>
+</svg>
+'''
+
+DISCLAIMER_FRAGMENT = '''<div class="section">
+    <h2>估价说明</h2>
+    <p>本报告基于市场比较法，结合城市基准价格、楼层系数、房龄衰减系数、朝向系数、装修系数等多维度因素计算得出。</p>
+    <p>报告仅供参考，不构成任何投资建议。如需更详细的估价服务，请联系我们的专业顾问。</p>
+</div>
+
+<div class="footer">
+    <p>© 2025 ValuHub房地产估价系统. 保留所有权利.</p>
+    <p>联系方式：support@valuhub.com | 服务热线：400-888-8888</p>
+</div>
+'''
+
+VALUATION_REPORT_TEMPLATE = '''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>智汇云房地产估价报告</title>
+    <style>
+{% block styles %}{{ fragments.styles }}{% endblock %}
+    </style>
+</head>
+<body>
+    <div class="header">
+        <div class="logo">
+            {{ fragments.logo }}
+        </div>
+        <h1>ValuHub房地产估价报告</h1>
+        <p style="color: #666;">Professional Real Estate Valuation Report</p>
+    </div>
+    
+    {% block content %}
+    <div class="report-info">
+        <div>
+            <div class="report-info-item"><strong>报告编号:</strong> {{ project_id }}</div>
+            <div class="report-info-item"><strong>生成时间:</strong> {{ generate_time }}</div>
+        </div>
+        <div>
+            <div class="report-info-item"><strong>估价对象:</strong> {{ community }}</div>
+            <div class="report-info-item"><strong>所在城市:</strong> {{ city }} {{ district }}</div>
+        </div>
+    </div>
+    
+    <div class="section">
+        <h2>房产基本信息</h2>
+        <div class="property-info-grid">
+            <div class="property-info-item">
+                <span>小区名称</span>
+                <span>{{ community }}</span>
+            </div>
+            <div class="property-info-item">
+                <span>所在城市</span>
+                <span>{{ city }} {{ district }}</span>
+            </div>
+            <div class="property-info-item">
+                <span>建筑面积</span>
+                <span>{{ area }} ㎡</span>
+            </div>
+            <div class="property-info-item">
+                <span>户型</span>
+                <span>{{ room_type }}</span>
+            </div>
+            <div class="property-info-item">
+                <span>所在楼层</span>
+                <span>{{ floor }}/{{ total_floors }}</span>
+            </div>
+            <div class="property-info-item">
+                <span>房龄</span>
+                <span>{{ age }} 年</span>
+            </div>
+            <div class="property-info-item">
+                <span>朝向</span>
+                <span>{{ orientation }}</span>
+            </div>
+            <div class="property-info-item">
+                <span>装修程度</span>
+                <span>{{ decoration }}</span>
+            </div>
+            <div class="property-info-item">
+                <span>电梯</span>
+                <span>{{ '有' if elevator else '无' }}</span>
+            </div>
+            <div class="property-info-item">
+                <span>车位</span>
+                <span>{{ '有' if parking_space else '无' }}</span>
+            </div>
+            {% if school_district %}
+            <div class="property-info-item">
+                <span>学区</span>
+                <span>{{ school_district }}</span>
+            </div>
+            {% endif %}
+        </div>
+    </div>
+    
+    <div class="section">
+        <h2>核心估价结果</h2>
+        <div class="result-card">
+            <div class="result-grid">
+                <div class="result-item">
+                    <span class="result-label">建筑面积</span>
+                    <span class="result-value">{{ area }} ㎡</span>
+                </div>
+                <div class="result-item">
+                    <span class="result-label">单价</span>
+                    <span class="result-value">{{ price_per_sqm }} 元/㎡</span>
+                </div>
+                <div class="result-item">
+                    <span class="result-label">总价</span>
+                    <span class="result-value">{{ total_price }} 元</span>
+                </div>
+                <div class="result-item">
+                    <span class="result-label">市场信心度</span>
+                    <span class="result-value">{{ confidence * 100 }}%</span>
+                </div>
+            </div>
+        </div>
+    </div>
+    
+    <div class="section">
+        <h2>影响因素分析</h2>
+        <ul class="factors-list">
+            {% for factor in factors %}
+            <li class="factor-item">{{ factor }}</li>
+            {% endfor %}
+        </ul>
+    </div>
+    
+    <div class="section">
+        <h2>市场分析</h2>
+        <div class="market-analysis">
+            <div class="price-trend">价格走势: {{ price_trend }}</div>
+            <p>{{ market_analysis }}</p>
+        </div>
+    </div>
+    
+    <div class="section">
+        <h2>类似案例分析</h2>
+        <table>
+            <thead>
+                <tr>
+                    <th>小区名称</th>
+                    <th>建筑面积 (㎡)</th>
+                    <th>楼层</th>
+                    <th>单价 (元/㎡)</th>
+                    <th>总价 (元)</th>
+                    <th>距离</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for case in similar_cases %}
+                <tr>
+                    <td>{{ case.community }}</td>
+                    <td>{{ case.area }}</td>
+                    <td>{{ case.floor }}/{{ total_floors }}</td>
+                    <td>{{ case.price_per_sqm }}</td>
+                    <td>{{ case.total_price }}</td>
+                    <td>{{ case.distance }}</td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+    </div>
+    
+    <div class="section">
+        <h2>分析建议</h2>
+        <div class="recommendation">
+            <p>{{ recommendation }}</p>
+        </div>
+    </div>
+    
+    {% endblock %}
+    
+    {% block disclaimer %}{{ fragments.disclaimer }}{% endblock %}
+</body>
+</html>
+'''
+
+BUILTIN_SOURCES = {
+    BUILTIN_TEMPLATE: VALUATION_REPORT_TEMPLATE,
+    FRAGMENTS["styles"]: STYLES_FRAGMENT,
+    FRAGMENTS["logo"]: LOGO_FRAGMENT,
+    FRAGMENTS["disclaimer"]: DISCLAIMER_FRAGMENT
+}
+
+
+def template_source(template) -> Optional[str]:
+    """数据库模板的Jinja源码（template_content 中的 html 字段），没有时为None"""
+    content = template.template_content
+    if isinstance(content, dict) and content.get("html"):
+        return content["html"]
+    return None
+
+
+def db_template_name(template) -> str:
+    """数据库模板在Jinja环境中的名称"""
+    version = int(template.updated_at.timestamp() * 1_000_000) if template.updated_at else 0
+    return f"db/{template.id}@{version}"
+
+
+# 内置模板和片段源码的摘要，内置模板修改后旧报告的内容哈希随之失效
+BUILTIN_FINGERPRINT = hashlib.sha256(
+    "\0".join(BUILTIN_SOURCES[name] for name in sorted(BUILTIN_SOURCES)).encode("utf-8")
+).hexdigest()[:16]
+
+
+def template_fingerprint(template_name: str) -> str:
+    """
+    模板标识，用于报告内容哈希
+
+    数据库模板名已包含更新时间；数据库模板可以继承内置模板，因此都附带内置源码摘要。
+    """
+    return f"{template_name}#{BUILTIN_FINGERPRINT}"
+
+
+class ReportTemplateLoader(BaseLoader):
+    """
+    报告模板加载器
+
+    内置模板直接返回源码；数据库模板只在环境缓存未命中时查询一次。
+    模板名已包含版本，缓存的编译结果始终有效，无需每次渲染回查数据库。
+    """
+
+    def __init__(self, session_factory: Callable = None):
+        self.session_factory = session_factory
+
+    def _load(self, template_id: int):
+        from app.models.report import ReportTemplate
+
+        if self.session_factory is None:
+            from app.database.database import SessionLocal
+            self.session_factory = SessionLocal
+
+        db = self.session_factory()
+        try:
+            return db.get(ReportTemplate, template_id)
+        finally:
+            db.close()
+
+    def get_source(self, environment: Environment, template: str) -> Tuple[str, Optional[str], Callable[[], bool]]:
+        if template in BUILTIN_SOURCES:
+            return BUILTIN_SOURCES[template], None, lambda: True
+
+        match = DB_TEMPLATE_NAME.fullmatch(template)
+        row = self._load(int(match.group(1))) if match else None
+        source = template_source(row) if row is not None else None
+        if source is None:
+            raise TemplateNotFound(template)
+        return source, None, lambda: True
+
+    def list_templates(self) -> List[str]:
+        return sorted(BUILTIN_SOURCES)
+
+
+def render_fragments(environment: Environment) -> Dict[str, Markup]:
+    """渲染全部静态片段（标记为安全的HTML，插入报告时不再转义）"""
+    return {key: Markup(environment.get_template(name).render()) for key, name in FRAGMENTS.items()}
+
+
+def autoescape_template(template_name: Optional[str]) -> bool:
+    """HTML模板自动转义：内置 .html 模板、数据库模板和直接从字符串编译的模板"""
+    if template_name is None:
+        return True
+    return template_name.endswith(".html") or DB_TEMPLATE_NAME.fullmatch(template_name) is not None
+
+
+def create_report_environment(session_factory: Callable = None, bytecode_dir: str = None) -> Environment:
+    """
+    创建报告模板环境
+
+    Args:
+        session_factory: 读取数据库模板使用的会话工厂，默认SessionLocal
+        bytecode_dir: 字节码缓存目录，默认使用 REPORT_TEMPLATE_BYTECODE_DIR
+    """
+    bytecode_dir = bytecode_dir or settings.REPORT_TEMPLATE_BYTECODE_DIR
+    # 缓存文件名区别于非沙箱环境编译的旧字节码（旧字节码未转义，不能复用）
+    bytecode_cache = FileSystemBytecodeCache(bytecode_dir or None, "__report_sandbox_%s.cache")
+    environment = ImmutableSandboxedEnvironment(
+        loader=ReportTemplateLoader(session_factory),
+        autoescape=autoescape_template,
+        bytecode_cache=bytecode_cache if settings.REPORT_TEMPLATE_BYTECODE_CACHE else None,
+        cache_size=settings.REPORT_TEMPLATE_CACHE_SIZE,
+        auto_reload=False
+    )
+    # 静态片段预先渲染为全局变量，之后每份报告直接拼接字符串
+    environment.globals["fragments"] = render_fragments(environment)
+    return environment
+
+
+report_environment = create_report_environment()
+
+
+def get_report_template(template=None, environment: Environment = None) -> Template:
+    """
+    获取编译后的报告模板
+
+    Args:
+        template: ReportTemplate记录，为空或没有html源码时使用内置模板
+        environment: 模板环境，默认全局环境
+    """
+    environment = environment or report_environment
+    if template is not None and template_source(template):
+        return environment.get_template(db_template_name(template))
+    return environment.get_template(BUILTIN_TEMPLATE)
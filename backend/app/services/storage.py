@@ -0,0 +1,296 @@
+"""
+ValuHub 文件存储
+上传文件、导出文件和报告文件统一通过存储后端保存：配置了OSS账号时使用OSS，否则使用本地磁盘。
+本地后端按键的哈希分目录存放，原子写入并记录SHA-256校验和，通过带过期时间的签名URL下载
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import quote, urlencode
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 本地文件读写的块大小
+CHUNK_SIZE = 1024 * 1024
+
+
+class StoredFile(NamedTuple):
+    """已保存的文件"""
+    key: str
+    size: int
+    checksum: Optional[str] = None  # SHA-256（本地后端），OSS后端为None
+
+
+def unique_key(original_filename: str, prefix: str = "uploads") -> str:
+    """生成不重复的存储键：<prefix>/<日期>/<时间>_<随机串><扩展名>"""
+    ext = os.path.splitext(original_filename)[1]
+    return f"{prefix}/{datetime.now().strftime('%Y%m%d/%H%M%S')}_{uuid.uuid4().hex}{ext}"
+
+
+class StorageBackend:
+    """
+    存储后端接口
+
+    键为 "/" 分隔的相对路径（如 exports/xxx.csv）；保存失败时抛出异常。
+    """
+
+    name = ""
+    # 远程存储：本地磁盘之外的副本，报告存储据此决定是否转存
+    remote = False
+
+    def save_stream(self, key: str, stream: BinaryIO) -> StoredFile:
+        """边读边保存文件流"""
+        raise NotImplementedError
+
+    def save_file(self, key: str, local_path: str, move: bool = False) -> StoredFile:
+        """保存本地文件，move为True时保存后删除（或直接移入）原文件"""
+        raise NotImplementedError
+
+    def download_to(self, key: str, local_path: str) -> bool:
+        """下载到本地文件，不存在时返回False"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def url(self, key: str, expires: int = None, filename: str = None) -> str:
+        """
+        带过期时间的下载地址
+
+        Args:
+            expires: 有效期（秒），默认 STORAGE_URL_EXPIRES
+            filename: 下载时的文件名，默认取键的最后一段
+        """
+        raise NotImplementedError
+
+    def object_url(self, key: str) -> str:
+        """上传接口返回的文件地址（长期有效，调用方会保存下来）"""
+        return self.url(key)
+
+    def upload_file(self, file_obj: BinaryIO, original_filename: str) -> Dict[str, Any]:
+        """上传文件（边读边写，不整体读入内存）"""
+        key = unique_key(original_filename)
+        try:
+            file_obj.seek(0)
+            stored = self.save_stream(key, file_obj)
+            return {
+                "success": True,
+                "url": self.object_url(key),
+                "filename": key,
+                "original_filename": original_filename,
+                "size": stored.size
+            }
+        except Exception as e:
+            logger.warning("文件上传失败 %s: %s", original_filename, e)
+            return {
+                "success": False,
+                "original_filename": original_filename,
+                "error": str(e)
+            }
+
+    def upload_files(self, files: Sequence[Tuple[BinaryIO, str]]) -> List[Dict[str, Any]]:
+        """批量上传，结果与输入顺序一致"""
+        if not files:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(files), settings.OSS_BATCH_UPLOAD_CONCURRENCY)) as executor:
+            return list(executor.map(lambda item: self.upload_file(*item), files))
+
+
+class LocalStorage(StorageBackend):
+    """
+    本地磁盘存储
+
+    文件路径为 <root>/<h[:2]>/<h[2:4]>/<h><扩展名>（h为键的SHA-1），避免单个目录下文件过多；
+    旁边的 .meta.json 记录键、大小和SHA-256。先写临时文件再原子替换，读者不会看到写了一半的文件。
+    下载地址为 /api/v1/files/<键>，带过期时间和HMAC签名；上传接口返回的地址不过期（expires=0）。
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = None, signing_key: str = None):
+        self.root = root or settings.STORAGE_LOCAL_DIR
+        self.signing_key = (signing_key or settings.STORAGE_SIGNING_KEY or settings.SECRET_KEY).encode("utf-8")
+
+    def path_for(self, key: str) -> str:
+        """文件的本地路径"""
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        ext = os.path.splitext(key)[1]
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}{ext}")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.splitext(self.path_for(key))[0] + ".meta.json"
+
+    def _temp_path(self, key: str) -> str:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{uuid.uuid4().hex}.tmp"
+
+    def _commit(self, key: str, temp_path: str, size: int, checksum: str) -> StoredFile:
+        os.replace(temp_path, self.path_for(key))
+        meta_temp = f"{self._meta_path(key)}.{uuid.uuid4().hex}.tmp"
+        with open(meta_temp, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "size": size, "sha256": checksum}, f, ensure_ascii=False)
+        os.replace(meta_temp, self._meta_path(key))
+        return StoredFile(key, size, checksum)
+
+    def save_stream(self, key: str, stream: BinaryIO) -> StoredFile:
+        temp_path = self._temp_path(key)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            return self._commit(key, temp_path, size, digest.hexdigest())
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def save_file(self, key: str, local_path: str, move: bool = False) -> StoredFile:
+        if not move:
+            with open(local_path, "rb") as f:
+                return self.save_stream(key, f)
+
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        temp_path = self._temp_path(key)
+        # 同一文件系统内为重命名，跨文件系统时复制
+        shutil.move(local_path, temp_path)
+        return self._commit(key, temp_path, os.path.getsize(temp_path), digest.hexdigest())
+
+    def stat(self, key: str) -> Optional[StoredFile]:
+        """文件信息，不存在时为None"""
+        try:
+            with open(self._meta_path(key), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("key") != key or not os.path.exists(self.path_for(key)):
+            return None
+        return StoredFile(key, meta["size"], meta["sha256"])
+
+    def download_to(self, key: str, local_path: str) -> bool:
+        if not self.exists(key):
+            return False
+        shutil.copyfile(self.path_for(key), local_path)
+        return True
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def delete(self, key: str) -> bool:
+        removed = False
+        for path in (self._meta_path(key), self.path_for(key)):
+            try:
+                os.remove(path)
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def sign(self, key: str, expires_at: int, filename: str = None) -> str:
+        """下载地址签名，覆盖键、过期时间（0为不过期）和下载文件名"""
+        message = f"{key}\n{expires_at}\n{filename or ''}".encode("utf-8")
+        return hmac.new(self.signing_key, message, hashlib.sha256).hexdigest()
+
+    def verify(self, key: str, expires_at: int, signature: str, filename: str = None) -> bool:
+        """签名正确且未过期"""
+        if expires_at and expires_at < time.time():
+            return False
+        return hmac.compare_digest(self.sign(key, expires_at, filename), signature)
+
+    def _signed_url(self, key: str, expires_at: int, filename: str = None) -> str:
+        params = {"expires": expires_at, "signature": self.sign(key, expires_at, filename)}
+        if filename:
+            params["name"] = filename
+        return f"{settings.API_V1_PREFIX}/files/{quote(key)}?{urlencode(params)}"
+
+    def url(self, key: str, expires: int = None, filename: str = None) -> str:
+        return self._signed_url(key, int(time.time()) + (expires or settings.STORAGE_URL_EXPIRES), filename)
+
+    def object_url(self, key: str) -> str:
+        # 上传的文件地址会被保存到业务数据中，与OSS的对象地址一样不过期；删除文件后失效
+        return self._signed_url(key, 0)
+
+
+class OssStorage(StorageBackend):
+    """阿里云OSS存储，大文件由OssService分片并行上传"""
+
+    name = "oss"
+    remote = True
+
+    def __init__(self, service=None):
+        if service is None:
+            from app.services.oss import oss_service
+            service = oss_service
+        self.service = service
+
+    def save_stream(self, key: str, stream: BinaryIO) -> StoredFile:
+        return StoredFile(key, self.service.upload_stream(key, stream))
+
+    def save_file(self, key: str, local_path: str, move: bool = False) -> StoredFile:
+        size = os.path.getsize(local_path)
+        if not self.service.put_file(key, local_path):
+            raise IOError(f"OSS上传失败: {key}")
+        if move:
+            os.remove(local_path)
+        return StoredFile(key, size)
+
+    def download_to(self, key: str, local_path: str) -> bool:
+        return self.service.download_file(key, local_path)
+
+    def exists(self, key: str) -> bool:
+        return self.service.object_exists(key)
+
+    def delete(self, key: str) -> bool:
+        return self.service.delete_file(key)
+
+    def url(self, key: str, expires: int = None, filename: str = None) -> str:
+        from app.core.file_response import content_disposition
+
+        params = {"response-content-disposition": content_disposition(filename)} if filename else None
+        return self.service.bucket.sign_url("GET", key, expires or settings.STORAGE_URL_EXPIRES, params=params)
+
+    def object_url(self, key: str) -> str:
+        return self.service.object_url(key)
+
+
+def create_storage(backend: str = None) -> StorageBackend:
+    """
+    按配置创建存储后端
+
+    Args:
+        backend: oss、local 或 auto（配置了OSS账号时用OSS，否则用本地磁盘），默认 STORAGE_BACKEND
+    """
+    backend = (backend or settings.STORAGE_BACKEND).lower()
+    if backend == "auto":
+        from app.services.oss import oss_service
+        backend = "oss" if oss_service.available else "local"
+    if backend == "oss":
+        return OssStorage()
+    if backend == "local":
+        return LocalStorage()
+    raise ValueError(f"不支持的存储后端: {backend}")
+
+
+# 全局存储后端
+storage = create_storage()
@@ -0,0 +1,496 @@
+"""
+ValuHub 两级缓存
+进程内TTL LRU + Redis；按key单飞合并回源、概率提前刷新、过期后先返回旧值再后台刷新，Redis故障时熔断
+"""
+
+import asyncio
+import functools
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Redis熔断器
+
+    连续失败 failure_threshold 次后打开，期间不访问Redis；
+    reset_timeout 秒后放行一次探测（半开），成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold or settings.CACHE_BREAKER_FAILURES
+        self.reset_timeout = settings.CACHE_BREAKER_RESET_SECONDS if reset_timeout is None else reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.failure_threshold:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """是否可以访问Redis；半开状态下同一时间只放行一个探测请求"""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                if self.failures == self.failure_threshold:
+                    logger.warning("Redis连续失败%d次，缓存熔断%.0f秒", self.failures, self.reset_timeout)
+                self.opened_at = time.monotonic()
+
+
+class CacheEntry:
+    """
+    缓存条目
+
+    expires_at 之前为新鲜值，stale_until 之前可作为旧值返回并触发后台刷新；
+    delta 为回源耗时，用于概率提前刷新（回源越慢，越早开始刷新）。
+    """
+
+    __slots__ = ("value", "expires_at", "stale_until", "delta")
+
+    def __init__(self, value: Any, expires_at: float, stale_until: float, delta: float):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.delta = delta
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"v": self.value, "e": self.expires_at, "s": self.stale_until, "d": self.delta}
+
+    @classmethod
+    def from_dict(cls, data: Any) -> Optional["CacheEntry"]:
+        if not isinstance(data, dict) or "e" not in data or "v" not in data:
+            return None
+        return cls(data["v"], data["e"], data["s"], data["d"])
+
+
+class TieredCache:
+    """
+    两级缓存服务
+
+    读取顺序：进程内LRU（LOCAL_TTL内直接使用）-> Redis -> 回源。
+    同一进程内同一个key同时只有一个回源，其他调用方等待其结果；
+    新鲜值按XFetch算法以一定概率提前在后台刷新，过期但未超过STALE_TTL的值
+    直接返回并在后台刷新，避免大量进程在同一时刻同时回源。
+    Redis不可用（或熔断）时只使用进程内缓存。
+    """
+
+    def __init__(
+        self,
+        namespace: str = "tiered",
+        redis_cache=None,
+        local_size: int = None,
+        local_ttl: float = None,
+        stale_ttl: float = None,
+        beta: float = None,
+        breaker: CircuitBreaker = None
+    ):
+        self.namespace = namespace
+        self._redis_cache = redis_cache
+        self.local_size = local_size or settings.TIERED_CACHE_LOCAL_SIZE
+        self.local_ttl = settings.TIERED_CACHE_LOCAL_TTL if local_ttl is None else local_ttl
+        self.stale_ttl = settings.TIERED_CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+        self.beta = settings.TIERED_CACHE_BETA if beta is None else beta
+        self.breaker = breaker or CircuitBreaker()
+
+        # key -> (写入进程内缓存的时间, 条目)
+        self._local: "OrderedDict[str, Tuple[float, CacheEntry]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        # 后台刷新任务：事件循环只保留任务的弱引用，需持有到完成，否则可能中途被回收
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.counters: Dict[str, int] = {
+            "local_hit": 0, "redis_hit": 0, "miss": 0, "stale": 0,
+            "early_refresh": 0, "load": 0, "coalesced": 0, "redis_error": 0
+        }
+
+    @property
+    def redis(self):
+        if self._redis_cache is None:
+            from app.services.cache import cache
+            self._redis_cache = cache
+        return self._redis_cache
+
+    # ---- 读取 ----
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: int = None) -> Any:
+        """
+        读取缓存，未命中时调用loader回源并写入两级缓存
+
+        Args:
+            key: 缓存key
+            loader: 回源函数
+            ttl: 新鲜期（秒），默认 CACHE_EXPIRE_TIME
+        """
+        ttl = ttl or settings.CACHE_EXPIRE_TIME
+        now = time.time()
+        entry = self._local_lookup(key, now)
+        if entry is None:
+            entry = self._remote_lookup(key, now)
+
+        if entry is not None:
+            refresh = self._needs_refresh(entry, now)
+            if refresh:
+                self._submit_refresh(key, loader, ttl)
+            if refresh != "expired" or now < entry.stale_until:
+                return entry.value
+
+        return self._load(key, loader, ttl)
+
+    async def aget_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int = None) -> Any:
+        """
+        get_or_load 的协程版本，loader为异步回源函数
+
+        进程内命中不离开事件循环，Redis读写在线程池中执行
+        """
+        ttl = ttl or settings.CACHE_EXPIRE_TIME
+        now = time.time()
+        entry = self._local_lookup(key, now)
+        if entry is None:
+            entry = await run_in_threadpool(self._remote_lookup, key, now)
+
+        if entry is not None:
+            refresh = self._needs_refresh(entry, now)
+            if refresh:
+                self._submit_async_refresh(key, loader, ttl)
+            if refresh != "expired" or now < entry.stale_until:
+                return entry.value
+
+        return await self._aload(key, loader, ttl)
+
+    def _local_lookup(self, key: str, now: float) -> Optional[CacheEntry]:
+        """进程内缓存在 local_ttl 内视为可信；Redis不可用时放宽到条目的旧值期限"""
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            cached_at, entry = item
+            if now >= entry.stale_until:
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            if now - cached_at < self.local_ttl or self.breaker.state == CircuitBreaker.OPEN:
+                self.counters["local_hit"] += 1
+                return entry
+        return None
+
+    def _remote_lookup(self, key: str, now: float) -> Optional[CacheEntry]:
+        if not self.breaker.allow():
+            return self._local_fallback(key)
+
+        redis_cache = self.redis
+        try:
+            data = redis_cache.redis_client.get(self._redis_key(key))
+        except Exception as e:
+            self._redis_failed("get", e)
+            return self._local_fallback(key)
+        self.breaker.record_success()
+
+        entry = CacheEntry.from_dict(redis_cache.serializer.loads(data)) if data else None
+        if entry is None or now >= entry.stale_until:
+            # 其他进程已删除或从未写入，本地副本同样作废
+            with self._lock:
+                self._local.pop(key, None)
+                self.counters["miss"] += 1
+            return None
+
+        with self._lock:
+            self.counters["redis_hit"] += 1
+        self._put_local(key, entry, now)
+        return entry
+
+    def _local_fallback(self, key: str) -> Optional[CacheEntry]:
+        """Redis不可用时使用进程内副本，即使已超过 local_ttl"""
+        with self._lock:
+            item = self._local.get(key)
+            if item is not None and time.time() < item[1].stale_until:
+                self.counters["local_hit"] += 1
+                return item[1]
+            self.counters["miss"] += 1
+        return None
+
+    def _needs_refresh(self, entry: CacheEntry, now: float) -> Optional[str]:
+        """
+        判断是否需要刷新
+
+        Returns:
+            None：新鲜；"early"：新鲜但按概率提前刷新；"expired"：已过期
+        """
+        if now >= entry.expires_at:
+            self.counters["stale"] += 1
+            return "expired"
+        # XFetch：now - delta * beta * ln(U) >= expiry，U取(0, 1]
+        if self.beta > 0 and now - entry.delta * self.beta * math.log(1.0 - random.random()) >= entry.expires_at:
+            self.counters["early_refresh"] += 1
+            return "early"
+        return None
+
+    # ---- 回源 ----
+
+    def _load(self, key: str, loader: Callable[[], Any], ttl: int) -> Any:
+        """前台回源，同一key的并发调用只执行一次loader"""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            return future.result(timeout=settings.TIERED_CACHE_LOAD_TIMEOUT)
+        return self._run_load(key, loader, ttl, future)
+
+    def _run_load(self, key: str, loader: Callable[[], Any], ttl: int, future: Future) -> Any:
+        try:
+            started = time.perf_counter()
+            value = loader()
+            self._store(key, value, ttl, time.perf_counter() - started)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _submit_refresh(self, key: str, loader: Callable[[], Any], ttl: int):
+        """后台刷新，已有回源在进行时跳过"""
+        with self._lock:
+            if key in self._inflight:
+                return
+            future = self._inflight[key] = Future()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.TIERED_CACHE_REFRESH_WORKERS,
+                    thread_name_prefix="cache-refresh"
+                )
+        self._executor.submit(self._background, self._run_load, key, loader, ttl, future)
+
+    async def _aload(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int) -> Any:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            # shield：等待超时不能取消领头协程/线程正在使用的Future
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), settings.TIERED_CACHE_LOAD_TIMEOUT
+            )
+        return await self._arun_load(key, loader, ttl, future)
+
+    async def _arun_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int, future: Future) -> Any:
+        try:
+            started = time.perf_counter()
+            value = await loader()
+            await run_in_threadpool(self._store, key, value, ttl, time.perf_counter() - started)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _submit_async_refresh(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int):
+        with self._lock:
+            if key in self._inflight:
+                return
+            future = self._inflight[key] = Future()
+
+        async def refresh():
+            try:
+                await self._arun_load(key, loader, ttl, future)
+            except Exception as e:
+                logger.warning("缓存后台刷新失败 %s: %s", key, e)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    @staticmethod
+    def _background(run, *args):
+        try:
+            run(*args)
+        except Exception as e:
+            logger.warning("缓存后台刷新失败 %s: %s", args[0], e)
+
+    # ---- 写入 ----
+
+    def _store(self, key: str, value: Any, ttl: int, delta: float):
+        with self._lock:
+            self.counters["load"] += 1
+        self._write_entries({key: self._entry(value, ttl, delta)}, ttl)
+
+    def set(self, key: str, value: Any, ttl: int = None):
+        """直接写入两级缓存（如定时任务预热）"""
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, mapping: Mapping[str, Any], ttl: int = None) -> bool:
+        """
+        批量写入两级缓存，Redis写入使用管道
+
+        Returns:
+            Redis是否写入成功（失败时仍写入进程内缓存）
+        """
+        ttl = ttl or settings.CACHE_EXPIRE_TIME
+        return self._write_entries({key: self._entry(value, ttl, 0.0) for key, value in mapping.items()}, ttl)
+
+    def _entry(self, value: Any, ttl: int, delta: float) -> CacheEntry:
+        now = time.time()
+        return CacheEntry(value, now + ttl, now + ttl + self.stale_ttl, delta)
+
+    def _write_entries(self, entries: Dict[str, CacheEntry], ttl: int) -> bool:
+        now = time.time()
+        for key, entry in entries.items():
+            self._put_local(key, entry, now)
+
+        if not self.breaker.allow():
+            return False
+        ok = self.redis.mset(
+            {self._redis_key(key): entry.to_dict() for key, entry in entries.items()},
+            expire=int(ttl + self.stale_ttl)
+        )
+        if ok:
+            self.breaker.record_success()
+        else:
+            self._redis_failed("set", None)
+        return ok
+
+    def invalidate(self, key: str):
+        """删除两级缓存中的条目；其他进程的进程内副本最迟在 local_ttl 后失效"""
+        with self._lock:
+            self._local.pop(key, None)
+        if self.breaker.allow():
+            try:
+                self.redis.redis_client.delete(self._redis_key(key))
+                self.breaker.record_success()
+            except Exception as e:
+                self._redis_failed("delete", e)
+
+    def clear_local(self):
+        """清空进程内缓存和计数"""
+        with self._lock:
+            self._local.clear()
+            for name in self.counters:
+                self.counters[name] = 0
+
+    def _put_local(self, key: str, entry: CacheEntry, now: float):
+        with self._lock:
+            self._local[key] = (now, entry)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _redis_failed(self, op: str, error: Optional[Exception]):
+        with self._lock:
+            self.counters["redis_error"] += 1
+        self.breaker.record_failure()
+        if error is not None:
+            logger.warning("两级缓存Redis %s失败: %s", op, error)
+
+    # ---- 统计 ----
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self.counters)
+            data["size"] = len(self._local)
+        data["breaker"] = self.breaker.state
+        return data
+
+    def metrics_lines(self) -> List[str]:
+        """Prometheus指标"""
+        data = self.stats()
+        lines = [
+            "# HELP valuhub_tiered_cache_events_total 两级缓存命中、回源和刷新次数",
+            "# TYPE valuhub_tiered_cache_events_total counter"
+        ]
+        for event in self.counters:
+            lines.append(f'valuhub_tiered_cache_events_total{{cache="{self.namespace}",event="{event}"}} {data[event]}')
+        lines.append("# TYPE valuhub_tiered_cache_breaker_open gauge")
+        lines.append(
+            f'valuhub_tiered_cache_breaker_open{{cache="{self.namespace}"}} {int(data["breaker"] != CircuitBreaker.CLOSED)}'
+        )
+        return lines
+
+
+# 全局两级缓存
+tiered_cache = TieredCache()
+
+
+def cached(key: Callable[..., str], ttl: int = None, cache: TieredCache = None):
+    """
+    两级缓存装饰器，同时支持普通函数和协程函数
+
+    Args:
+        key: 由被装饰函数的参数生成缓存key
+        ttl: 新鲜期（秒）
+        cache: 使用的缓存实例，默认全局 tiered_cache
+
+    示例:
+        @cached(lambda city: f"city_avg_price_{city}", ttl=3600)
+        def city_average_price(city): ...
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await (cache or tiered_cache).aget_or_load(
+                    key(*args, **kwargs), lambda: func(*args, **kwargs), ttl
+                )
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return (cache or tiered_cache).get_or_load(key(*args, **kwargs), lambda: func(*args, **kwargs), ttl)
+        return wrapper
+
+    return decorator
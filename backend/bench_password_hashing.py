@@ -0,0 +1,65 @@
+"""
+密码哈希对事件循环延迟的影响
+
+模拟并发登录：对比在协程中直接调用bcrypt与放到线程池执行时，
+一个每1ms唤醒一次的探测协程观察到的事件循环延迟。
+
+用法: python bench_password_hashing.py [并发登录数]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+
+from app.services.password_hasher import pwd_context, verify_password
+
+
+async def probe_loop_lag(stop: asyncio.Event, samples: list):
+    """每1ms唤醒一次，记录实际唤醒延迟"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        samples.append((time.perf_counter() - started - 0.001) * 1000)
+
+
+async def blocking_login(password_hash: str):
+    pwd_context.verify("password123", password_hash)
+
+
+async def offloaded_login(password_hash: str):
+    await verify_password("password123", password_hash)
+
+
+async def run(login, logins: int, password_hash: str):
+    stop = asyncio.Event()
+    samples: list = []
+    probe = asyncio.create_task(probe_loop_lag(stop, samples))
+    await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login(password_hash) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    samples.sort()
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "lag_p50_ms": round(statistics.median(samples), 2),
+        "lag_p99_ms": round(samples[int(len(samples) * 0.99) - 1], 2),
+        "lag_max_ms": round(samples[-1], 2)
+    }
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    password_hash = pwd_context.hash("password123")
+
+    for name, login in (("阻塞调用", blocking_login), ("线程池", offloaded_login)):
+        result = asyncio.run(run(login, logins, password_hash))
+        print(f"{name}: {logins}个并发登录 {result}")
+
+
+if __name__ == "__main__":
+    main()
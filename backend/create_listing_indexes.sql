@@ -0,0 +1,34 @@
+-- 列表查询游标分页与筛选复合索引
+-- 与 app/models 中 __table_args__ 定义保持一致
+-- 使用 CONCURRENTLY 避免建索引期间锁表，需在事务外执行：psql -f create_listing_indexes.sql
+
+-- 游标分页以 (created_at, id) 为排序键，created_at 为空的行会被游标条件跳过，
+-- 模型中的默认值只在ORM插入时生效，因此先回填历史空值并在数据库层加非空约束
+UPDATE valuations SET created_at = now() WHERE created_at IS NULL;
+ALTER TABLE valuations ALTER COLUMN created_at SET DEFAULT now(), ALTER COLUMN created_at SET NOT NULL;
+
+UPDATE properties SET created_at = now() WHERE created_at IS NULL;
+ALTER TABLE properties ALTER COLUMN created_at SET DEFAULT now(), ALTER COLUMN created_at SET NOT NULL;
+
+UPDATE reports SET created_at = now() WHERE created_at IS NULL;
+ALTER TABLE reports ALTER COLUMN created_at SET DEFAULT now(), ALTER COLUMN created_at SET NOT NULL;
+
+-- 估价列表：按用户筛选，按 (created_at, id) 倒序分页
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_valuations_user_id_created_at
+    ON valuations (user_id, created_at, id);
+
+-- 房产估价历史：按房产筛选，按 (created_at, id) 倒序分页
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_valuations_property_id_created_at
+    ON valuations (property_id, created_at, id);
+
+-- 房产列表：城市/区域/类型组合筛选
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_city_district_type
+    ON properties (city, district, property_type);
+
+-- 房产列表：按 (created_at, id) 倒序分页
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_created_at_id
+    ON properties (created_at, id);
+
+-- 报告列表：按用户筛选，按 (created_at, id) 倒序分页
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_reports_user_id_created_at
+    ON reports (user_id, created_at, id);
@@ -2,15 +2,75 @@
 """
 ValuHub Python SDK
 用于访问ValuHub API的Python客户端库
+
+ValuHubClient 基于 requests.Session，复用连接池中的长连接；AsyncValuHubClient 基于 httpx.AsyncClient，
+安装了 h2 包时启用HTTP/2。两者都提供 valuate_many：按需读取输入、有限并发地逐条估价，
+遇到429/5xx或连接错误时按 Retry-After 或指数退避重试，按完成顺序返回结果。
 """
 
-import requests
+import asyncio
 import json
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from itertools import islice
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # 只使用同步客户端时不需要httpx
+    httpx = None
+
+# 可重试的响应状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# 幂等的请求方法，默认可重试
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+def _h2_available():
+    """是否安装了HTTP/2依赖（h2）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _retry_delay(attempt, retry_after=None, backoff=0.5, max_delay=60):
+    """
+    第 attempt 次重试前的等待时间（秒）
+
+    Args:
+        attempt (int): 已重试次数，从0开始
+        retry_after (str, optional): 响应的 Retry-After 头，秒数或HTTP日期
+        backoff (float): 指数退避的初始间隔
+        max_delay (float): 最长等待时间
+    """
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), max_delay)
+    # 指数退避加随机抖动，避免大量客户端同时重试
+    delay = backoff * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), max_delay)
+
 
 class ValuHubClient:
-    """ValuHub API客户端"""
+    """ValuHub API客户端（同步，线程安全）"""
     
-    def __init__(self, api_key, base_url='https://api.valu-hub.com/api', timeout=30):
+    def __init__(self, api_key, base_url='https://api.valu-hub.com/api', timeout=30,
+                 pool_size=10, max_retries=3, backoff=0.5):
         """
         初始化ValuHub客户端
         
@@ -18,16 +78,37 @@ class ValuHubClient:
             api_key (str): API密钥
             base_url (str): API基础URL，默认为生产环境
             timeout (int): 请求超时时间，默认30秒
+            pool_size (int): 连接池大小（同时保持的长连接数），默认10
+            max_retries (int): 429/5xx或连接错误时的最大重试次数，默认3
+            backoff (float): 指数退避的初始间隔（秒），默认0.5
         """
         self.api_key = api_key
         self.base_url = base_url
         self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
         self.headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
         }
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
     
-    def _make_request(self, method, endpoint, data=None, params=None):
+    def _make_request(self, method, endpoint, data=None, params=None, retries=None):
         """
         发送HTTP请求
         
@@ -36,6 +117,7 @@ class ValuHubClient:
             endpoint (str): API端点路径
             data (dict, optional): 请求体数据
             params (dict, optional): URL参数
+            retries (int, optional): 最大重试次数，幂等请求默认 max_retries，其他请求默认不重试
             
         Returns:
             dict: API响应数据
@@ -44,18 +126,30 @@ class ValuHubClient:
             requests.exceptions.RequestException: 请求失败时抛出异常
         """
         url = f'{self.base_url}{endpoint}'
+        if retries is None:
+            retries = self.max_retries if method.upper() in IDEMPOTENT_METHODS else 0
         
-        response = requests.request(
-            method=method,
-            url=url,
-            headers=self.headers,
-            json=data,
-            params=params,
-            timeout=self.timeout
-        )
-        
-        response.raise_for_status()
-        return response.json()
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(
+                    method=method,
+                    url=url,
+                    json=data,
+                    params=params,
+                    timeout=self.timeout
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= retries:
+                    raise
+                time.sleep(_retry_delay(attempt, backoff=self.backoff))
+                continue
+            if response.status_code in RETRY_STATUS and attempt < retries:
+                delay = _retry_delay(attempt, response.headers.get('Retry-After'), self.backoff)
+                response.close()
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response.json()
     
     def get_properties(self, limit=20, offset=0):
         """
@@ -109,12 +203,15 @@ class ValuHubClient:
         Returns:
             dict: 估价结果
         """
-        return self._make_request('POST', '/v2/valuate', data=property_data)
+        # 估价只计算结果，失败后重试是安全的
+        return self._make_request('POST', '/v2/valuate', data=property_data, retries=self.max_retries)
     
     def batch_valuate(self, properties):
         """
         批量房产估价
         
+        整批数据在一个请求中提交，数量较多时请使用 valuate_many
+        
         Args:
             properties (list): 房产数据列表，每个元素为房产数据字典
             
@@ -123,6 +220,38 @@ class ValuHubClient:
         """
         return self._make_request('POST', '/v1/valuations/batch', data={'properties': properties})
     
+    def valuate_many(self, properties, concurrency=None, return_exceptions=False):
+        """
+        并发估价多个房产，按完成顺序逐个返回
+        
+        输入按需读取，至多 concurrency 个请求同时进行，一条完成后补入下一条；
+        每条请求各自按 max_retries 重试。
+        
+        Args:
+            properties (iterable): 房产数据，可以是生成器
+            concurrency (int, optional): 并发请求数，默认为连接池大小
+            return_exceptions (bool): 为True时失败的条目返回异常对象，否则直接抛出
+            
+        Yields:
+            tuple: (输入中的序号, 估价结果或异常)
+        """
+        concurrency = concurrency or self.pool_size
+        items = enumerate(properties)
+        pending = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                for i, property_data in islice(items, concurrency - len(pending)):
+                    pending[executor.submit(self.valuate_property, property_data)] = i
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    error = future.exception()
+                    if error is not None and not return_exceptions:
+                        raise error
+                    yield index, error if error is not None else future.result()
+    
     def get_enterprise(self, enterprise_id):
         """
         获取企业详情
@@ -177,6 +306,129 @@ class ValuHubClient:
         return self._make_request('POST', '/api-keys', data=data)
 
 
+class AsyncValuHubClient:
+    """ValuHub API异步客户端（httpx），在同一个事件循环内复用连接"""
+    
+    def __init__(self, api_key, base_url='https://api.valu-hub.com/api', timeout=30,
+                 pool_size=10, max_retries=3, backoff=0.5, http2=None, transport=None):
+        """
+        初始化异步客户端
+        
+        Args:
+            api_key (str): API密钥
+            base_url (str): API基础URL，默认为生产环境
+            timeout (int): 请求超时时间，默认30秒
+            pool_size (int): 最大连接数，默认10
+            max_retries (int): 429/5xx或连接错误时的最大重试次数，默认3
+            backoff (float): 指数退避的初始间隔（秒），默认0.5
+            http2 (bool, optional): 是否启用HTTP/2，默认在安装了h2包时启用
+            transport (httpx.AsyncBaseTransport, optional): 自定义传输层（测试用）
+        """
+        if httpx is None:
+            raise ImportError('AsyncValuHubClient 需要安装 httpx')
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+        if http2 is None:
+            http2 = _h2_available()
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            http2=http2,
+            transport=transport
+        )
+    
+    async def aclose(self):
+        """关闭连接池"""
+        await self.client.aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    async def _make_request(self, method, endpoint, data=None, params=None, retries=None):
+        """
+        发送HTTP请求，参数和重试规则同 ValuHubClient._make_request
+        
+        Raises:
+            httpx.HTTPError: 请求失败时抛出异常
+        """
+        url = f'{self.base_url}{endpoint}'
+        if retries is None:
+            retries = self.max_retries if method.upper() in IDEMPOTENT_METHODS else 0
+        
+        for attempt in range(retries + 1):
+            try:
+                response = await self.client.request(method, url, json=data, params=params)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+                await asyncio.sleep(_retry_delay(attempt, backoff=self.backoff))
+                continue
+            if response.status_code in RETRY_STATUS and attempt < retries:
+                await asyncio.sleep(_retry_delay(attempt, response.headers.get('Retry-After'), self.backoff))
+                continue
+            response.raise_for_status()
+            return response.json()
+    
+    async def get_properties(self, limit=20, offset=0):
+        """获取房产列表"""
+        return await self._make_request('GET', '/v1/properties', params={'limit': limit, 'offset': offset})
+    
+    async def get_property(self, property_id):
+        """获取单个房产详情"""
+        return await self._make_request('GET', f'/v1/properties/{property_id}')
+    
+    async def valuate_property(self, property_data):
+        """房产估价（API v2），字段说明见 ValuHubClient.valuate_property"""
+        return await self._make_request('POST', '/v2/valuate', data=property_data, retries=self.max_retries)
+    
+    async def valuate_many(self, properties, concurrency=None, return_exceptions=False):
+        """
+        并发估价多个房产，按完成顺序逐个返回（异步生成器）
+        
+        输入按需读取，至多 concurrency 个请求同时进行，一条完成后补入下一条；
+        每条请求各自按 max_retries 重试。
+        
+        Args:
+            properties (iterable): 房产数据，可以是生成器
+            concurrency (int, optional): 并发请求数，默认为连接池大小
+            return_exceptions (bool): 为True时失败的条目返回异常对象，否则直接抛出
+            
+        Yields:
+            tuple: (输入中的序号, 估价结果或异常)
+        """
+        concurrency = concurrency or self.pool_size
+        items = enumerate(properties)
+        pending = {}
+        try:
+            while True:
+                for i, property_data in islice(items, concurrency - len(pending)):
+                    pending[asyncio.ensure_future(self.valuate_property(property_data))] = i
+                if not pending:
+                    return
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = pending.pop(task)
+                    error = task.exception()
+                    if error is not None and not return_exceptions:
+                        raise error
+                    yield index, error if error is not None else task.result()
+        finally:
+            # 出错或调用方提前停止迭代时取消在途请求
+            for task in pending:
+                task.cancel()
+
+
 # 使用示例
 if __name__ == '__main__':
     # 初始化客户端
@@ -208,3 +460,8 @@ if __name__ == '__main__':
         print(json.dumps(result, indent=2, ensure_ascii=False))
     except Exception as e:
         print(f'调用API失败: {e}')
+    
+    # 并发估价示例：按完成顺序输出
+    with client:
+        for index, result in client.valuate_many([property_data] * 5, concurrency=3, return_exceptions=True):
+            print(index, result)
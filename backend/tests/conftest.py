@@ -1,15 +1,18 @@
 import pytest
 from typing import Generator, AsyncGenerator
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 from app.main import app
-from app.database.database import get_db, Base
+from app.database.database import create_async_db_engine, get_async_db, get_db, Base
 from app.models.user import User
 from app.models.property import Property
 from app.models.valuation import Valuation
 from app.models.report import Report
 from app.core.config import settings
+from app.services.auth_cache import auth_cache
 
 TEST_DATABASE_URL = "sqlite:///./test.db"
 
@@ -18,6 +21,10 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步路由读取同一个测试库；TestClient每次进入都会新建事件循环，不复用连接
+async_engine = create_async_db_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool, echo=False)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
 
 @pytest.fixture(scope="function")
 def db_session() -> Generator[Session, None, None]:
@@ -30,15 +37,30 @@ def db_session() -> Generator[Session, None, None]:
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture
+def enqueued_reports(monkeypatch) -> list:
+    """记录加入渲染队列的报告ID，测试中不连接消息代理"""
+    enqueued = []
+    monkeypatch.setattr("app.api.v1.report.enqueue_report", enqueued.append)
+    return enqueued
+
+
 @pytest.fixture(scope="function")
-def client(db_session: Session) -> Generator[TestClient, None, None]:
+def client(db_session: Session, enqueued_reports: list) -> Generator[TestClient, None, None]:
     def override_get_db():
         try:
             yield db_session
         finally:
             pass
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    # 每个测试重建数据库，用户ID会重复，清空认证缓存避免串用
+    auth_cache.clear()
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -105,3 +105,50 @@ class TestAuthentication:
         response = client.post("/api/v1/auth/logout", headers=auth_headers)
         assert response.status_code == 200
         assert response.json()["message"] == "成功退出登录"
+    
+    def test_current_user_is_cached(self, client: TestClient, auth_headers):
+        from app.services.auth_cache import auth_cache
+        
+        client.get("/api/v1/auth/profile", headers=auth_headers)
+        hits = auth_cache.local_hits
+        response = client.get("/api/v1/auth/profile", headers=auth_headers)
+        assert response.status_code == 200
+        assert auth_cache.local_hits == hits + 1
+    
+    def test_profile_update_invalidates_cached_user(self, client: TestClient, auth_headers):
+        client.get("/api/v1/auth/profile", headers=auth_headers)
+        response = client.put(
+            "/api/v1/auth/profile",
+            headers=auth_headers,
+            json={"phone": "13900139000"}
+        )
+        assert response.status_code == 200
+        
+        response = client.get("/api/v1/auth/profile", headers=auth_headers)
+        assert response.json()["phone"] == "13900139000"
+    
+    def test_login_rehashes_outdated_password_hash(self, client: TestClient, db_session):
+        from app.models.user import User
+        from app.services.password_hasher import pwd_context
+        
+        outdated_hash = pwd_context.handler("bcrypt").using(rounds=4).hash("password123")
+        user = User(
+            username="rehashuser",
+            email="rehash@example.com",
+            password_hash=outdated_hash,
+            role="individual",
+            status="active"
+        )
+        db_session.add(user)
+        db_session.commit()
+        
+        response = client.post(
+            "/api/v1/auth/login",
+            json={"username": "rehashuser", "password": "password123"}
+        )
+        assert response.status_code == 200
+        
+        db_session.refresh(user)
+        assert user.password_hash != outdated_hash
+        assert pwd_context.verify("password123", user.password_hash)
+        assert not pwd_context.needs_update(user.password_hash)
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.config import settings
+from app.services.cache import CacheSerializer, RedisCache
+from app.services.tiered_cache import CircuitBreaker, TieredCache, cached
+
+
+class RecordingPipeline:
+
+    def __init__(self, store, executed):
+        self.store = store
+        self.executed = executed
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, key, value, ex=None):
+        self.pending.append((key, value, ex))
+
+    def execute(self):
+        self.executed.append(len(self.pending))
+        for key, value, _ in self.pending:
+            self.store[key] = value
+        self.pending = []
+
+
+class RecordingRedis:
+
+    def __init__(self):
+        self.store = {}
+        self.executed = []
+
+    def pipeline(self, transaction=True):
+        return RecordingPipeline(self.store, self.executed)
+
+    def mget(self, keys):
+        return [self.store.get(key) for key in keys]
+
+
+@pytest.mark.unit
+class TestCacheSerializer:
+
+    @pytest.mark.parametrize("codec", ["json", "msgpack"])
+    def test_round_trip(self, codec):
+        serializer = CacheSerializer(codec=codec, compress_threshold=0)
+        value = {"city": "湘潭", "prices": [1.5, 2, None], "nested": {"ok": True}}
+        assert serializer.loads(serializer.dumps(value)) == value
+
+    def test_compresses_large_values(self):
+        serializer = CacheSerializer(codec="json", compress_threshold=256)
+        value = {"analysis": "成交活跃" * 500}
+        data = serializer.dumps(value)
+        assert len(data) < len(json.dumps(value, ensure_ascii=False).encode("utf-8")) / 10
+        assert serializer.loads(data) == value
+
+    def test_reads_legacy_json_values(self):
+        legacy = json.dumps({"average_price": 13038}, ensure_ascii=False).encode("utf-8")
+        assert CacheSerializer.loads(legacy) == {"average_price": 13038}
+
+
+@pytest.mark.unit
+class TestRedisCacheBatch:
+
+    def test_mset_pipelines_in_batches(self, monkeypatch):
+        monkeypatch.setattr(settings, "CACHE_PIPELINE_BATCH_SIZE", 2)
+        redis_cache = RedisCache()
+        redis_cache.redis_client = RecordingRedis()
+
+        assert redis_cache.mset({f"key{i}": {"i": i} for i in range(5)}, expire=60)
+        assert redis_cache.redis_client.executed == [2, 2, 1]
+        assert redis_cache.mget(["key0", "missing", "key4"]) == [{"i": 0}, None, {"i": 4}]
+
+        stats = redis_cache.stats.snapshot()
+        assert stats["mset"]["count"] == 1
+        assert stats["mget"]["errors"] == 0
+
+
+class FakeRedisCache:
+
+    def __init__(self):
+        self.serializer = CacheSerializer(codec="json", compress_threshold=0)
+        self.store = {}
+        self.down = False
+        self.redis_client = self
+
+    def get(self, key):
+        if self.down:
+            raise ConnectionError("redis down")
+        return self.store.get(key)
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+    def mset(self, mapping, expire=None):
+        if self.down:
+            return False
+        for key, value in mapping.items():
+            self.store[key] = self.serializer.dumps(value)
+        return True
+
+
+@pytest.mark.unit
+class TestTieredCache:
+
+    def build(self, **kwargs):
+        options = {"local_ttl": 30, "stale_ttl": 60, "beta": 0}
+        options.update(kwargs)
+        return TieredCache(redis_cache=FakeRedisCache(), breaker=CircuitBreaker(2, 30), **options)
+
+    def test_concurrent_misses_load_once(self):
+        tiered = self.build()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"price": 13038}
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: tiered.get_or_load("city_data_长沙", loader, ttl=60), range(8)))
+
+        assert len(calls) == 1
+        assert all(result == {"price": 13038} for result in results)
+        assert tiered.stats()["coalesced"] == 7
+
+    def test_expired_value_served_while_refreshing(self):
+        tiered = self.build()
+        tiered.set("key", "old", ttl=1)
+        for _, entry in tiered._local.values():
+            entry.expires_at = time.time() - 1
+        refreshed = threading.Event()
+
+        def loader():
+            refreshed.set()
+            return "new"
+
+        assert tiered.get_or_load("key", loader, ttl=60) == "old"
+        assert refreshed.wait(2)
+        deadline = time.time() + 2
+        while tiered.get_or_load("key", loader, ttl=60) != "new" and time.time() < deadline:
+            time.sleep(0.01)
+        assert tiered.get_or_load("key", loader, ttl=60) == "new"
+
+    def test_async_refresh_task_kept_until_done(self):
+        tiered = self.build()
+        tiered.set("key", "old", ttl=1)
+        for _, entry in tiered._local.values():
+            entry.expires_at = time.time() - 1
+
+        async def loader():
+            await asyncio.sleep(0.05)
+            return "new"
+
+        async def run():
+            assert await tiered.aget_or_load("key", loader, ttl=60) == "old"
+            # 刷新进行中时缓存持有任务引用
+            running = set(tiered._refresh_tasks)
+            await asyncio.gather(*running)
+            return running
+
+        assert len(asyncio.run(run())) == 1
+        assert tiered._refresh_tasks == set()
+        assert "key" not in tiered._inflight
+        assert tiered.get_or_load("key", lambda: "reloaded", ttl=60) == "new"
+
+    def test_serves_local_copy_when_redis_down(self):
+        tiered = self.build(local_ttl=0)
+        tiered.set("key", "value", ttl=60)
+        tiered.redis.down = True
+
+        for _ in range(3):
+            assert tiered.get_or_load("key", lambda: "reloaded", ttl=60) == "value"
+        assert tiered.breaker.state == CircuitBreaker.OPEN
+
+    def test_redis_shared_between_instances(self):
+        redis_cache = FakeRedisCache()
+        first = TieredCache(redis_cache=redis_cache, beta=0)
+        second = TieredCache(redis_cache=redis_cache, beta=0)
+        first.set("key", [1, 2, 3], ttl=60)
+
+        assert second.get_or_load("key", lambda: None, ttl=60) == [1, 2, 3]
+        assert second.stats()["redis_hit"] == 1
+
+    def test_cached_decorator_async(self):
+        tiered = self.build()
+        calls = []
+
+        @cached(lambda city: f"avg_{city}", ttl=60, cache=tiered)
+        async def average_price(city):
+            calls.append(city)
+            await asyncio.sleep(0.05)
+            return 13038
+
+        async def run():
+            return await asyncio.gather(*[average_price("长沙") for _ in range(5)])
+
+        assert asyncio.run(run()) == [13038] * 5
+        assert calls == ["长沙"]
@@ -0,0 +1,264 @@
+import asyncio
+import time
+
+from urllib.parse import quote
+
+import httpx
+import pytest
+
+from app.services.async_collector import (
+    AsyncMarketDataCollector,
+    HostThrottle,
+    SimulatedMarketTransport,
+    simulated_community_data
+)
+from app.services import data_collector
+from app.services.data_collector import RealEstateDataCollector, collect_real_estate_data
+from app.services.incremental_collector import CheckpointStore, IncrementalCollector, SnapshotStore
+
+
+def build_collector(transport, **kwargs):
+    options = {"base_url": "http://market.test", "rate_per_host": 0, "backoff_base": 0.01}
+    options.update(kwargs)
+    return AsyncMarketDataCollector(transport=transport, **options)
+
+
+def fetch(collector, path):
+    async def run():
+        async with collector.client() as client:
+            return await collector.fetch_json(client, path)
+    return asyncio.run(run())
+
+
+@pytest.mark.unit
+@pytest.mark.data
+class TestAsyncMarketDataCollector:
+
+    def test_collects_cities_in_parallel(self):
+        transport = SimulatedMarketTransport(latency=0.05)
+        collector = build_collector(transport, max_per_host=40)
+
+        started = time.perf_counter()
+        results = collector.run(["北京", "长沙"])
+        elapsed = time.perf_counter() - started
+
+        assert len(results["北京"]) == 40
+        assert results["长沙"][0] == simulated_community_data("长沙", "天河区", "天河区小区1")
+        # 80个请求、每个50ms，串行需要4秒
+        assert elapsed < 1.5
+
+    def test_conditional_requests_reuse_unchanged_data(self):
+        transport = SimulatedMarketTransport(latency=0)
+        collector = build_collector(transport)
+
+        first = collector.run(["北京"])
+        second = collector.run(["北京"])
+
+        assert first == second
+        assert collector.stats["not_modified"] == 40
+
+    def test_retries_with_backoff(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) < 3:
+                return httpx.Response(503, headers={"Retry-After": "0"})
+            return httpx.Response(200, json={"ok": True})
+
+        collector = build_collector(httpx.MockTransport(handler))
+        assert fetch(collector, "/cities/x") == {"ok": True}
+        assert collector.stats["retries"] == 2
+
+    def test_gives_up_after_max_retries(self):
+        collector = build_collector(httpx.MockTransport(lambda request: httpx.Response(500)), max_retries=1)
+        with pytest.raises(httpx.HTTPStatusError):
+            fetch(collector, "/cities/x")
+        assert collector.stats["requests"] == 2
+
+    def test_failed_city_does_not_affect_others(self):
+        def handler(request):
+            if "%E5%8C%97%E4%BA%AC" in str(request.url):  # 北京
+                return httpx.Response(404)
+            return httpx.Response(200, json={"ok": True})
+
+        results = build_collector(httpx.MockTransport(handler)).run(["北京", "长沙"])
+        assert isinstance(results["北京"], httpx.HTTPStatusError)
+        assert len(results["长沙"]) == 40
+
+    def test_host_throttle_spaces_requests(self):
+        async def run():
+            throttle = HostThrottle(max_concurrency=10, rate=50)
+            started = asyncio.get_running_loop().time()
+
+            async def request():
+                async with throttle:
+                    return asyncio.get_running_loop().time() - started
+
+            return await asyncio.gather(*(request() for _ in range(6)))
+
+        times = asyncio.run(run())
+        assert max(times) >= 0.1
+
+
+@pytest.mark.unit
+@pytest.mark.data
+class TestIncrementalCollector:
+
+    def build(self, tmp_path, transport):
+        return IncrementalCollector(
+            fetcher=build_collector(transport),
+            checkpoints=CheckpointStore(str(tmp_path)),
+            snapshots=SnapshotStore(str(tmp_path))
+        )
+
+    def test_second_run_fetches_only_changes(self, tmp_path):
+        transport = SimulatedMarketTransport(latency=0)
+        first = self.build(tmp_path, transport).run(["北京"])
+        assert len(first["北京"].changed) == 40
+
+        transport.touch("北京", "海淀区", "海淀区小区3")
+        transport.requests = 0
+        # 新实例模拟进程重启，状态只来自检查点
+        second = self.build(tmp_path, transport).run(["北京"])
+
+        assert [record["community_name"] for record in second["北京"].changed] == ["海淀区小区3"]
+        # 变更feed + 一个小区
+        assert transport.requests == 2
+
+    def test_unchanged_full_resync_writes_nothing(self, tmp_path):
+        transport = SimulatedMarketTransport(latency=0)
+        self.build(tmp_path, transport).run(["长沙"])
+
+        collector = self.build(tmp_path, transport)
+        result = collector.run(["长沙"], full=True)
+
+        assert result["长沙"].checked == 40
+        assert result["长沙"].changed == []
+        assert collector.fetcher.stats["not_modified"] == 40
+        assert len(collector.snapshots.files(collector.source, "长沙")) == 1
+
+    def test_replay_returns_latest_records(self, tmp_path):
+        transport = SimulatedMarketTransport(latency=0)
+        collector = self.build(tmp_path, transport)
+        collector.run(["长沙"])
+        transport.touch("长沙", "天河区", "天河区小区1")
+        collector.run(["长沙"])
+
+        records = {record["community_name"]: record for record in collector.replay("长沙")}
+        assert len(records) == 40
+        assert records["天河区小区1"] == simulated_community_data("长沙", "天河区", "天河区小区1", version=1)
+
+    def test_restored_validators_do_not_leak_into_full_collection(self, tmp_path):
+        transport = SimulatedMarketTransport(latency=0)
+        self.build(tmp_path, transport).run(["长沙"])
+
+        # 新进程：区域任务从检查点恢复校验信息（没有数据）到共用的采集器
+        collector = self.build(tmp_path, transport)
+        assert collector.fetch_district("长沙", "天河区", ["天河区小区1"])["changed"] == []
+
+        records = collector.fetcher.run(["长沙"])["长沙"]
+
+        assert len(records) == 40
+        assert records[0] == simulated_community_data("长沙", "天河区", "天河区小区1")
+
+    def test_failed_city_keeps_checkpoint(self, tmp_path):
+        collector = self.build(tmp_path, httpx.MockTransport(lambda request: httpx.Response(404)))
+        result = collector.run(["北京"])
+
+        assert isinstance(result["北京"], httpx.HTTPStatusError)
+        assert collector.checkpoints.load(collector.source) == {"cities": {}}
+
+
+class DictTieredCache:
+
+    def __init__(self):
+        self.store = {}
+
+    def get_or_load(self, key, loader, ttl=None):
+        return self.store[key] if key in self.store else loader()
+
+    def set(self, key, value, ttl=None):
+        self.store[key] = value
+
+    def set_many(self, entries, ttl=None):
+        self.store.update(entries)
+        return True
+
+
+class FailingDistrictTransport(SimulatedMarketTransport):
+
+    def __init__(self, district):
+        super().__init__(latency=0)
+        self.district = quote(district)
+
+    async def handle_async_request(self, request):
+        if f"/districts/{self.district}/" in request.url.raw_path.decode():
+            self.requests += 1
+            return httpx.Response(500)
+        return await super().handle_async_request(request)
+
+
+class MalformedDistrictTransport(FailingDistrictTransport):
+
+    async def handle_async_request(self, request):
+        if f"/districts/{self.district}/" in request.url.raw_path.decode():
+            return httpx.Response(200, content=b"<html>maintenance</html>")
+        return await SimulatedMarketTransport.handle_async_request(self, request)
+
+
+@pytest.mark.unit
+@pytest.mark.data
+class TestCollectionTaskGraph:
+
+    @pytest.fixture
+    def run_tasks(self, tmp_path, monkeypatch):
+        from app.core.celery import celery_app
+
+        monkeypatch.setitem(celery_app.conf, "task_always_eager", True)
+        tiered = DictTieredCache()
+        results = {}
+        monkeypatch.setattr(data_collector, "tiered_cache", tiered)
+        monkeypatch.setattr(data_collector.cache, "set", lambda key, value, expire=None: results.update({key: value}))
+
+        def run(transport):
+            fetcher = build_collector(transport, max_retries=0)
+            collector = RealEstateDataCollector(fetcher)
+            collector.incremental = IncrementalCollector(
+                fetcher, CheckpointStore(str(tmp_path)), SnapshotStore(str(tmp_path))
+            )
+            monkeypatch.setattr(data_collector, "collector", collector)
+            collect_real_estate_data.delay()
+            return {item["city"]: item for item in results["data_collection_results"]}, tiered.store
+
+        return run
+
+    def test_fans_out_per_district_and_refreshes_changed_cities(self, run_tasks):
+        transport = SimulatedMarketTransport(latency=0)
+        run_tasks(transport)
+        transport.touch("长沙", "海珠区", "海珠区小区5")
+
+        summary, store = run_tasks(transport)
+
+        assert summary["长沙"]["changed"] == 1
+        assert [task["district"] for task in summary["长沙"]["tasks"]] == ["海珠区"]
+        assert summary["北京"]["success"] and summary["北京"]["tasks"] == []
+        assert "stats_elapsed" in summary["长沙"]
+        assert store["market_stats_长沙"]["community_count"] == 40
+
+    def test_failed_district_only_fails_its_city(self, run_tasks):
+        summary, store = run_tasks(FailingDistrictTransport("朝阳区"))
+
+        assert not summary["北京"]["success"]
+        assert "朝阳区" in summary["北京"]["error"]
+        assert summary["长沙"]["success"] and summary["长沙"]["changed"] == 40
+        assert len(summary["长沙"]["tasks"]) == 4
+        assert "city_data_北京" not in store
+
+    def test_non_http_failure_still_reaches_summary(self, run_tasks):
+        summary, store = run_tasks(MalformedDistrictTransport("海淀区"))
+
+        assert not summary["北京"]["success"]
+        assert "JSONDecodeError" in summary["北京"]["error"]
+        assert summary["长沙"]["success"] and "city_data_长沙" in store
+        assert "city_data_北京" not in store
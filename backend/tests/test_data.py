@@ -123,3 +123,68 @@ class TestDataAPI:
         assert "city" in data
         assert "district" in data
         assert data["district"] == "朝阳区"
+
+    def test_get_area_statistics_type_distribution(self, client: TestClient, test_property, test_valuation):
+        response = client.get("/api/v1/data/area-statistics?city=北京&district=朝阳区")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_properties"] == 1
+        assert data["total_valuations"] == 1
+        assert data["property_type_distribution"] == {"residential": 1}
+        assert data["price_range"]["min"] == data["price_range"]["max"] == data["avg_price"]
+
+    def test_export_data_stream_ndjson(self, client: TestClient, test_property):
+        response = client.post(
+            "/api/v1/data/export",
+            json={
+                "data_type": "properties",
+                "format": "ndjson",
+                "stream": True
+            }
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [line for line in response.text.splitlines() if line]
+        assert len(lines) == 1
+        assert '"address": "测试地址123号"' in lines[0]
+    
+    def test_export_data_to_file(self, client: TestClient, test_property):
+        response = client.post(
+            "/api/v1/data/export",
+            json={
+                "data_type": "properties",
+                "format": "csv",
+                "compress": True
+            }
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["file_name"].endswith(".csv.gz")
+        assert data["row_count"] == 1
+        assert data["file_size"] > 0
+        assert "rows_per_second" in data
+    
+    def test_export_data_invalid_format(self, client: TestClient):
+        response = client.post(
+            "/api/v1/data/export",
+            json={
+                "data_type": "properties",
+                "format": "xml"
+            }
+        )
+        assert response.status_code == 400
+    
+    def test_export_parquet_without_pyarrow(self, client: TestClient, monkeypatch):
+        from app.services import export
+        
+        monkeypatch.setattr(export, "parquet_available", lambda: False)
+        response = client.post(
+            "/api/v1/data/export",
+            json={
+                "data_type": "properties",
+                "format": "parquet",
+                "stream": True
+            }
+        )
+        assert response.status_code == 400
+        assert "pyarrow" in response.json()["detail"]
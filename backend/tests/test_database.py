@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.database.pool_monitor import MonitoredQueuePool, PoolMonitor
+from app.services.health import check_database, check_redis
+
+
+def build_engine(tmp_path, **kwargs):
+    return create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=MonitoredQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+        **kwargs
+    )
+
+
+@pytest.mark.unit
+class TestPoolMonitor:
+
+    def test_records_checkout_wait_and_timeouts(self, tmp_path):
+        engine = build_engine(tmp_path)
+        monitor = PoolMonitor("test", adaptive=False).attach(engine)
+
+        conn = engine.connect()
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+        snapshot = monitor.snapshot()
+        assert snapshot["checkouts"] == 2
+        assert snapshot["timeouts"] == 1
+        assert snapshot["checked_out"] == 1
+        assert snapshot["open_connections"] == 1
+        assert snapshot["max_wait_ms"] >= 100
+        conn.close()
+
+    def test_captures_slow_queries(self, tmp_path):
+        engine = build_engine(tmp_path)
+        monitor = PoolMonitor("test", slow_query_ms=0, adaptive=False).attach(engine)
+
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+        snapshot = monitor.snapshot()
+        assert snapshot["slow_queries"] == 1
+        assert snapshot["recent_slow_queries"][0]["statement"] == "SELECT 1"
+        assert 'valuhub_db_slow_queries_total{pool="test"} 1' in monitor.metrics_lines()
+
+    def test_adaptive_mode_raises_and_restores_overflow(self, tmp_path):
+        engine = build_engine(tmp_path)
+        monitor = PoolMonitor(
+            "test", adaptive=True, target_wait_ms=10, max_overflow_ceiling=2, adapt_interval=0
+        ).attach(engine)
+
+        conn = engine.connect()
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        assert engine.pool._max_overflow == 1
+
+        # 溢出上限提高后不再等待，下一次评估恢复到配置值
+        engine.connect().close()
+        snapshot = monitor.snapshot()
+        assert snapshot["max_overflow"] == 0
+        assert snapshot["timeouts"] == 1
+        conn.close()
+
+    def test_monitor_survives_dispose(self, tmp_path):
+        engine = build_engine(tmp_path)
+        monitor = PoolMonitor("test", adaptive=False).attach(engine)
+        engine.dispose()
+
+        with engine.connect():
+            pass
+        assert monitor.pool is engine.pool
+        assert monitor.snapshot()["checkouts"] == 1
+
+
+@pytest.mark.unit
+class TestHealthChecks:
+
+    def test_check_database_reports_latency(self, tmp_path):
+        result = asyncio.run(check_database(build_engine(tmp_path)))
+        assert result["status"] == "up"
+        assert result["latency_ms"] >= 0
+        assert "sync" in result["pools"]
+
+    def test_check_redis_timeout(self):
+        class SlowRedis:
+            def ping(self):
+                time.sleep(0.5)
+
+        result = asyncio.run(check_redis(SlowRedis(), timeout=0.05))
+        assert result["status"] == "down"
+        assert "超时" in result["error"]
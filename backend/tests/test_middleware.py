@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.metrics import MetricsRegistry, TimedJSONResponse
+from app.middleware import logging_middleware
+from app.middleware.logging_middleware import LoggingMiddleware
+from app.middleware.rate_limit import RateLimitMiddleware, RateLimitRule
+
+
+def build_app(rules, api_key_verifier=None):
+    test_app = FastAPI()
+
+    @test_app.get("/api/v1/valuations")
+    async def valuations():
+        return {"ok": True}
+
+    @test_app.get("/api/v1/slow")
+    async def slow():
+        await asyncio.sleep(0.2)
+        return {"ok": True}
+
+    @test_app.get("/api/v1/properties")
+    async def properties():
+        return {"ok": True}
+
+    test_app.add_middleware(RateLimitMiddleware, rules=rules, enabled=True, api_key_verifier=api_key_verifier)
+    return test_app
+
+
+@pytest.mark.unit
+class TestRateLimitMiddleware:
+    
+    def test_token_bucket_returns_retry_after(self):
+        rules = [RateLimitRule("valuation", ["/api/v1/valuations"], rate=0.5, burst=2)]
+        client = TestClient(build_app(rules))
+        
+        assert client.get("/api/v1/valuations").status_code == 200
+        assert client.get("/api/v1/valuations").status_code == 200
+        response = client.get("/api/v1/valuations")
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert response.headers["X-RateLimit-Group"] == "valuation"
+    
+    def test_buckets_are_per_api_key(self):
+        rules = [RateLimitRule("valuation", ["/api/v1/valuations"], rate=0.5, burst=1)]
+        keys = {"key-a": "1", "key-b": "2"}
+        client = TestClient(build_app(rules, api_key_verifier=keys.get))
+        
+        assert client.get("/api/v1/valuations", headers={"X-API-Key": "key-a"}).status_code == 200
+        assert client.get("/api/v1/valuations", headers={"X-API-Key": "key-a"}).status_code == 429
+        assert client.get("/api/v1/valuations", headers={"X-API-Key": "key-b"}).status_code == 200
+    
+    def test_unverified_credentials_share_ip_bucket(self):
+        rules = [RateLimitRule("valuation", ["/api/v1/valuations"], rate=0.5, burst=1)]
+        client = TestClient(build_app(rules, api_key_verifier={"key-a": "1"}.get))
+        
+        assert client.get("/api/v1/valuations", headers={"X-API-Key": "forged-1"}).status_code == 200
+        assert client.get("/api/v1/valuations", headers={"X-API-Key": "forged-2"}).status_code == 429
+        assert client.get("/api/v1/valuations", headers={"Authorization": "Bearer not-a-jwt"}).status_code == 429
+        assert client.get("/api/v1/valuations", headers={"X-API-Key": "key-a"}).status_code == 200
+    
+    def test_rule_rejects_non_positive_rate(self):
+        with pytest.raises(ValueError):
+            RateLimitRule("valuation", ["/api/v1/valuations"], rate=0, burst=1)
+    
+    def test_unmatched_routes_are_not_limited(self):
+        rules = [RateLimitRule("valuation", ["/api/v1/valuations"], rate=0.5, burst=1)]
+        client = TestClient(build_app(rules))
+        
+        for _ in range(5):
+            assert client.get("/api/v1/properties").status_code == 200
+    
+    def test_concurrency_quota(self):
+        rules = [RateLimitRule("slow", ["/api/v1/slow"], rate=100, burst=100, concurrency=1)]
+        test_app = build_app(rules)
+        
+        async def run():
+            import httpx
+            transport = httpx.ASGITransport(app=test_app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(*(client.get("/api/v1/slow") for _ in range(3)))
+        
+        statuses = sorted(r.status_code for r in asyncio.run(run()))
+        assert statuses == [200, 429, 429]
+
+
+@pytest.mark.unit
+class TestLoggingMiddleware:
+    
+    def test_records_route_histogram_and_phases(self, monkeypatch):
+        registry = MetricsRegistry()
+        monkeypatch.setattr(logging_middleware, "metrics", registry)
+        
+        test_app = FastAPI(default_response_class=TimedJSONResponse)
+        
+        @test_app.get("/items/{item_id}")
+        async def get_item(item_id: int):
+            return {"id": item_id}
+        
+        test_app.add_middleware(LoggingMiddleware, sample_rate=0)
+        client = TestClient(test_app)
+        
+        for item_id in range(3):
+            response = client.get(f"/items/{item_id}")
+            assert response.status_code == 200
+            assert float(response.headers["X-Process-Time"]) >= 0
+        client.get("/missing")
+        
+        text = registry.render()
+        assert 'valuhub_http_request_duration_seconds_count{method="GET",route="/items/{item_id}"} 3' in text
+        assert 'valuhub_http_requests_total{method="GET",route="unmatched",status="404"} 1' in text
+        assert 'phase="serialization"' in text
+    
+    def test_metrics_endpoint(self, client: TestClient):
+        client.get("/health")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'route="/health"' in response.text
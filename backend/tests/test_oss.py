@@ -0,0 +1,124 @@
+import io
+import os
+import threading
+
+import pytest
+
+from app.services.oss import LocalBucket, OssService
+
+
+class FlakyBucket(LocalBucket):
+    """第 fail_at 个分片第一次上传时失败，记录上传过的分片"""
+
+    def __init__(self, root, fail_at=None):
+        super().__init__(root)
+        self.fail_at = fail_at
+        self.parts = []
+        self.puts = 0
+        self._lock = threading.Lock()
+
+    def put_object(self, key, data):
+        self.puts += 1
+        return super().put_object(key, data)
+
+    def upload_part(self, key, upload_id, part_number, data):
+        with self._lock:
+            if part_number == self.fail_at:
+                self.fail_at = None
+                raise ConnectionError("connection reset")
+            self.parts.append(part_number)
+        return super().upload_part(key, upload_id, part_number, data)
+
+
+class CountingStream(io.BytesIO):
+    """记录读取进度，用于检查是否边读边传"""
+
+    def __init__(self, data, bucket):
+        super().__init__(data)
+        self.bucket = bucket
+        self.read_ahead = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.read_ahead = max(self.read_ahead, self.tell() - len(self.bucket.parts) * 100)
+        return chunk
+
+
+def payload(size):
+    return bytes(i % 251 for i in range(size))
+
+
+@pytest.mark.unit
+class TestOssUploads:
+
+    @pytest.fixture
+    def bucket(self, tmp_path):
+        return FlakyBucket(str(tmp_path / "oss"))
+
+    @pytest.fixture
+    def service(self, bucket, tmp_path):
+        return OssService(
+            bucket=bucket, multipart_threshold=250, part_size=100, threads=2,
+            checkpoint_dir=str(tmp_path / "checkpoints")
+        )
+
+    def read_object(self, bucket, key):
+        with open(bucket._path(key), "rb") as f:
+            return f.read()
+
+    def test_small_file_uploaded_in_one_request(self, service, bucket):
+        result = service.upload_file(io.BytesIO(b"small"), "a.txt")
+
+        assert result["success"] and result["size"] == 5
+        assert bucket.puts == 1 and bucket.parts == []
+        assert self.read_object(bucket, result["filename"]) == b"small"
+
+    def test_large_stream_uploaded_in_parts(self, service, bucket):
+        data = payload(1050)
+        stream = CountingStream(data, bucket)
+
+        result = service.upload_file(stream, "attachment.pdf")
+
+        assert result["success"] and result["size"] == 1050
+        assert sorted(bucket.parts) == list(range(1, 12))
+        assert self.read_object(bucket, result["filename"]) == data
+        # 读取进度不超过已上传分片 + 在途分片 + 首次判断阈值读取的部分
+        assert stream.read_ahead <= 250 + 2 * 100
+        assert not os.listdir(os.path.join(bucket.root, "multipart"))
+
+    def test_failed_stream_upload_is_aborted(self, service, bucket):
+        bucket.fail_at = 3
+
+        result = service.upload_file(io.BytesIO(payload(600)), "attachment.pdf")
+
+        assert not result["success"]
+        assert not os.listdir(os.path.join(bucket.root, "multipart"))
+
+    def test_file_upload_resumes_from_checkpoint(self, service, bucket, tmp_path):
+        path = tmp_path / "export.csv"
+        data = payload(1000)
+        path.write_bytes(data)
+        bucket.fail_at = 6
+
+        assert service.put_file("exports/export.csv", str(path)) is False
+        uploaded_before = set(bucket.parts)
+        assert service.put_file("exports/export.csv", str(path)) is True
+
+        resumed = bucket.parts[len(uploaded_before):]
+        assert set(resumed).isdisjoint(uploaded_before)
+        assert sorted(uploaded_before | set(resumed)) == list(range(1, 11))
+        assert self.read_object(bucket, "exports/export.csv") == data
+        assert os.listdir(tmp_path / "checkpoints") == []
+
+    def test_batch_upload_keeps_order(self, service, bucket):
+        files = [(io.BytesIO(payload(size)), f"file_{size}.bin") for size in (10, 400, 30)]
+
+        results = service.upload_files(files)
+
+        assert [r["original_filename"] for r in results] == ["file_10.bin", "file_400.bin", "file_30.bin"]
+        assert [r["size"] for r in results] == [10, 400, 30]
+        assert self.read_object(bucket, results[1]["filename"]) == payload(400)
+
+    def test_local_bucket_rejects_escaping_keys(self, bucket):
+        with pytest.raises(ValueError):
+            bucket.put_object("../outside", b"x")
@@ -0,0 +1,84 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.order_store import OrderConflict, OrderStore
+
+
+@pytest.mark.unit
+class TestOrderStore:
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return OrderStore(str(tmp_path / "orders.jsonl"))
+
+    def create(self, store, phone="13800000000", report_id="r1"):
+        return store.create(phone, "p1", report_id, 9.9, "wxpay")
+
+    def test_concurrent_creates_get_unique_ids(self, store):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            orders = list(executor.map(lambda i: self.create(store, report_id=f"r{i}"), range(50)))
+
+        order_ids = {order["order_id"] for order in orders}
+        assert len(order_ids) == 50
+        assert all(store.get(order_id)["status"] == "pending" for order_id in order_ids)
+
+    def test_user_orders_newest_first(self, store):
+        created = [self.create(store, report_id=f"r{i}") for i in range(5)]
+        self.create(store, phone="13900000000")
+
+        page = store.list_by_user("13800000000", limit=2, offset=1)
+
+        assert [o["order_id"] for o in page] == [created[3]["order_id"], created[2]["order_id"]]
+        assert store.list_by_user("13800000000", limit=10, offset=5) == []
+
+    def test_duplicate_callback_is_idempotent(self, store):
+        order = self.create(store)
+
+        paid, changed = store.transition(order["order_id"], "paid", "tx1", "2024-01-01T10:00:00")
+        again, changed_again = store.transition(order["order_id"], "paid", "tx1", "2024-01-01T10:00:00")
+        late_failure, changed_late = store.transition(order["order_id"], "failed", "tx0")
+
+        assert (changed, changed_again, changed_late) == (True, False, False)
+        assert again["status"] == late_failure["status"] == "paid"
+        assert [item["status"] for item in store.history(order["order_id"])] == ["pending", "paid"]
+        with pytest.raises(OrderConflict):
+            store.transition(order["order_id"], "paid", "tx2")
+        with pytest.raises(KeyError):
+            store.transition("order_missing", "paid", "tx1")
+
+    def test_status_changes_are_appended(self, store, tmp_path):
+        order = self.create(store)
+        store.transition(order["order_id"], "failed", "tx1")
+        store.transition(order["order_id"], "paid", "tx2")
+
+        with open(tmp_path / "orders.jsonl", encoding="utf-8") as f:
+            events = [json.loads(line) for line in f]
+
+        assert [e["type"] for e in events] == ["created", "status", "status"]
+        assert [e.get("status") for e in events[1:]] == ["failed", "paid"]
+
+    def test_other_process_sees_new_events(self, store, tmp_path):
+        other = OrderStore(str(tmp_path / "orders.jsonl"))
+        order = self.create(store)
+        assert other.get(order["order_id"])["status"] == "pending"
+
+        store.transition(order["order_id"], "paid", "tx1")
+
+        assert other.get(order["order_id"])["status"] == "paid"
+        _, changed = other.transition(order["order_id"], "paid", "tx1")
+        assert not changed
+
+    def test_imports_legacy_orders_file(self, tmp_path):
+        legacy = tmp_path / "orders.json"
+        legacy.write_text(json.dumps([{
+            "order_id": "order_1700000000_1", "user_phone": "13800000000", "project_id": "p1",
+            "report_id": "r1", "amount": 9.9, "status": "paid", "pay_type": "wxpay",
+            "created_at": "2023-11-15T00:00:00", "pay_time": "2023-11-15T00:01:00", "transaction_id": "tx1"
+        }]), encoding="utf-8")
+
+        store = OrderStore(str(tmp_path / "orders.jsonl"), legacy_path=str(legacy))
+
+        assert store.get("order_1700000000_1")["status"] == "paid"
+        assert [o["order_id"] for o in store.list_by_user("13800000000")] == ["order_1700000000_1"]
@@ -167,3 +167,74 @@ class TestPropertyAPI:
         data = response.json()
         assert "imported_count" in data
         assert data["imported_count"] == 3
+    
+    def test_batch_import_properties_bulk(self, client: TestClient, test_user):
+        properties_data = [
+            {
+                "address": f"批量导入房产{i}",
+                "city": "湘潭",
+                "district": "岳塘区",
+                "area": 80.0 + i,
+                "rooms": 3
+            }
+            for i in range(5)
+        ]
+        response = client.post(
+            f"/api/v1/properties/batch?current_user_id={test_user.id}",
+            json={"properties": properties_data}
+        )
+        assert response.status_code == 201
+        data = response.json()
+        assert data["count"] == 5
+        assert len(data["properties"]) == 5
+        assert "rows_per_second" in data
+    
+    def test_batch_import_properties_csv_upload(self, client: TestClient, test_user):
+        content = "address,city,district,area,rooms\n" + "".join(
+            f"文件导入房产{i},湘潭,雨湖区,{90 + i},2\n" for i in range(3)
+        )
+        response = client.post(
+            f"/api/v1/properties/batch/upload?current_user_id={test_user.id}",
+            files={"file": ("properties.csv", content.encode("utf-8"), "text/csv")}
+        )
+        assert response.status_code == 201
+        data = response.json()
+        assert data["count"] == 3
+        assert len(data["properties"]) == 3
+    
+    def test_batch_import_properties_csv_upload_invalid_row(self, client: TestClient, test_user):
+        content = "address,city,area\n有效地址,湘潭,88\n无效地址,湘潭,-1\n"
+        response = client.post(
+            f"/api/v1/properties/batch/upload?current_user_id={test_user.id}",
+            files={"file": ("properties.csv", content.encode("utf-8"), "text/csv")}
+        )
+        assert response.status_code == 422
+        detail = response.json()["detail"]
+        assert detail["error_count"] == 1
+        assert detail["errors"][0]["row"] == 3
+    
+    def test_search_properties_nearby_and_nearest(self, client: TestClient, test_user):
+        properties_data = [
+            {"address": "近处房产", "city": "湘潭", "area": 90.0, "latitude": 27.8300, "longitude": 112.9400},
+            {"address": "稍远房产", "city": "湘潭", "area": 95.0, "latitude": 27.8350, "longitude": 112.9400},
+            {"address": "远处房产", "city": "湘潭", "area": 100.0, "latitude": 27.9500, "longitude": 112.9400}
+        ]
+        response = client.post(
+            f"/api/v1/properties/batch?current_user_id={test_user.id}",
+            json={"properties": properties_data}
+        )
+        assert response.status_code == 201
+        
+        response = client.get(
+            "/api/v1/properties/nearby?latitude=27.83&longitude=112.94&radius_m=1000"
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert [item["address"] for item in data] == ["近处房产", "稍远房产"]
+        assert data[0]["distance_m"] <= data[1]["distance_m"]
+        
+        response = client.get("/api/v1/properties/nearest?latitude=27.95&longitude=112.94&k=1")
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 1
+        assert data[0]["address"] == "远处房产"
@@ -1,5 +1,24 @@
+import asyncio
+import io
+import os
+import zipfile
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
 import pytest
+from fastapi import FastAPI, Request
+from jinja2.exceptions import SecurityError
 from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.file_response import RangeNotSatisfiable, conditional_file_response, parse_range
+from app.models.report import Report, ReportTemplate
+from app.services import report as report_service
+from app.services import report_batch
+from app.services.report_store import ReportArtifactStore, content_key
+from app.services.report_templates import create_report_environment, get_report_template
+from app.services.storage import LocalStorage
 
 
 @pytest.mark.report
@@ -89,3 +108,418 @@ class TestReportAPI:
     def test_delete_report(self, client: TestClient, auth_headers):
         response = client.delete("/api/v1/reports/1", headers=auth_headers)
         assert response.status_code in [200, 404]
+
+
+@pytest.mark.report
+@pytest.mark.unit
+class TestReportRendering:
+
+    @pytest.fixture
+    def published(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "REPORT_STORAGE_DIR", str(tmp_path))
+        statuses = []
+        monkeypatch.setattr(report_service, "publish_report_status", lambda report_id, status: statuses.append(status))
+        return statuses
+
+    def create_report(self, db_session, valuation_id):
+        report = Report(valuation_id=valuation_id, user_id=1, status="pending")
+        db_session.add(report)
+        db_session.commit()
+        return report
+
+    def test_render_moves_report_to_completed(self, db_session, test_valuation, published):
+        report = self.create_report(db_session, test_valuation.id)
+
+        assert report_service.render_report(report.id, db=db_session) == "completed"
+
+        db_session.refresh(report)
+        assert published == ["generating", "completed"]
+        assert report.file_size > 0
+        assert report.file_url == f"/api/v1/reports/{report.id}/download"
+        assert len(report.content_hash) == 64
+        assert report.completed_at is not None
+
+    def test_identical_reports_share_one_file(self, db_session, test_valuation, published, monkeypatch):
+        builds = []
+
+        def write_pdf(base_path, html):
+            builds.append(base_path)
+            with open(base_path + ".pdf", "wb") as f:
+                f.write(b"%PDF-1.7")
+            return base_path + ".pdf"
+
+        monkeypatch.setattr(report_service, "write_report_files", write_pdf)
+        first = self.create_report(db_session, test_valuation.id)
+        second = self.create_report(db_session, test_valuation.id)
+
+        report_service.render_report(first.id, db=db_session)
+        report_service.render_report(second.id, db=db_session)
+
+        db_session.refresh(first)
+        db_session.refresh(second)
+        assert len(builds) == 1
+        assert first.content_hash == second.content_hash
+        assert second.status == "completed"
+
+    def test_render_failure_marks_report_failed(self, db_session, published):
+        report = self.create_report(db_session, 99999)
+
+        assert report_service.render_report(report.id, db=db_session) == "failed"
+
+        db_session.refresh(report)
+        assert report.status == "failed"
+        assert published == ["generating", "failed"]
+
+    def test_finished_report_is_not_rendered_again(self, db_session, test_valuation, published):
+        report = self.create_report(db_session, test_valuation.id)
+        report_service.render_report(report.id, db=db_session)
+
+        assert report_service.render_report(report.id, db=db_session) is None
+        assert published == ["generating", "completed"]
+
+    def test_status_events_follow_notifications(self):
+        statuses = iter([("pending", None), ("generating", None), ("completed", "/media/reports/report_1.pdf")])
+
+        class FakeResult:
+            def __init__(self, row):
+                self.row = row
+
+            def first(self):
+                return self.row
+
+        class FakeSession:
+            async def execute(self, statement):
+                return FakeResult(next(statuses))
+
+            async def rollback(self):
+                pass
+
+        class FakePubSub:
+            def __init__(self):
+                self.waits = 0
+
+            async def subscribe(self, channel):
+                self.channel = channel
+
+            async def get_message(self, ignore_subscribe_messages=True, timeout=None):
+                self.waits += 1
+                return {"type": "message", "data": b"generating"}
+
+            async def unsubscribe(self, channel):
+                pass
+
+            async def aclose(self):
+                pass
+
+        pubsub = FakePubSub()
+
+        class FakeRedis:
+            def pubsub(self):
+                return pubsub
+
+        async def collect():
+            return [event async for event in report_service.report_status_events(1, FakeSession(), FakeRedis(), poll_interval=30)]
+
+        events = asyncio.run(collect())
+
+        assert len(events) == 3
+        assert '"status": "completed"' in events[-1]
+        assert pubsub.channel == "report_status:1"
+        assert pubsub.waits == 2
+
+
+@pytest.mark.report
+@pytest.mark.unit
+class TestReportTemplates:
+
+    @pytest.fixture
+    def environment(self, db_session, tmp_path):
+        environment = create_report_environment(
+            session_factory=sessionmaker(bind=db_session.get_bind()),
+            bytecode_dir=str(tmp_path)
+        )
+        loads = []
+        load = environment.loader._load
+        environment.loader._load = lambda template_id: loads.append(template_id) or load(template_id)
+        environment.loads = loads
+        return environment
+
+    def create_template(self, db_session, html):
+        template = ReportTemplate(name="企业版", template_type="enterprise", template_content={"html": html})
+        db_session.add(template)
+        db_session.commit()
+        return template
+
+    def test_db_template_extends_builtin(self, db_session, environment):
+        template = self.create_template(
+            db_session,
+            '{% extends "valuation_report.html" %}{% block content %}<p>企业客户 {{ community }}</p>{% endblock %}'
+        )
+
+        html = get_report_template(template, environment).render(community="湘江小区")
+
+        assert "<p>企业客户 湘江小区</p>" in html
+        assert "<svg" in html and "估价说明" in html
+        assert "房产基本信息" not in html
+
+    def test_compiled_template_cached_by_version(self, db_session, environment):
+        template = self.create_template(db_session, "v1 {{ city }}")
+
+        assert get_report_template(template, environment).render(city="长沙") == "v1 长沙"
+        assert get_report_template(template, environment).render(city="长沙") == "v1 长沙"
+        assert environment.loads == [template.id]
+
+        template.template_content = {"html": "v2 {{ city }}"}
+        template.updated_at = template.updated_at + timedelta(seconds=1)
+        db_session.commit()
+
+        assert get_report_template(template, environment).render(city="长沙") == "v2 长沙"
+        assert environment.loads == [template.id, template.id]
+
+    def test_static_fragments_rendered_once(self, environment, tmp_path):
+        fragments = environment.globals["fragments"]
+
+        html = get_report_template(environment=environment).render(confidence=0.9, factors=[], similar_cases=[])
+
+        assert fragments["logo"].startswith("<svg")
+        assert fragments["styles"] in html
+        # 编译后的字节码写入磁盘缓存
+        assert os.listdir(tmp_path)
+
+    def test_db_template_cannot_reach_python_internals(self, db_session, environment):
+        for html in (
+            "{{ cycler.__init__.__globals__.os.popen('id').read() }}",
+            "{{ ''.__class__.__mro__[1].__subclasses__() }}",
+        ):
+            template = self.create_template(db_session, html)
+
+            with pytest.raises(SecurityError):
+                get_report_template(template, environment).render()
+
+    def test_db_template_output_escaped(self, db_session, environment):
+        template = self.create_template(db_session, "<p>{{ community }}</p>")
+
+        html = get_report_template(template, environment).render(community="<script>alert(1)</script>")
+
+        assert html == "<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>"
+
+    def test_template_without_html_uses_builtin(self, db_session, environment):
+        template = ReportTemplate(name="标准版", template_content={"color": "blue"}, updated_at=datetime.utcnow())
+
+        assert get_report_template(template, environment).name == "valuation_report.html"
+        assert environment.loads == []
+
+
+class ImmediateExecutor:
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+@pytest.mark.report
+@pytest.mark.unit
+class TestBatchReports:
+
+    @pytest.fixture(autouse=True)
+    def html_only(self, monkeypatch):
+        monkeypatch.setattr(report_batch, "_pdf_context", False)
+
+    def test_loads_valuations_in_request_order(self, db_session, test_user, test_valuation):
+        test_valuation.user_id = test_user.id
+        db_session.commit()
+
+        rows = report_batch.load_valuations(db_session, [test_valuation.id], test_user.id)
+        assert rows[0][0].id == test_valuation.id
+        assert rows[0][1].id == test_valuation.property_id
+
+        with pytest.raises(LookupError) as excinfo:
+            report_batch.load_valuations(db_session, [99999, test_valuation.id], test_user.id)
+        assert excinfo.value.args[0] == [99999]
+
+    def test_render_documents_keeps_window_bounded(self, monkeypatch):
+        monkeypatch.setattr(report_batch, "render_batch_document", lambda job: (job[0], b"x"))
+        executor = ImmediateExecutor()
+        in_flight = []
+
+        jobs = [(f"report_{i}", "valuation_report.html", {}) for i in range(10)]
+        names = []
+        for name, _ in report_batch.render_documents(jobs, executor, window=3):
+            names.append(name)
+            in_flight.append(executor.submitted - len(names))
+
+        assert names == [f"report_{i}" for i in range(10)]
+        assert max(in_flight) <= 2
+
+    def test_streams_zip_one_document_at_a_time(self, db_session, test_user, test_valuation):
+        test_valuation.user_id = test_user.id
+        db_session.commit()
+        rows = report_batch.load_valuations(db_session, [test_valuation.id], test_user.id)
+        jobs = report_batch.build_batch_jobs(rows * 3)
+
+        chunks = list(report_batch.stream_zip(report_batch.render_documents(jobs)))
+
+        assert len(chunks) == 4
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+            names = archive.namelist()
+            html = archive.read(names[0]).decode("utf-8")
+        assert names == [f"估价报告_{test_valuation.id}.html"] * 3
+        assert f"VH-V{test_valuation.id:08d}" in html
+
+
+
+class CountingStorage(LocalStorage):
+    """记录下载次数的远程存储（以本地目录代替OSS）"""
+
+    remote = True
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.downloads = 0
+
+    def download_to(self, key, local_path):
+        found = super().download_to(key, local_path)
+        self.downloads += found
+        return found
+
+
+@pytest.mark.report
+@pytest.mark.unit
+class TestReportArtifactStore:
+
+    @staticmethod
+    def build(content, extension=".html"):
+        def write(base_path):
+            with open(base_path + extension, "w", encoding="utf-8") as f:
+                f.write(content)
+            return base_path + extension
+        return write
+
+    def test_content_key_ignores_generate_time(self):
+        context = {"project_id": "VH-V00000001", "total_price": 1_000_000}
+
+        key = content_key("valuation_report.html#abc", dict(context, generate_time="2024-01-01 00:00:00"))
+
+        assert key == content_key("valuation_report.html#abc", dict(context, generate_time="2024-06-01 12:00:00"))
+        assert key != content_key("db/1@1#abc", context)
+        assert key != content_key("valuation_report.html#abc", dict(context, total_price=1_000_001))
+
+    def test_second_request_reuses_file(self, tmp_path):
+        store = ReportArtifactStore(root=str(tmp_path), remote=False)
+        key = "ab" * 32
+
+        path, created = store.get_or_create(key, self.build("%PDF-1", ".pdf"))
+        again, created_again = store.get_or_create(key, lambda base_path: pytest.fail("不应重新渲染"))
+
+        assert (created, created_again) == (True, False)
+        assert again == path == str(tmp_path / "ab" / "ab" / f"{key}.pdf")
+        assert sorted(os.listdir(tmp_path / "ab" / "ab")) == [f"{key}.pdf"]
+
+    def test_html_fallback_is_rebuilt_as_pdf(self, tmp_path):
+        store = ReportArtifactStore(root=str(tmp_path), remote=False)
+        key = "ef" * 32
+
+        fallback, _ = store.get_or_create(key, self.build("<p>1</p>"))
+        retried, created = store.get_or_create(key, self.build("<p>1</p>"))
+        pdf, pdf_created = store.get_or_create(key, self.build("%PDF-1", ".pdf"))
+        again, _ = store.get_or_create(key, lambda base_path: pytest.fail("不应重新渲染"))
+
+        assert fallback.endswith(".html") and created
+        assert pdf_created and pdf == again == store.path_for(key, ".pdf")
+        # 已生成的HTML报告仍可下载
+        assert store.find(key, ".html") == retried
+
+    def test_failed_build_leaves_no_partial_file(self, tmp_path):
+        store = ReportArtifactStore(root=str(tmp_path), remote=False)
+        key = "cd" * 32
+
+        def broken(base_path):
+            self.build("<p>")(base_path)
+            raise RuntimeError("render failed")
+
+        with pytest.raises(RuntimeError):
+            store.get_or_create(key, broken)
+
+        assert os.listdir(tmp_path / "cd" / "cd") == []
+        assert store.find(key) is None
+
+    def test_offloaded_file_evicted_and_restored(self, tmp_path):
+        remote = CountingStorage(str(tmp_path / "remote"))
+        store = ReportArtifactStore(root=str(tmp_path / "cache"), remote=remote, cache_max_bytes=25)
+        first, second = "01" * 32, "02" * 32
+
+        store.get_or_create(first, self.build("<p>first report</p>"))
+        os.utime(store.path_for(first, ".html"), (0, 0))
+        store.get_or_create(second, self.build("<p>second report</p>"))
+
+        assert not os.path.exists(store.path_for(first, ".html"))
+        restored = store.find(first)
+        assert remote.downloads == 1
+        with open(restored, encoding="utf-8") as f:
+            assert f.read() == "<p>first report</p>"
+
+
+@pytest.mark.report
+@pytest.mark.unit
+class TestConditionalFileResponse:
+
+    @pytest.fixture
+    def file_client(self, tmp_path):
+        path = tmp_path / "report.pdf"
+        path.write_bytes(b"0123456789")
+        app = FastAPI()
+
+        @app.get("/file")
+        def get_file(request: Request):
+            return conditional_file_response(request, str(path), filename="估价报告.pdf", etag="abc123")
+
+        return TestClient(app)
+
+    def test_parse_range(self):
+        assert parse_range("bytes=2-5", 10) == (2, 5)
+        assert parse_range("bytes=7-", 10) == (7, 9)
+        assert parse_range("bytes=-3", 10) == (7, 9)
+        assert parse_range("bytes=5-100", 10) == (5, 9)
+        assert parse_range("bytes=0-1,4-5", 10) is None
+        assert parse_range("items=0-1", 10) is None
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range("bytes=10-", 10)
+
+    def test_full_response_has_validators(self, file_client):
+        response = file_client.get("/file")
+
+        assert response.status_code == 200
+        assert response.content == b"0123456789"
+        assert response.headers["etag"] == '"abc123"'
+        assert response.headers["accept-ranges"] == "bytes"
+        assert "utf-8''" in response.headers["content-disposition"]
+
+    def test_matching_etag_returns_304(self, file_client):
+        response = file_client.get("/file", headers={"If-None-Match": '"abc123"'})
+
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_range_request(self, file_client):
+        response = file_client.get("/file", headers={"Range": "bytes=2-5"})
+
+        assert response.status_code == 206
+        assert response.content == b"2345"
+        assert response.headers["content-range"] == "bytes 2-5/10"
+
+    def test_stale_if_range_returns_full_file(self, file_client):
+        response = file_client.get("/file", headers={"Range": "bytes=2-5", "If-Range": '"old"'})
+
+        assert response.status_code == 200
+        assert response.content == b"0123456789"
+
+    def test_unsatisfiable_range(self, file_client):
+        response = file_client.get("/file", headers={"Range": "bytes=20-"})
+
+        assert response.status_code == 416
+        assert response.headers["content-range"] == "bytes */10"
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from sdk import python_sdk
+from sdk.python_sdk import AsyncValuHubClient, ValuHubClient, _retry_delay
+
+
+def handle(payload, calls):
+    """模拟估价接口：area为负数时持续返回503，带rate_limited的请求第一次返回429"""
+    calls.append(payload["area"])
+    if payload["area"] < 0:
+        return 503, {}, {"detail": "unavailable"}
+    if payload.get("rate_limited") and calls.count(payload["area"]) == 1:
+        return 429, {"Retry-After": "7"}, {"detail": "too many requests"}
+    return 200, {}, {"estimated_price": payload["area"] * 10000}
+
+
+class FakeAdapter(BaseAdapter):
+    """requests 传输层替身，记录并发数"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            status, headers, body = handle(json.loads(request.body), self.calls)
+            response = requests.Response()
+            response.status_code = status
+            response.headers.update(headers)
+            response._content = json.dumps(body).encode()
+            response.request = request
+            response.url = request.url
+            return response
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """记录重试等待时间，不实际等待"""
+    recorded = []
+
+    def record(*args, **kwargs):
+        recorded.append(_retry_delay(*args, **kwargs))
+        return 0
+
+    monkeypatch.setattr(python_sdk, "_retry_delay", record)
+    return recorded
+
+
+@pytest.mark.unit
+class TestValuHubClient:
+
+    @pytest.fixture
+    def adapter(self):
+        return FakeAdapter()
+
+    @pytest.fixture
+    def client(self, adapter):
+        client = ValuHubClient("key", base_url="http://testserver/api", pool_size=3, max_retries=2)
+        client.session.mount("http://", adapter)
+        return client
+
+    def test_retry_after_is_respected(self, client, adapter, delays):
+        result = client.valuate_property({"area": 100, "rate_limited": True})
+
+        assert result == {"estimated_price": 1000000}
+        assert adapter.calls == [100, 100]
+        assert delays == [7.0]
+
+    def test_valuate_many_bounded_and_complete(self, client, adapter, delays):
+        properties = ({"area": area} for area in range(1, 21))
+
+        results = dict(client.valuate_many(properties))
+
+        assert results == {i: {"estimated_price": (i + 1) * 10000} for i in range(20)}
+        assert adapter.max_active <= 3
+
+    def test_failures_returned_after_retries(self, client, adapter, delays):
+        results = dict(client.valuate_many([{"area": 50}, {"area": -1}], return_exceptions=True))
+
+        assert results[0] == {"estimated_price": 500000}
+        assert isinstance(results[1], requests.HTTPError)
+        assert adapter.calls.count(-1) == 3
+
+    def test_post_not_retried_by_default(self, client, adapter, delays):
+        with pytest.raises(requests.HTTPError):
+            client._make_request("POST", "/api-keys", data={"area": -1})
+
+        assert adapter.calls == [-1]
+
+
+@pytest.mark.unit
+class TestAsyncValuHubClient:
+
+    def run(self, valuate, delays=None):
+        calls = []
+        active = {"now": 0, "max": 0}
+
+        async def handler(request):
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+            await asyncio.sleep(0.01)
+            active["now"] -= 1
+            status, headers, body = handle(json.loads(request.content), calls)
+            return httpx.Response(status, headers=headers, json=body)
+
+        async def main():
+            async with AsyncValuHubClient(
+                "key", base_url="http://testserver/api", pool_size=4, max_retries=2,
+                transport=httpx.MockTransport(handler)
+            ) as client:
+                return await valuate(client)
+
+        return asyncio.run(main()), calls, active["max"]
+
+    def test_valuate_many_bounded_and_complete(self, delays):
+        async def valuate(client):
+            return [item async for item in client.valuate_many({"area": area} for area in range(1, 21))]
+
+        results, calls, max_active = self.run(valuate)
+
+        assert dict(results) == {i: {"estimated_price": (i + 1) * 10000} for i in range(20)}
+        assert len(calls) == 20
+        assert max_active <= 4
+
+    def test_retry_after_and_exceptions(self, delays):
+        async def valuate(client):
+            properties = [{"area": 10, "rate_limited": True}, {"area": -1}]
+            return dict([item async for item in client.valuate_many(properties, return_exceptions=True)])
+
+        results, calls, _ = self.run(valuate)
+
+        assert results[0] == {"estimated_price": 100000}
+        assert isinstance(results[1], httpx.HTTPStatusError)
+        assert calls.count(-1) == 3
+        assert 7.0 in delays
+
+    def test_error_raised_without_return_exceptions(self, delays):
+        async def valuate(client):
+            return [item async for item in client.valuate_many([{"area": -1}])]
+
+        with pytest.raises(httpx.HTTPStatusError):
+            self.run(valuate)
+
+    def test_retry_delay(self):
+        assert _retry_delay(0, "3") == 3.0
+        assert _retry_delay(0, "Wed, 21 Oct 2015 07:28:00 GMT") == 0
+        assert _retry_delay(0, "600", max_delay=60) == 60
+        assert 0.5 <= _retry_delay(0, backoff=0.5) <= 0.75
+        assert 2.0 <= _retry_delay(2, backoff=0.5) <= 3.0
@@ -0,0 +1,103 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1 import files
+from app.core.file_response import CachedStaticFiles
+from app.services.storage import LocalStorage
+
+
+@pytest.mark.unit
+class TestLocalStorage:
+
+    @pytest.fixture
+    def storage(self, tmp_path):
+        return LocalStorage(root=str(tmp_path / "storage"), signing_key="test-key")
+
+    def test_sharded_atomic_write_with_checksum(self, storage):
+        stored = storage.save_stream("exports/data.csv", io.BytesIO(b"a,b\n1,2\n"))
+
+        path = storage.path_for("exports/data.csv")
+        assert stored.size == 8
+        assert stored.checksum == hashlib.sha256(b"a,b\n1,2\n").hexdigest()
+        assert os.path.relpath(path, storage.root).count(os.sep) == 2
+        assert storage.stat("exports/data.csv") == stored
+        assert not [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".tmp")]
+
+    def test_save_file_moves_staging_file(self, storage, tmp_path):
+        staging = tmp_path / "staging.csv"
+        staging.write_bytes(b"x" * 100)
+
+        stored = storage.save_file("exports/staging.csv", str(staging), move=True)
+
+        assert not staging.exists()
+        assert stored.size == 100
+        assert storage.exists("exports/staging.csv")
+        assert storage.delete("exports/staging.csv")
+        assert not storage.exists("exports/staging.csv")
+
+    def test_signed_url_expires(self, storage):
+        expires_at = int(time.time()) + 60
+        signature = storage.sign("uploads/a.pdf", expires_at)
+
+        assert storage.verify("uploads/a.pdf", expires_at, signature)
+        assert not storage.verify("uploads/b.pdf", expires_at, signature)
+        assert not storage.verify("uploads/a.pdf", expires_at - 120, storage.sign("uploads/a.pdf", expires_at - 120))
+        # 下载文件名包含在签名中
+        assert storage.verify("uploads/a.pdf", expires_at, storage.sign("uploads/a.pdf", expires_at, "报告.pdf"), "报告.pdf")
+        assert not storage.verify("uploads/a.pdf", expires_at, signature, "other.pdf")
+
+    def test_upload_url_does_not_expire(self, storage, monkeypatch):
+        monkeypatch.setattr(files, "storage", storage)
+        result = storage.upload_file(io.BytesIO(b"avatar"), "avatar.png")
+        app = FastAPI()
+        app.include_router(files.router, prefix="/api/v1/files")
+        client = TestClient(app)
+
+        later = time.time() + 10 * 365 * 86400
+        monkeypatch.setattr(time, "time", lambda: later)
+        response = client.get(result["url"])
+
+        assert "expires=0" in result["url"]
+        assert response.status_code == 200 and response.content == b"avatar"
+        assert client.get(result["url"] + "&name=evil.exe").status_code == 403
+
+    def test_download_route_serves_signed_url(self, storage, monkeypatch):
+        monkeypatch.setattr(files, "storage", storage)
+        stored = storage.save_stream("exports/报表.csv", io.BytesIO(b"0123456789"))
+        app = FastAPI()
+        app.include_router(files.router, prefix="/api/v1/files")
+        client = TestClient(app)
+
+        url = storage.url("exports/报表.csv", expires=60)
+        response = client.get(url)
+        partial = client.get(url, headers={"Range": "bytes=0-3"})
+        cached = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+        tampered = client.get(url.replace("expires=", "expires=1"))
+        renamed = client.get(storage.url("exports/报表.csv", expires=60, filename="a.csv").replace("name=a.csv", "name=b.exe"))
+
+        assert response.status_code == 200
+        assert response.content == b"0123456789"
+        assert response.headers["etag"] == f'"{stored.checksum}"'
+        assert response.headers["cache-control"].startswith("private, max-age=")
+        assert (partial.status_code, partial.content) == (206, b"0123")
+        assert cached.status_code == 304
+        assert tampered.status_code == 403
+        assert renamed.status_code == 403
+
+    def test_static_files_have_cache_control(self, tmp_path):
+        (tmp_path / "logo.svg").write_text("<svg/>")
+        app = FastAPI()
+        app.mount("/media", CachedStaticFiles(directory=str(tmp_path), cache_control="public, max-age=60"))
+        client = TestClient(app)
+
+        response = client.get("/media/logo.svg")
+        revalidated = client.get("/media/logo.svg", headers={"If-None-Match": response.headers["etag"]})
+
+        assert response.headers["cache-control"] == "public, max-age=60"
+        assert revalidated.status_code == 304